@@ -1,38 +1,271 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
-from fastapi.responses import JSONResponse
-import os
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, Query, Header
+from fastapi.responses import JSONResponse, Response
+import time
+import base64
+import asyncio
+from typing import Literal, Optional
 
-from ...models.schemas import AnalysisRequest, AnalysisResponse, ErrorResponse
-from ...services.analysis import AnalysisService
-from ...config.settings import UPLOAD_DIR
+from ...models.schemas import (
+    AnalysisRequest, AnalysisResponse, ErrorResponse, JobStatus, BatchRequest, BatchStatus, MessagePage, FigureSpec,
+    ChartResponse,
+)
+from ...services.scheduler import SchedulerOverloadedError, request_scheduler
+from ...services.jobs import JobQueueFullError, SUCCEEDED, job_manager
+from ...services.chart_cache import CHART_MEDIA_TYPES, chart_cache, parse_chart_id
+from ...services.uploads import UploadTooLargeError, save_upload, delete_upload
+from ...services.warmup import import_service
+from ...core.tracing import traced
+from ...core.sessions import sandbox_sessions
+from ...config.settings import MAX_BATCH_ITEMS, CHART_CACHE_MAX_AGE
 
+# The analysis, chart and data services pull in pandas, matplotlib, seaborn and the agent stack: routes import them on
+# first use with `import_service`, so that the app starts without loading them
 router = APIRouter()
 
-@router.post("/analyze", response_model=AnalysisResponse, responses={400: {"model": ErrorResponse}})
+@router.post(
+    "/analyze",
+    response_model=AnalysisResponse,
+    responses={400: {"model": ErrorResponse}, 429: {"model": ErrorResponse}},
+)
+@traced("analyze_data")
 async def analyze_data(request: AnalysisRequest):
     """Analyze data based on the provided query"""
+    analysis = await import_service("analysis")
     try:
-        service = AnalysisService()
+        service = analysis.get_analysis_service()
         result = await service.process_analysis_request(
             query=request.query,
             file_path=request.file_path,
             code=request.code,
-            thread_id=request.thread_id
+            thread_id=request.thread_id,
+            sampling=request.sampling,
+            sample_rows=request.sample_rows,
+            stratify_by=request.stratify_by,
+            message_mode=request.message_mode,
+            chart_options=request.chart_options.model_dump() if request.chart_options else None,
         )
         return result
+    except SchedulerOverloadedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/upload", response_model=dict)
+@router.get("/threads/{thread_id}/messages", response_model=MessagePage, responses={400: {"model": ErrorResponse}})
+async def thread_messages(
+    thread_id: str,
+    cursor: int = Query(0, ge=0, description="Position of the first message to return"),
+    limit: int = Query(50, ge=1, le=500, description="Maximum number of messages to return"),
+):
+    """Page through the message history of a thread"""
+    analysis = await import_service("analysis")
+    try:
+        return await analysis.get_analysis_service().get_thread_messages(thread_id, cursor, limit)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post(
+    "/jobs",
+    response_model=JobStatus,
+    status_code=202,
+    responses={400: {"model": ErrorResponse}, 429: {"model": ErrorResponse}},
+)
+async def submit_job(request: AnalysisRequest):
+    """Queue an analysis to run in the background; poll its status and fetch its result by job id"""
+    try:
+        return await job_manager.submit(request.model_dump())
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/jobs/{job_id}", response_model=JobStatus, responses={404: {"model": ErrorResponse}})
+async def job_status(job_id: str):
+    """Status of a background analysis"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@router.get(
+    "/jobs/{job_id}/result",
+    response_model=AnalysisResponse,
+    responses={404: {"model": ErrorResponse}, 409: {"model": ErrorResponse}},
+)
+async def job_result(job_id: str):
+    """Result of a finished background analysis"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job["status"] != SUCCEEDED:
+        detail = f"Job {job_id} is {job['status']}" + (f": {job['error']}" if job["error"] else "")
+        raise HTTPException(status_code=409, detail=detail)
+    return job["result"]
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobStatus, responses={404: {"model": ErrorResponse}})
+async def cancel_job(job_id: str):
+    """Cancel a queued or running background analysis"""
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@router.post(
+    "/batches",
+    response_model=BatchStatus,
+    status_code=202,
+    responses={400: {"model": ErrorResponse}, 413: {"model": ErrorResponse}, 429: {"model": ErrorResponse}},
+)
+async def submit_batch(request: BatchRequest):
+    """Queue many analyses at once; they share the background workers, the warm agent and the dataset caches"""
+    if len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {MAX_BATCH_ITEMS} items")
+    try:
+        batch_id = await job_manager.submit_batch([item.model_dump() for item in request.items])
+        return job_manager.batch(batch_id)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/batches/{batch_id}", response_model=BatchStatus, responses={404: {"model": ErrorResponse}})
+async def batch_status(batch_id: str):
+    """Per-item status and results of a batch, with aggregate timing"""
+    batch = job_manager.batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return batch
+
+@router.post("/batches/{batch_id}/cancel", response_model=BatchStatus, responses={404: {"model": ErrorResponse}})
+async def cancel_batch(batch_id: str):
+    """Cancel the unfinished items of a batch"""
+    batch = await job_manager.cancel_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return batch
+
+@router.post(
+    "/charts",
+    response_model=ChartResponse,
+    responses={
+        200: {"content": {media_type: {} for media_type in CHART_MEDIA_TYPES.values()}},
+        400: {"model": ErrorResponse},
+        429: {"model": ErrorResponse},
+    },
+)
+async def render_chart(
+    spec: FigureSpec,
+    delivery: Literal["url", "binary", "base64"] = Query(
+        "url", description="Return a download URL, the image itself, or the image base64-encoded in JSON"
+    ),
+):
+    """Render a chart from a figure spec in the chart worker pool"""
+    charts = await import_service("charts")
+    try:
+        started = time.perf_counter()
+        chart_id, image, cached = await charts.chart_pool.render_spec(spec.model_dump())
+        if delivery == "binary":
+            media_type = CHART_MEDIA_TYPES[spec.output.format]
+            return Response(content=image, media_type=media_type, headers=_chart_headers(chart_id))
+        return {
+            "image_base64": base64.b64encode(image).decode("utf-8") if delivery == "base64" else None,
+            "format": spec.output.format,
+            "bytes": len(image),
+            "render_ms": (time.perf_counter() - started) * 1000,
+            "chart_id": chart_id,
+            "url": charts.chart_url(chart_id),
+            "cached": cached,
+        }
+    except charts.ChartRenderBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _chart_headers(chart_id: str) -> dict:
+    # Chart ids are content digests: the id is a strong ETag and the content never changes
+    digest, _ = parse_chart_id(chart_id)
+    return {"ETag": f'"{digest}"', "Cache-Control": f"public, max-age={CHART_CACHE_MAX_AGE}, immutable"}
+
+@router.get("/charts/stats", response_model=dict)
+async def chart_pool_stats():
+    """
+    Renders, failures, busy rejections and mean render time of the chart worker pool, chart cache usage, and the
+    lifecycle of sandbox figures with the process memory
+    """
+    charts = await import_service("charts")
+    figures = await import_service("figures")
+    return {**charts.chart_pool.stats(), "figures": figures.figure_stats()}
+
+@router.get("/charts/{chart_id}", responses={304: {"description": "Not modified"}, 404: {"model": ErrorResponse}})
+async def get_chart(chart_id: str, if_none_match: Optional[str] = Header(None)):
+    """Download a cached chart; its id is a content digest, so it is served as immutable with the id as ETag"""
+    parsed = parse_chart_id(chart_id)
+    if parsed is None:
+        raise HTTPException(status_code=404, detail=f"Chart {chart_id} not found")
+    headers = _chart_headers(chart_id)
+    if if_none_match is not None and chart_id in chart_cache:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if headers["ETag"] in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+    loop = asyncio.get_event_loop()
+    data = await loop.run_in_executor(None, chart_cache.read, chart_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"Chart {chart_id} not found")
+    return Response(content=data, media_type=CHART_MEDIA_TYPES[parsed[1]], headers=headers)
+
+@router.get("/scheduler", response_model=dict)
+async def scheduler_stats():
+    """Queue depth, concurrency and queue-wait metrics of the analysis scheduler"""
+    return request_scheduler.stats()
+
+@router.get("/datasets/cache", response_model=dict)
+async def dataset_cache_stats():
+    """Hit rate, bytes saved and occupancy of the shared sandbox DataFrame cache"""
+    datasets = await import_service("datasets")
+    return datasets.dataset_cache.stats()
+
+@router.get("/sandbox/sessions", response_model=dict)
+async def sandbox_session_stats():
+    """Memory used by the sandbox sessions, against the per-session quota and the global budget"""
+    return sandbox_sessions.stats()
+
+@router.delete("/sandbox/sessions/{thread_id}", response_model=dict, responses={404: {"model": ErrorResponse}})
+async def drop_sandbox_session(thread_id: str):
+    """Free the sandbox variables of a thread; its conversation history is kept"""
+    loop = asyncio.get_event_loop()
+    if not await loop.run_in_executor(None, sandbox_sessions.drop, thread_id):
+        raise HTTPException(status_code=404, detail=f"No sandbox session for thread {thread_id}")
+    return {"thread_id": thread_id, "dropped": True}
+
+@router.post("/upload", response_model=dict, responses={413: {"model": ErrorResponse}})
 async def upload_file(file: UploadFile = File(...)):
     """Upload a data file for analysis"""
+    ingestion = await import_service("ingestion")
+    profiling = await import_service("profiling")
     try:
-        # Save the file
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        
-        return {"filename": file.filename, "path": file_path}
+        # Stream the file to disk in chunks
+        stored = await save_upload(file)
+
+        # Ingestion: build the columnar copy used by sandbox reads
+        loop = asyncio.get_event_loop()
+        stored["ingestion"] = await loop.run_in_executor(
+            None, ingestion.ingest_upload, stored["filename"], stored["sha256"]
+        )
+        stored["profiled"] = await loop.run_in_executor(
+            None, profiling.profile_upload, stored["filename"], stored["sha256"]
+        )
+        return stored
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/upload/{filename}", response_model=dict, responses={404: {"model": ErrorResponse}})
+async def remove_upload(filename: str):
+    """Delete an uploaded file"""
+    try:
+        removed = await delete_upload(filename)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"Upload {filename} not found")
+    return {"filename": filename, "deleted": True}
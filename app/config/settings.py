@@ -9,6 +9,8 @@ load_dotenv(env_path)
 # API settings
 API_V1_STR = "/api/v1"
 PROJECT_NAME = "Data Analyst API"
+# Responses larger than this many bytes are gzip-compressed for clients that accept it
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
 
 # OpenAI settings
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -79,6 +81,9 @@ Remember to:
    -ALWAYS Use the Tool: For any request that involves data—loading, cleaning, analyzing, calculating metrics, plotting, or running statistical models—you MUST write and execute code with the python_tool. Do not answer from general knowledge.
 
 Your primary tool is the python_tool which allows you to execute Python code for data analysis tasks.
+Variables, imports and functions you define stay available to later python_tool calls in the same conversation. Their memory is limited per conversation, so `del` large intermediate results you no longer need.
+Assignments that already ran with the same inputs in the previous python_tool call are not run again and are listed in `reused_statements`, so to fix an error, resubmit the same code with only the failing part changed.
+The builtins sqrt, log, exp, sin, cos, tan, asin, acos, atan, atan2, degrees, radians, ceil and floor also apply element-wise to lists, numpy arrays and pandas Series: write `df["log_amount"] = log(df["amount"])` rather than looping over rows.
 
 """
 
@@ -195,7 +200,7 @@ total_sales
 
 When the user requests a **chart/plot/graph/histogram**, you **must** follow these steps:
 
-1. **Chart Generation**: Use libraries like `matplotlib` or `seaborn` to create the chart.
+1. **Chart Generation**: Use libraries like `matplotlib` or `seaborn` to create the chart. Plot large series directly: `plt.plot`, `plt.scatter`, `sns.lineplot` and `sns.scatterplot` automatically downsample lines (keeping every peak) and draw very large scatter plots as hexbin density.
 2. **Save the Chart to a File**: You **must** save the chart using `plt.savefig()` to a specific path under `public/charts/`. The filename should be meaningful (e.g., `sales_histogram.png`).
 3. **Print the Path for UI (Core Protocol)**: After saving the file, print a special string so the UI can detect it:
 CHART:public/charts/your_chart_name.png
@@ -246,8 +251,85 @@ Your primary tool is `python_tool`, and your job is to **think deeply**, **act p
 
 """
 # File upload settings
+# Created at startup by the app
 UPLOAD_DIR = Path(__file__).parent.parent.parent / "uploads"
-UPLOAD_DIR.mkdir(exist_ok=True)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(5 * 1024 ** 3)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Content-addressed storage backing the files in UPLOAD_DIR, with the catalog and derived artifacts; kept outside
+# UPLOAD_DIR, which is served at /uploads, and on the same filesystem so uploads can be hard links to its objects
+UPLOAD_STORE_DIR = Path(
+    os.getenv("UPLOAD_STORE_DIR", str(Path(__file__).parent.parent.parent / "upload_store"))
+)
+# Convert tabular uploads to Parquet so the sandbox can skip text parsing
+COLUMNAR_CONVERSION_ENABLED = os.getenv("COLUMNAR_CONVERSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Memory budget of the DataFrame cache shared by all sandbox sessions
+DATASET_CACHE_MAX_BYTES = int(os.getenv("DATASET_CACHE_MAX_BYTES", str(1024 ** 3)))
+# Sampling mode: size of the exploration sample, and the row count from which "auto" mode turns sampling on
+SAMPLE_ROWS = int(os.getenv("SAMPLE_ROWS", "100000"))
+SAMPLING_AUTO_MIN_ROWS = int(os.getenv("SAMPLING_AUTO_MIN_ROWS", "1000000"))
+
+# Sandbox sessions: interpreter state kept per thread, with a memory quota per session and a budget for all of them
+SANDBOX_SESSION_MAX_BYTES = int(os.getenv("SANDBOX_SESSION_MAX_BYTES", str(2 * 1024 ** 3)))
+SANDBOX_MAX_TOTAL_BYTES = int(os.getenv("SANDBOX_MAX_TOTAL_BYTES", str(8 * 1024 ** 3)))
+SANDBOX_MAX_SESSIONS = int(os.getenv("SANDBOX_MAX_SESSIONS", "256"))
+# Statement memo of a session: memory for the values it keeps for reuse, and the run time below which a statement is
+# cheaper to run again than to keep
+SANDBOX_MEMO_MAX_BYTES = int(os.getenv("SANDBOX_MEMO_MAX_BYTES", str(256 * 1024 ** 2)))
+SANDBOX_MEMO_MIN_SECONDS = float(os.getenv("SANDBOX_MEMO_MIN_SECONDS", "0.05"))
+# Sessions evicted from memory, idle or left at shutdown are written to SANDBOX_SNAPSHOT_DIR and restored on their next
+# request; snapshots not restored within the retention period are deleted
+SANDBOX_SNAPSHOTS_ENABLED = os.getenv("SANDBOX_SNAPSHOTS_ENABLED", "true").lower() in ("1", "true", "yes")
+SANDBOX_SNAPSHOT_DIR = Path(
+    os.getenv("SANDBOX_SNAPSHOT_DIR", str(Path(__file__).parent.parent.parent / "sandbox_snapshots"))
+)
+SANDBOX_SPILL_IDLE_SECONDS = float(os.getenv("SANDBOX_SPILL_IDLE_SECONDS", "900"))
+SANDBOX_SNAPSHOT_RETENTION_SECONDS = float(os.getenv("SANDBOX_SNAPSHOT_RETENTION_SECONDS", "604800"))
+
+# Request scheduling settings
+MAX_CONCURRENT_ANALYSES = int(os.getenv("MAX_CONCURRENT_ANALYSES", "4"))
+MAX_QUEUED_ANALYSES = int(os.getenv("MAX_QUEUED_ANALYSES", "32"))
+ANALYSIS_QUEUE_TIMEOUT = float(os.getenv("ANALYSIS_QUEUE_TIMEOUT", "120"))
+
+# Chart rendering: worker processes, renders in flight before callers wait, and the seaborn theme of the workers
+CHART_RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+CHART_MAX_PENDING = int(os.getenv("CHART_MAX_PENDING", "16"))
+CHART_RENDER_TIMEOUT = float(os.getenv("CHART_RENDER_TIMEOUT", "60"))
+CHART_THEME = os.getenv("CHART_THEME", "whitegrid")
+# Raster charts are never rendered wider or taller than this many pixels; their DPI is lowered to fit
+CHART_MAX_PIXELS = int(os.getenv("CHART_MAX_PIXELS", "4096"))
+# Figures left unsaved by sandboxed code are saved here as charts when its execution ends (then all its figures are
+# closed either way)
+CHART_AUTOSAVE_ENABLED = os.getenv("CHART_AUTOSAVE_ENABLED", "true").lower() in ("1", "true", "yes")
+CHART_AUTOSAVE_DIR = os.getenv("CHART_AUTOSAVE_DIR", "public/charts")
+# Print-output lines announcing a saved chart, by the agent's code or the figure autosave
+CHART_LINE_PREFIX = "CHART:"
+# Sandbox line plots with more points than this are downsampled to it, and scatter plots with more points than
+# PLOT_MAX_SCATTER_POINTS are drawn as hexbin density; 0 disables either
+PLOT_MAX_LINE_POINTS = int(os.getenv("PLOT_MAX_LINE_POINTS", "10000"))
+PLOT_MAX_SCATTER_POINTS = int(os.getenv("PLOT_MAX_SCATTER_POINTS", "50000"))
+# "minmax" keeps the extremes of every bucket of a line, "lttb" the points that best preserve its visual shape
+PLOT_DOWNSAMPLE_METHOD = os.getenv("PLOT_DOWNSAMPLE_METHOD", "minmax")
+PLOT_HEXBIN_GRIDSIZE = int(os.getenv("PLOT_HEXBIN_GRIDSIZE", "100"))
+# Rendered charts are cached on disk by content digest, up to this many bytes
+CHART_CACHE_DIR = Path(os.getenv("CHART_CACHE_DIR", str(Path(__file__).parent.parent.parent / "chart_cache")))
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+# Cached charts never change under their id, so clients may keep them this long
+CHART_CACHE_MAX_AGE = int(os.getenv("CHART_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+
+# Background job settings
+JOBS_DIR = Path(os.getenv("JOBS_DIR", str(Path(__file__).parent.parent.parent / "jobs")))
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "1000"))
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "500"))
+# Finished jobs are deleted this long after they end
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+# Load the heavy dependencies (agent stack, pandas, matplotlib) and start the chart workers before serving, instead
+# of on the first request that needs them
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+# Tracing: finished spans are appended to this file as JSON lines; empty keeps trace ids without exporting spans
+TRACE_FILE = os.getenv("TRACE_FILE", "")
 
 # POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
 # POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
@@ -1,12 +1,16 @@
 import os
+import time
 import asyncio
-from typing import Annotated, List, Dict, Any, Optional
+import threading
+import contextvars
+from typing import Annotated, Callable, List, Dict, Any, Optional
 from typing_extensions import TypedDict
 import logging
 
 # LangGraph and LangChain imports
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langchain.tools import StructuredTool
 from langgraph.prebuilt import ToolNode, tools_condition
 from langgraph.graph import StateGraph, START, END
@@ -22,7 +26,9 @@ from ..config.settings import (
     DEFAULT_AUTHORIZED_IMPORTS,
     POSTGRESS_CONNECTION_STRING,
 )
-from .interpreter_tool import local_python_executor
+from .sessions import SandboxSessionManager, sandbox_sessions
+from .metrics import LLM_REQUEST_SECONDS, LLM_TOKENS, TOOL_SECONDS, instrument_checkpointer, timed
+from .tracing import span, traced
 
 logger = logging.getLogger(__name__)
 
@@ -39,13 +45,20 @@ class DataAnalysisAgent:
         llm=None,
         system_prompt: str = DEFAULT_SYSTEM_PROMPT,
         authorized_imports: List[str] = DEFAULT_AUTHORIZED_IMPORTS,
-        additional_tools: List = []
+        additional_tools: List = [],
+        sandbox_tools: Optional[Dict[str, Callable]] = None,
+        sessions: Optional[SandboxSessionManager] = None,
     ):
         self.llm = llm or self._get_llm()
+        self.model_name = getattr(self.llm, "model_name", None) or getattr(self.llm, "model", None) or "unknown"
         self.system_prompt = system_prompt
         self.authorized_imports = authorized_imports
+        self.sandbox_tools = sandbox_tools or {}
+        self.sessions = sessions or sandbox_sessions
         self._checkpointer = None
         self.agent = None
+        # Stop flags of the runs in progress, by thread; the scheduler runs one request per thread at a time
+        self._stop_events: Dict[str, threading.Event] = {}
         
     def _get_llm(self, api_key: str = OPENAI_API_KEY, model_name: str = DEFAULT_MODEL_NAME, **kwargs):
         """Create an LLM instance"""
@@ -69,19 +82,33 @@ class DataAnalysisAgent:
                 conn = Connection.connect(POSTGRESS_CONNECTION_STRING, **connection_kwargs)
                 checkpointer = PostgresSaver(conn)
                 checkpointer.setup()
-                return checkpointer
+                return instrument_checkpointer(checkpointer)
             
             self._checkpointer = await loop.run_in_executor(None, create_checkpointer)
         return self._checkpointer
         
+    def _cancelled(self, config: RunnableConfig) -> bool:
+        """Whether the run of the config's thread was cancelled by its caller"""
+        event = self._stop_events.get(config.get("configurable", {}).get("thread_id", "default"))
+        return event is not None and event.is_set()
+
     async def _create_agent(self, additional_tools: List):
         """Create the agent graph"""
         # Create the Python executor tool
-        def _local_python_executor(code: str):
-            """Execute Python code safely with restricted imports."""
+        def _local_python_executor(code: str, config: RunnableConfig):
+            """Execute Python code safely with restricted imports, in the sandbox session of the thread."""
+            thread_id = config.get("configurable", {}).get("thread_id", "default")
             try:
-                result = local_python_executor(code, self.authorized_imports)
-                return {"status": "success", "result": result}
+                output, reused, charts = self.sessions.execute(
+                    thread_id, code, self.authorized_imports, self.sandbox_tools
+                )
+                result = {"status": "success", "result": output}
+                if reused:
+                    result["reused_statements"] = reused
+                # Charts saved by the code or, when it left figures unsaved, by the sandbox
+                if charts:
+                    result["charts"] = charts
+                return result
             except Exception as e:
                 return {"status": "error", "error": str(e)}
 
@@ -95,8 +122,8 @@ class DataAnalysisAgent:
         llm_with_tools = self.llm.bind_tools(tools=tools)
         
         # Define nodes
-        def llm_node(state: AgentState) -> AgentState:
-            if state.get("stop_requested", False):
+        def llm_node(state: AgentState, config: RunnableConfig) -> AgentState:
+            if state.get("stop_requested", False) or self._cancelled(config):
                 return {
                     "messages": [AIMessage(content="Process stopped by user.")],
                     "stop_requested": True
@@ -110,10 +137,18 @@ class DataAnalysisAgent:
                 
             messages = state["messages"]
             payload = [SystemMessage(content=self.system_prompt)] + messages
-            response = llm_with_tools.invoke(payload)
+            with span("llm_node", model=self.model_name, messages=len(payload)) as node_span:
+                with timed(LLM_REQUEST_SECONDS, model=self.model_name):
+                    response = llm_with_tools.invoke(payload)
+                usage = getattr(response, "usage_metadata", None) or {}
+                for kind in ("input", "output"):
+                    LLM_TOKENS.inc(usage.get(f"{kind}_tokens", 0), model=self.model_name, kind=kind)
+                    node_span.set_attribute(f"{kind}_tokens", usage.get(f"{kind}_tokens"))
+                node_span.set_attribute("tool_calls", len(getattr(response, "tool_calls", None) or []))
             return {"messages": response}
         
-        def tools_node(state: AgentState) -> AgentState:
+        @traced("tools_node")
+        def tools_node(state: AgentState, config: RunnableConfig) -> AgentState:
             if state.get("stop_requested", False):
                 return {
                     "messages": [AIMessage(content="Process stopped by user.")],
@@ -124,7 +159,14 @@ class DataAnalysisAgent:
             results = []
             tools_dict = {tool.name: tool for tool in tools}
             
-            for tool_call in tool_calls:
+            for position, tool_call in enumerate(tool_calls):
+                if self._cancelled(config):
+                    # Every tool call needs an answer, or the thread's history is rejected by the next LLM request
+                    results += [
+                        ToolMessage(content="Not run: the analysis was cancelled.", tool_call_id=skipped["id"])
+                        for skipped in tool_calls[position:]
+                    ]
+                    return {"messages": results, "stop_requested": True}
                 try:
                     tool_name = tool_call["name"]
                     tool_args = tool_call["args"]
@@ -141,9 +183,21 @@ class DataAnalysisAgent:
                         }
                         
                     tool = tools_dict[tool_name]
-                    tool_result = tool.invoke(tool_args)
+                    started = time.perf_counter()
+                    with span(f"tool.{tool_name}") as tool_span:
+                        try:
+                            tool_result = tool.invoke(tool_args, config=config)
+                        except Exception:
+                            TOOL_SECONDS.observe(time.perf_counter() - started, tool=tool_name, outcome="error")
+                            raise
+                        failed = isinstance(tool_result, dict) and tool_result.get("status") == "error"
+                        if failed:
+                            tool_span.status, tool_span.error = "error", str(tool_result.get("error"))
+                    TOOL_SECONDS.observe(
+                        time.perf_counter() - started, tool=tool_name, outcome="error" if failed else "success"
+                    )
                     
-                    if tool_result.get("status") == "error":
+                    if failed:
                         error_msg = f"Tool {tool_name} failed: {tool_result['error']}"
                         results.append(ToolMessage(content=error_msg, tool_call_id=tool_call_id))
                         return {
@@ -210,10 +264,32 @@ class DataAnalysisAgent:
             "error_message": None
         }
         
-        # Run in thread pool to avoid blocking
+        # Run in thread pool to avoid blocking, keeping the request's context variables visible to the tools
         loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
+        context = contextvars.copy_context()
+        stop_event = self._stop_events[thread_id] = threading.Event()
+        future = loop.run_in_executor(
             None, 
-            lambda: self.agent.invoke(initial_state, config=config)
+            lambda: context.run(self.agent.invoke, initial_state, config=config)
         )
-        return response
\ No newline at end of file
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The graph stops at its next step (the LLM call or code execution in progress completes); the caller keeps
+            # its scheduler slot until then, so the next request of the thread cannot run alongside it
+            stop_event.set()
+            await asyncio.wait([future])
+            raise
+        finally:
+            if self._stop_events.get(thread_id) is stop_event:
+                del self._stop_events[thread_id]
+
+    async def get_messages(self, thread_id: str) -> List[Any]:
+        """Return the message history checkpointed for a thread"""
+        if self.agent is None:
+            self.agent = await self._create_agent([])
+
+        config = {"configurable": {"thread_id": thread_id}}
+        loop = asyncio.get_event_loop()
+        snapshot = await loop.run_in_executor(None, lambda: self.agent.get_state(config))
+        return snapshot.values.get("messages", [])
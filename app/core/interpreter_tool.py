@@ -9,10 +9,14 @@ import logging
 import math
 import re
 from collections.abc import Mapping
+from contextlib import ExitStack
 from functools import wraps
 from importlib import import_module
-from types import BuiltinFunctionType, FunctionType, ModuleType
-from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from numbers import Real
+from types import BuiltinFunctionType, FunctionType, MappingProxyType, ModuleType
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Set, Tuple
+
+from .tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -34,64 +38,6 @@ BASE_BUILTIN_MODULES = [
     "seaborn"
 ]
 
-def custom_print(*args):
-    return None
-
-BASE_PYTHON_TOOLS = {
-    "print": custom_print,
-    "isinstance": isinstance,
-    "range": range,
-    "float": float,
-    "int": int,
-    "bool": bool,
-    "str": str,
-    "set": set,
-    "list": list,
-    "dict": dict,
-    "tuple": tuple,
-    "round": round,
-    "ceil": math.ceil,
-    "floor": math.floor,
-    "log": math.log,
-    "exp": math.exp,
-    "sin": math.sin,
-    "cos": math.cos,
-    "tan": math.tan,
-    "asin": math.asin,
-    "acos": math.acos,
-    "atan": math.atan,
-    "atan2": math.atan2,
-    "degrees": math.degrees,
-    "radians": math.radians,
-    "pow": pow,
-    "sqrt": math.sqrt,
-    "len": len,
-    "sum": sum,
-    "max": max,
-    "min": min,
-    "abs": abs,
-    "enumerate": enumerate,
-    "zip": zip,
-    "reversed": reversed,
-    "sorted": sorted,
-    "all": all,
-    "any": any,
-    "map": map,
-    "filter": filter,
-    "ord": ord,
-    "chr": chr,
-    "next": next,
-    "iter": iter,
-    "divmod": divmod,
-    "callable": callable,
-    "getattr": getattr,
-    "hasattr": hasattr,
-    "setattr": setattr,
-    "issubclass": issubclass,
-    "type": type,
-    "complex": complex,
-}
-
 MAX_LENGTH_TRUNCATE_CONTENT = 20000
 
 def truncate_content(content: str, max_length: int = MAX_LENGTH_TRUNCATE_CONTENT) -> str:
@@ -129,6 +75,57 @@ def custom_print(*args):
     return None
 
 
+def _check_attribute_name(name: Any) -> None:
+    if isinstance(name, str) and name.startswith("__") and name.endswith("__"):
+        raise InterpreterError(f"Forbidden access to dunder attribute: {name}")
+
+
+# getattr, hasattr and setattr take the attribute name as a string, so they get the same dunder check as `obj.attr`
+def _safe_getattr(obj, name, *default):
+    _check_attribute_name(name)
+    return getattr(obj, name, *default)
+
+
+def _safe_hasattr(obj, name):
+    _check_attribute_name(name)
+    return hasattr(obj, name)
+
+
+def _safe_setattr(obj, name, value):
+    _check_attribute_name(name)
+    setattr(obj, name, value)
+
+
+def _elementwise(scalar_function: Callable, numpy_name: str) -> Callable:
+    """
+    Extend a `math` function to lists, tuples, numpy arrays, pandas Series and DataFrames, which it maps element-wise
+    with the numpy ufunc `numpy_name`. Real numbers still go through `math`: it is faster on scalars and keeps its
+    results (int for ceil and floor) and errors (math domain error), where arrays get nan and a numpy warning.
+    """
+
+    @wraps(scalar_function)
+    def function(*args):
+        for arg in args:
+            # The concrete check first: the abstract one is several times slower, and most calls pass int or float
+            if not isinstance(arg, (int, float)) and not isinstance(arg, Real):
+                # numpy is only loaded once sandboxed code passes something other than numbers
+                import numpy as np
+
+                return getattr(np, numpy_name)(*args)
+        return scalar_function(*args)
+
+    return function
+
+
+def _log(x, base=None):
+    """log(x[, base]): the logarithm of x to the given base, natural by default; element-wise on arrays and Series"""
+    if isinstance(x, (int, float, Real)) and (base is None or isinstance(base, (int, float, Real))):
+        return math.log(x) if base is None else math.log(x, base)
+    import numpy as np
+
+    return np.log(x) if base is None else np.log(x) / np.log(base)
+
+
 BASE_PYTHON_TOOLS = {
     "print": custom_print,
     "isinstance": isinstance,
@@ -142,21 +139,21 @@ BASE_PYTHON_TOOLS = {
     "dict": dict,
     "tuple": tuple,
     "round": round,
-    "ceil": math.ceil,
-    "floor": math.floor,
-    "log": math.log,
-    "exp": math.exp,
-    "sin": math.sin,
-    "cos": math.cos,
-    "tan": math.tan,
-    "asin": math.asin,
-    "acos": math.acos,
-    "atan": math.atan,
-    "atan2": math.atan2,
-    "degrees": math.degrees,
-    "radians": math.radians,
+    "ceil": _elementwise(math.ceil, "ceil"),
+    "floor": _elementwise(math.floor, "floor"),
+    "log": _log,
+    "exp": _elementwise(math.exp, "exp"),
+    "sin": _elementwise(math.sin, "sin"),
+    "cos": _elementwise(math.cos, "cos"),
+    "tan": _elementwise(math.tan, "tan"),
+    "asin": _elementwise(math.asin, "arcsin"),
+    "acos": _elementwise(math.acos, "arccos"),
+    "atan": _elementwise(math.atan, "arctan"),
+    "atan2": _elementwise(math.atan2, "arctan2"),
+    "degrees": _elementwise(math.degrees, "degrees"),
+    "radians": _elementwise(math.radians, "radians"),
     "pow": pow,
-    "sqrt": math.sqrt,
+    "sqrt": _elementwise(math.sqrt, "sqrt"),
     "len": len,
     "sum": sum,
     "max": max,
@@ -176,9 +173,9 @@ BASE_PYTHON_TOOLS = {
     "iter": iter,
     "divmod": divmod,
     "callable": callable,
-    "getattr": getattr,
-    "hasattr": hasattr,
-    "setattr": setattr,
+    "getattr": _safe_getattr,
+    "hasattr": _safe_hasattr,
+    "setattr": _safe_setattr,
     "issubclass": issubclass,
     "type": type,
     "complex": complex,
@@ -321,8 +318,7 @@ def evaluate_attribute(
     custom_tools: Dict[str, Callable],
     authorized_imports: List[str],
 ) -> Any:
-    if expression.attr.startswith("__") and expression.attr.endswith("__"):
-        raise InterpreterError(f"Forbidden access to dunder attribute: {expression.attr}")
+    _check_attribute_name(expression.attr)
     value = evaluate_ast(expression.value, state, static_tools, custom_tools, authorized_imports)
     return getattr(value, expression.attr)
 
@@ -693,6 +689,7 @@ def set_value(
         key = evaluate_ast(target.slice, state, static_tools, custom_tools, authorized_imports)
         obj[key] = value
     elif isinstance(target, ast.Attribute):
+        _check_attribute_name(target.attr)
         obj = evaluate_ast(target.value, state, static_tools, custom_tools, authorized_imports)
         setattr(obj, target.attr, value)
 
@@ -1101,15 +1098,82 @@ def evaluate_with(
             context.__exit__(None, None, None)
 
 
+# Attributes replaced on the sandbox copies of modules, keyed by module name. This lets the host intercept calls such
+# as `pandas.read_csv` made by sandboxed code without patching the real modules.
+SANDBOX_MODULE_OVERRIDES: Dict[str, Dict[str, Any]] = {}
+
+
+# Context managers entered around every execution of `LocalPythonExecutor`, registered by the host: each hook is
+# called with the execution state and returns a context manager, so the host can act on the execution's side effects
+# (e.g. figures left open) even when the code fails.
+SANDBOX_EXECUTION_HOOKS: List[Callable[[Dict[str, Any]], ContextManager]] = []
+
+
+# Safe copies of imported modules, keyed by module name. Copying a large package tree takes tens of milliseconds, so
+# copies are built once and shared by all executions; they are read-only so that sessions cannot affect each other.
+_SAFE_MODULE_CACHE: Dict[str, Tuple[ModuleType, ModuleType]] = {}
+
+
+class SandboxModule(ModuleType):
+    """
+    Read-only copy of a module, as seen by sandboxed code. Copies are shared by all sessions, so attributes are served
+    from a frozen mapping that neither assignment nor writes to the module's `__dict__` can reach
+    """
+
+    __slots__ = ("_attributes",)
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        super().__init__(name)
+        object.__setattr__(self, "_attributes", MappingProxyType(attributes))
+
+    def __getattribute__(self, name):
+        attributes = object.__getattribute__(self, "_attributes")
+        if name in attributes:
+            return attributes[name]
+        if name.startswith("__") and name.endswith("__"):
+            return super().__getattribute__(name)
+        # Lazy attributes of modules that define a module-level __getattr__ (PEP 562)
+        if "__getattr__" in attributes:
+            return attributes["__getattr__"](name)
+        raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+
+    def __dir__(self):
+        return sorted(object.__getattribute__(self, "_attributes"))
+
+    def __setattr__(self, name, value):
+        raise InterpreterError(f"Cannot set attribute {name} on module {self.__name__}: sandbox modules are read-only")
+
+    def __delattr__(self, name):
+        raise InterpreterError(
+            f"Cannot delete attribute {name} of module {self.__name__}: sandbox modules are read-only"
+        )
+
+
+def register_module_override(module_name: str, attribute: str, value: Any) -> None:
+    """Replace `module_name.attribute` with `value` in every module imported by sandboxed code"""
+    SANDBOX_MODULE_OVERRIDES.setdefault(module_name, {})[attribute] = value
+    _SAFE_MODULE_CACHE.clear()
+
+
+def register_execution_hook(hook: Callable[[Dict[str, Any]], ContextManager]) -> None:
+    """Enter `hook(state)` around every execution of `LocalPythonExecutor`"""
+    SANDBOX_EXECUTION_HOOKS.append(hook)
+
+
 def get_safe_module(raw_module, authorized_imports, visited=None):
     """Creates a safe copy of a module or returns the original if it's a function"""
     # If it's a function or non-module object, return it directly
     if not isinstance(raw_module, ModuleType):
         return raw_module
 
-    # Handle circular references: Initialize visited set for the first call
+    # Top-level imports reuse the copy made by a previous execution, unless the module was reloaded since
     if visited is None:
-        visited = set()
+        cached = _SAFE_MODULE_CACHE.get(raw_module.__name__)
+        if cached is not None and cached[0] is raw_module:
+            return cached[1]
+        safe_module = get_safe_module(raw_module, authorized_imports, visited=set())
+        _SAFE_MODULE_CACHE[raw_module.__name__] = (raw_module, safe_module)
+        return safe_module
 
     module_id = id(raw_module)
     if module_id in visited:
@@ -1117,10 +1181,8 @@ def get_safe_module(raw_module, authorized_imports, visited=None):
 
     visited.add(module_id)
 
-    # Create new module for actual modules
-    safe_module = ModuleType(raw_module.__name__)
-
     # Copy all attributes by reference, recursively checking modules
+    attributes: Dict[str, Any] = {}
     for attr_name in dir(raw_module):
         try:
             attr_value = getattr(raw_module, attr_name)
@@ -1134,9 +1196,11 @@ def get_safe_module(raw_module, authorized_imports, visited=None):
         if isinstance(attr_value, ModuleType):
             attr_value = get_safe_module(attr_value, authorized_imports, visited=visited)
 
-        setattr(safe_module, attr_name, attr_value)
+        attributes[attr_name] = attr_value
 
-    return safe_module
+    attributes.update(SANDBOX_MODULE_OVERRIDES.get(raw_module.__name__, {}))
+
+    return SandboxModule(raw_module.__name__, attributes)
 
 
 def check_module_authorized(module_name, authorized_imports):
@@ -1420,6 +1484,7 @@ class FinalAnswerException(Exception):
         self.value = value
 
 
+@traced("evaluate_python_code")
 def evaluate_python_code(
     code: str,
     static_tools: Optional[Dict[str, Callable]] = None,
@@ -1427,6 +1492,7 @@ def evaluate_python_code(
     state: Optional[Dict[str, Any]] = None,
     authorized_imports: List[str] = BASE_BUILTIN_MODULES,
     max_print_outputs_length: int = DEFAULT_MAX_LEN_OUTPUT,
+    statement_memo=None,
 ):
     """
     Evaluate a python expression using the content of the variables stored in a state and only evaluating a given set
@@ -1450,6 +1516,9 @@ def evaluate_python_code(
         authorized_imports (`List[str]`):
             The list of modules that can be imported by the code. By default, only a few safe modules are allowed.
             If it contains "*", it will authorize any import. Use this at your own risk!
+        statement_memo (`StatementMemo`, *optional*):
+            The memo of the session `state` belongs to: top-level statements it has recorded with the same inputs are
+            skipped and their values restored, and every executed statement is reported to it.
     """
     try:
         expression = ast.parse(code)
@@ -1478,8 +1547,18 @@ def evaluate_python_code(
         static_tools["final_answer"] = final_answer
 
     try:
-        for node in expression.body:
-            result = evaluate_ast(node, state, static_tools, custom_tools, authorized_imports)
+        for index, node in enumerate(expression.body):
+            last = index == len(expression.body) - 1
+            if statement_memo is not None and statement_memo.reuse(node, state, custom_tools, last=last):
+                continue
+            try:
+                result = evaluate_ast(node, state, static_tools, custom_tools, authorized_imports)
+            except BaseException:
+                if statement_memo is not None:
+                    statement_memo.record(node, state, custom_tools, completed=False)
+                raise
+            if statement_memo is not None:
+                statement_memo.record(node, state, custom_tools)
         state["_print_outputs"].value = truncate_content(
             str(state["_print_outputs"]), max_length=max_print_outputs_length
         )
@@ -1509,6 +1588,7 @@ class LocalPythonExecutor(PythonExecutor):
         self,
         additional_authorized_imports: List[str],
         max_print_outputs_length: Optional[int] = None,
+        additional_tools: Optional[Dict[str, Callable]] = None,
     ):
         self.custom_tools = {}
         self.state = {}
@@ -1518,17 +1598,27 @@ class LocalPythonExecutor(PythonExecutor):
         self.additional_authorized_imports = additional_authorized_imports
         self.authorized_imports = list(set(BASE_BUILTIN_MODULES) | set(self.additional_authorized_imports))
         # TODO: assert self.authorized imports are all installed locally
-        self.static_tools = None
+        self.static_tools = {**BASE_PYTHON_TOOLS, **(additional_tools or {})}
+        # Set by sandbox sessions to skip statements that already ran with the same inputs
+        self.statement_memo = None
 
     def __call__(self, code_action: str) -> Tuple[Any, str, bool]:
-        output, is_final_answer = evaluate_python_code(
-            code_action,
-            static_tools=self.static_tools,
-            custom_tools=self.custom_tools,
-            state=self.state,
-            authorized_imports=self.authorized_imports,
-            max_print_outputs_length=self.max_print_outputs_length,
-        )
+        if self.statement_memo is not None:
+            self.statement_memo.start()
+        with ExitStack() as hooks:
+            for hook in SANDBOX_EXECUTION_HOOKS:
+                hooks.enter_context(hook(self.state))
+            if self.statement_memo is not None:
+                hooks.callback(self.statement_memo.finish)
+            output, is_final_answer = evaluate_python_code(
+                code_action,
+                static_tools=self.static_tools,
+                custom_tools=self.custom_tools,
+                state=self.state,
+                authorized_imports=self.authorized_imports,
+                max_print_outputs_length=self.max_print_outputs_length,
+                statement_memo=self.statement_memo,
+            )
         logs = str(self.state["_print_outputs"])
         return output, logs, is_final_answer
 
@@ -1540,7 +1630,11 @@ class LocalPythonExecutor(PythonExecutor):
     #     self.static_tools = {**tools, **BASE_PYTHON_TOOLS.copy()}
 
 
-def local_python_executor(code: str, authorized_imports: List[str]):
+def local_python_executor(
+    code: str,
+    authorized_imports: List[str],
+    additional_tools: Optional[Dict[str, Callable]] = None,
+):
     """
     Executes Python code in a sandboxed environment with restricted imports for security.
     
@@ -1556,6 +1650,9 @@ def local_python_executor(code: str, authorized_imports: List[str]):
             A list of module names that are allowed to be imported by the code.
             These are in addition to the base built-in modules defined in BASE_BUILTIN_MODULES.
             For unrestricted imports (use with caution), include "*" in the list.
+        additional_tools (Dict[str, Callable], optional):
+            Functions made available to the code alongside BASE_PYTHON_TOOLS. Like them, they cannot be
+            overwritten by the executed code.
     
     Returns:
         Any: The result of the last statement in the executed code. If the code raises
@@ -1591,9 +1688,9 @@ def local_python_executor(code: str, authorized_imports: List[str]):
         >>> local_python_executor("data = {'a': 1, 'b': 2}; data['a'] + data['b']", [])
         3
     """
-    tool = LocalPythonExecutor(additional_authorized_imports=authorized_imports)
+    tool = LocalPythonExecutor(additional_authorized_imports=authorized_imports, additional_tools=additional_tools)
     output, logs, is_final_answer = tool(code_action=code)
     return output
 
 
-__all__ = ["evaluate_python_code", "LocalPythonExecutor"]
+__all__ = ["evaluate_python_code", "LocalPythonExecutor", "register_module_override", "register_execution_hook"]
@@ -0,0 +1,335 @@
+import os
+import sys
+import ast
+import copy
+import time
+import hashlib
+import itertools
+from types import FunctionType, ModuleType
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from ..config.settings import SANDBOX_MEMO_MAX_BYTES, SANDBOX_MEMO_MIN_SECONDS
+from .interpreter_tool import create_function
+
+# Methods that change the object they are called on, for builtin containers, numpy arrays and pandas objects
+MUTATING_METHODS = frozenset(
+    {
+        "add", "append", "clear", "difference_update", "discard", "extend", "fill", "insert", "intersection_update",
+        "itemset", "partition", "pop", "popitem", "put", "remove", "resize", "reverse", "setdefault", "setflags",
+        "sort", "symmetric_difference_update", "update",
+    }
+)
+# Module functions and sandbox tools that change the values they are passed
+MUTATING_FUNCTIONS = frozenset(
+    {
+        "copyto", "fill_diagonal", "heapify", "heappop", "heappush", "heappushpop", "heapreplace", "insort",
+        "insort_left", "insort_right", "place", "put", "putmask", "shuffle",
+    }
+)
+# Methods called on their own only to display or export a value, which do not change it
+DISPLAY_METHODS = frozenset({"describe", "head", "hist", "info", "plot", "show", "tail"})
+# Calls whose results differ between runs: functions of these modules, of objects they define, and these functions
+NONDETERMINISTIC_MODULES = ("random", "time", "datetime", "uuid", "secrets", "numpy.random")
+NONDETERMINISTIC_FUNCTIONS = frozenset({"now", "today", "utcnow"})
+# Values defined by sandboxed code read the session state when called, which the memo does not track; figures are
+# closed after each execution
+OPAQUE_MODULES = (create_function.__module__, "matplotlib", "seaborn")
+IMMUTABLE_TYPES = (bool, int, float, complex, str, bytes, tuple, frozenset, type(None))
+MEMOIZED_STATEMENTS = (ast.Assign, ast.AnnAssign, ast.AugAssign)
+MAX_PATH_LENGTH = 4096
+MAX_REPORTED_SOURCE = 80
+_UNBOUND = object()
+
+
+def _owner(value: Any) -> str:
+    if isinstance(value, ModuleType):
+        return value.__name__
+    if isinstance(value, (type, FunctionType)):
+        return getattr(value, "__module__", None) or ""
+    return type(value).__module__ or ""
+
+
+def _sandbox_defined(value: Any) -> bool:
+    return _owner(value) == OPAQUE_MODULES[0]
+
+
+def _opaque(value: Any) -> bool:
+    return _owner(value).startswith(OPAQUE_MODULES)
+
+
+def _root(node: ast.AST) -> Optional[str]:
+    """The variable an attribute, item or method chain starts from: `df` for `df.loc[0, "a"]`"""
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _reads(node: ast.stmt) -> Set[str]:
+    names = {child.id for child in ast.walk(node) if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Load)}
+    if isinstance(node, ast.AugAssign):
+        names.add(_root(node.target))
+    names.discard(None)
+    return names
+
+
+def _buffers(value: Any) -> List[Any]:
+    """The numpy arrays holding the data of an array, a Series or the columns of a DataFrame"""
+    # Neither library is imported here: values of their types can only exist once sandboxed code imported them
+    np, pd = sys.modules.get("numpy"), sys.modules.get("pandas")
+    if np is not None and isinstance(value, np.ndarray):
+        return [value]
+    if pd is not None and isinstance(value, pd.Series):
+        return [value.to_numpy(copy=False)]
+    if pd is not None and isinstance(value, pd.DataFrame):
+        return [column.to_numpy(copy=False) for _, column in value.items()]
+    return []
+
+
+def _shares_memory(left: Any, right: Any) -> bool:
+    """Whether changing one value in place may change the other: the same object, or views of the same data"""
+    if left is right:
+        return True
+    right_buffers = _buffers(right)
+    if not right_buffers:
+        return False
+    np = sys.modules["numpy"]
+    return any(np.may_share_memory(a, b) for a in _buffers(left) for b in right_buffers)
+
+
+def _nondeterministic(node: ast.stmt, scope: Dict[str, Any]) -> bool:
+    """Whether a statement calls functions such as `random.random`, `time.time` or `datetime.now`"""
+    for child in ast.walk(node):
+        if not isinstance(child, ast.Call):
+            continue
+        func, attributes = child.func, []
+        while isinstance(func, ast.Attribute):
+            attributes.insert(0, func.attr)
+            func = func.value
+        if attributes and attributes[-1] in NONDETERMINISTIC_FUNCTIONS:
+            return True
+        if isinstance(func, ast.Name) and func.id in scope:
+            name = ".".join([_owner(scope[func.id])] + attributes)
+            if any(name == module or name.startswith(module + ".") for module in NONDETERMINISTIC_MODULES):
+                return True
+    return False
+
+
+def _call_mutations(call: ast.Call, scope: Dict[str, Any], seen: FrozenSet[int]) -> Set[str]:
+    arguments = [arg.value if isinstance(arg, ast.Starred) else arg for arg in call.args]
+    arguments += [keyword.value for keyword in call.keywords]
+    passed = {argument.id for argument in arguments if isinstance(argument, ast.Name)}
+    # Output arguments, as in `np.add(a, 10, out=a)`
+    outputs = {_root(keyword.value) for keyword in call.keywords if keyword.arg == "out"}
+    if isinstance(call.func, ast.Attribute):
+        receiver = _root(call.func.value)
+        owner = scope.get(receiver)
+        if isinstance(owner, ModuleType):
+            return passed | outputs if call.func.attr in MUTATING_FUNCTIONS else outputs
+        inplace = any(
+            keyword.arg == "inplace" and not (isinstance(keyword.value, ast.Constant) and not keyword.value.value)
+            for keyword in call.keywords
+        )
+        if inplace or call.func.attr in MUTATING_METHODS or _sandbox_defined(owner):
+            return {receiver} | outputs
+        return outputs
+    if isinstance(call.func, ast.Name) and call.func.id not in scope:
+        # Builtins and sandbox tools
+        return passed | outputs if call.func.id in MUTATING_FUNCTIONS else outputs
+    # Functions defined by the code may change what they are passed and the variables their body changes
+    function = scope.get(call.func.id) if isinstance(call.func, ast.Name) else None
+    definition = getattr(function, "__ast__", None)
+    if definition is not None and id(definition) not in seen:
+        passed |= _effects(definition, scope, seen | {id(definition)})[1]
+    return passed | outputs
+
+
+def _effects(node: ast.AST, scope: Dict[str, Any], seen: FrozenSet[int] = frozenset()) -> Tuple[Set[str], Set[str]]:
+    """The names a statement binds, and the variables whose values it may change in place"""
+    bound: Set[str] = set()
+    mutated: Set[str] = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name) and isinstance(child.ctx, (ast.Store, ast.Del)):
+            bound.add(child.id)
+        elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(child.name)
+        elif isinstance(child, (ast.Import, ast.ImportFrom)):
+            for alias in child.names:
+                # `from module import *` may bind anything
+                bound.update(scope if alias.name == "*" else [(alias.asname or alias.name).split(".")[0]])
+        elif isinstance(child, ast.ExceptHandler) and child.name:
+            bound.add(child.name)
+        elif isinstance(child, (ast.Attribute, ast.Subscript)) and isinstance(child.ctx, (ast.Store, ast.Del)):
+            mutated.add(_root(child.value))
+        elif isinstance(child, ast.AugAssign):
+            mutated.add(_root(child.target))
+        elif isinstance(child, ast.Expr) and isinstance(child.value, ast.Call):
+            # A method called for its effects rather than its result, like `model.fit(X, y)`, may change its object
+            call = child.value
+            if isinstance(call.func, ast.Attribute) and call.func.attr not in DISPLAY_METHODS:
+                receiver = _root(call.func.value)
+                if not isinstance(scope.get(receiver), ModuleType) and not call.func.attr.startswith("to_"):
+                    mutated.add(receiver)
+        elif isinstance(child, ast.Call):
+            mutated |= _call_mutations(child, scope, seen)
+    mutated.discard(None)
+    return bound, mutated
+
+
+def _file_stamps(node: ast.stmt, reads: Set[str], state: Dict[str, Any]) -> Tuple:
+    """Size and modification time of the files a statement names, literally or through string variables"""
+    candidates = {child.value for child in ast.walk(node) if isinstance(child, ast.Constant)}
+    candidates.update(state[name] for name in reads if name in state and isinstance(state[name], str))
+    stamps = []
+    for path in candidates:
+        if not isinstance(path, str) or not path or len(path) > MAX_PATH_LENGTH:
+            continue
+        try:
+            stat = os.stat(path)
+        except (OSError, ValueError):
+            continue
+        stamps.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(stamps))
+
+
+class StatementMemo:
+    """
+    Memoization of the top-level statements executed in one sandbox session.
+
+    Every variable of the session has a version, renewed whenever a statement binds it or changes its value in place.
+    Assignments are keyed by the hash of their AST, the versions of the variables they read and the modification times
+    of the files they name, and a copy of the values they bind is recorded under that key. A statement whose key was
+    recorded by the previous execution of the session is not run again: fresh copies of its values are restored, so
+    changes made to them afterwards, recognised or not, never reach the record. Only statements that ran for at least
+    `min_seconds` are recorded, and only while the recorded values, as measured by `measure`, stay within `max_bytes`.
+
+    Values are assumed to change in place only through item and attribute assignments, augmented assignments,
+    `inplace=True`, `out=`, `MUTATING_METHODS`, methods called for their effects and the functions they are passed to;
+    such a change renews the versions of every variable sharing memory with the value. The last statement, which gives
+    the result, statements binding aliases or views of their inputs, statements calling non-deterministic functions
+    (`NONDETERMINISTIC_MODULES`) and statements using functions or classes defined by the code or plotting objects
+    always run.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = SANDBOX_MEMO_MAX_BYTES,
+        min_seconds: float = SANDBOX_MEMO_MIN_SECONDS,
+        measure: Callable[[Any], int] = sys.getsizeof,
+    ):
+        self.max_bytes = max_bytes
+        self.min_seconds = min_seconds
+        self.measure = measure
+        self.versions: Dict[str, int] = {}
+        # Statements reused by the current execution, as "line N: source"
+        self.reused: List[str] = []
+        self._clock = itertools.count(1)
+        self._previous: Dict[Tuple, Dict[str, Tuple[int, Any]]] = {}
+        self._current: Dict[Tuple, Dict[str, Tuple[int, Any]]] = {}
+        self._pending: Optional[Tuple] = None
+        self._started = 0.0
+        self._bindings: Dict[str, Any] = {}
+        # Size of the values recorded under each key
+        self._sizes: Dict[Tuple, int] = {}
+
+    def start(self) -> None:
+        self._current = {}
+        self._pending = None
+        self.reused = []
+
+    def finish(self) -> None:
+        # Only the statements of the last execution are kept, which bounds the memory held by recorded values
+        self._previous = self._current
+        self._current = {}
+        self._sizes = {key: self._sizes[key] for key in self._previous}
+
+    def clear(self) -> None:
+        self.versions.clear()
+        self.drop_values()
+
+    def drop_values(self) -> None:
+        """Forget the recorded values, to free their memory; the versions stay valid"""
+        self._previous = {}
+        self._current = {}
+        self._sizes = {}
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the recorded values, to be counted in the session's memory"""
+        return sum(self._sizes.values())
+
+    def reuse(
+        self, node: ast.stmt, state: Dict[str, Any], custom_tools: Dict[str, Callable], last: bool = False
+    ) -> bool:
+        """Restore the values of a statement run by the previous execution with the same inputs; False if it must run"""
+        self._pending = None
+        # Functions defined by the code live in the custom tools rather than in the state
+        scope = {**custom_tools, **state}
+        # Rebinding a variable to the object it already holds, as repeated imports do, keeps its version
+        self._bindings = scope
+        if last or not isinstance(node, MEMOIZED_STATEMENTS):
+            return False
+        reads = _reads(node)
+        if any(_opaque(scope[name]) for name in reads if name in scope) or _nondeterministic(node, scope):
+            return False
+        code_hash = hashlib.sha1(ast.dump(node).encode()).hexdigest()
+        versions = tuple((name, self.versions.get(name, 0)) for name in sorted(reads))
+        key = (code_hash, versions, _file_stamps(node, reads, state))
+        self._pending = key
+        outputs = self._current.get(key) or self._previous.get(key)
+        if outputs is None:
+            self._started = time.perf_counter()
+            return False
+        # One copy of all the values keeps the references they share with each other
+        values = copy.deepcopy({name: value for name, (_, value) in outputs.items()})
+        for name, (version, _) in outputs.items():
+            state[name] = values[name]
+            self.versions[name] = version
+        self._current[key] = outputs
+        source = ast.unparse(node).splitlines()[0]
+        if len(source) > MAX_REPORTED_SOURCE:
+            source = source[: MAX_REPORTED_SOURCE - 3] + "..."
+        self.reused.append(f"line {node.lineno}: {source}")
+        return True
+
+    def record(
+        self, node: ast.stmt, state: Dict[str, Any], custom_tools: Dict[str, Callable], completed: bool = True
+    ) -> None:
+        """Renew the versions of what a statement changed, and record its values if it completed and can be reused"""
+        key, self._pending = self._pending, None
+        scope = {**custom_tools, **state}
+        bound, mutated = _effects(node, scope)
+        for name in mutated:
+            self._mutated(name, state)
+        for name in bound:
+            if name not in scope or self._bindings.get(name, _UNBOUND) is not scope[name]:
+                self.versions[name] = next(self._clock)
+        inputs, self._bindings = [self._bindings[name] for name in _reads(node) if name in self._bindings], {}
+        if key is None or not completed or mutated or time.perf_counter() - self._started < self.min_seconds:
+            return
+        values = {name: state[name] for name in bound if name in state}
+        # A restored copy of `b = a` or `v = a[:]` would no longer change with `a`
+        if any(
+            not isinstance(value, IMMUTABLE_TYPES) and any(_shares_memory(value, other) for other in inputs)
+            for value in values.values()
+        ):
+            return
+        # Measured before copying, so the memo never grows past its budget
+        size = self.measure(list(values.values()))
+        if self.nbytes + size > self.max_bytes:
+            return
+        try:
+            values = copy.deepcopy(values)
+        except Exception:
+            # Generators, locks, open files...
+            return
+        self._current[key] = {name: (self.versions[name], value) for name, value in values.items()}
+        self._sizes[key] = size
+
+    def _mutated(self, name: str, state: Dict[str, Any]) -> None:
+        if name not in state or isinstance(state[name], IMMUTABLE_TYPES):
+            return
+        target = state[name]
+        # Other variables bound to the same object, or to views of the same data, changed too
+        for other, value in state.items():
+            if not isinstance(value, IMMUTABLE_TYPES) and _shares_memory(value, target):
+                self.versions[other] = next(self._clock)
@@ -0,0 +1,231 @@
+import math
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .interpreter_tool import register_execution_hook
+from .tracing import span
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+OPERATION_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+THROUGHPUT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """Metrics of the process, rendered in the Prometheus text format; collectors refresh gauges before rendering"""
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric") -> None:
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics.append(metric)
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional[MetricsRegistry] = None
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: count of observations in each bucket (not cumulative), and their sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _labels(self.labelnames + ("le",), key + (_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels: Any) -> Iterator[None]:
+    """Observe the duration of the body in a histogram with an `outcome` label: success or error"""
+    started = time.perf_counter()
+    outcome = "success"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels, outcome=outcome)
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to serve HTTP requests", ("method", "route", "status")
+)
+ANALYSIS_SECONDS = Histogram(
+    "analysis_duration_seconds", "Time the agent spent on an analysis request, after admission",
+    ("model", "outcome"), buckets=LLM_BUCKETS,
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds", "Latency of LLM calls in the agent loop", ("model", "outcome"), buckets=LLM_BUCKETS
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens used by LLM calls, by kind (input or output)", ("model", "kind"))
+TOOL_SECONDS = Histogram("tool_execution_duration_seconds", "Time to run agent tool calls", ("tool", "outcome"))
+INTERPRETER_SECONDS = Histogram(
+    "interpreter_execution_duration_seconds", "Time to run sandboxed code", ("outcome",), buckets=THROUGHPUT_BUCKETS
+)
+INTERPRETER_OPERATIONS = Histogram(
+    "interpreter_operations", "AST operations evaluated per sandbox execution", ("outcome",), buckets=OPERATION_BUCKETS
+)
+CHECKPOINT_SECONDS = Histogram(
+    "checkpoint_operation_duration_seconds", "Latency of checkpointer reads and writes", ("operation", "outcome")
+)
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes received in uploads", ("outcome",))
+UPLOAD_SECONDS = Histogram(
+    "upload_duration_seconds", "Time to receive and store uploads", ("outcome",), buckets=THROUGHPUT_BUCKETS
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "queue_wait_seconds", "Time requests waited in a queue (analysis scheduler or job queue)", ("queue", "outcome"),
+    buckets=THROUGHPUT_BUCKETS,
+)
+QUEUE_REJECTIONS = Counter("queue_rejections_total", "Requests rejected because a queue was full", ("queue",))
+QUEUE_DEPTH = Gauge("queue_depth", "Requests waiting in a queue", ("queue",))
+SANDBOX_MEMORY_BYTES = Gauge("sandbox_memory_bytes", "Memory held by the variables of all sandbox sessions")
+SANDBOX_SESSIONS = Gauge("sandbox_sessions", "Sandbox sessions kept in memory")
+SANDBOX_EVICTIONS = Counter("sandbox_session_evictions_total", "Sandbox sessions evicted, by reason", ("reason",))
+SANDBOX_SNAPSHOT_SECONDS = Histogram(
+    "sandbox_snapshot_duration_seconds", "Time to write sandbox sessions to disk (save) and load them back (restore)",
+    ("operation", "outcome"), buckets=THROUGHPUT_BUCKETS,
+)
+
+
+@contextmanager
+def _interpreter_metrics(state: Dict[str, Any]) -> Iterator[None]:
+    outcome = "success"
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        INTERPRETER_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+        operations = state.get("_operations_count") or {}
+        INTERPRETER_OPERATIONS.observe(operations.get("counter", 0), outcome=outcome)
+
+
+def instrument_checkpointer(checkpointer):
+    """Time and trace the reads and writes of a LangGraph checkpointer, by wrapping its methods on the instance"""
+
+    def wrap(method: Callable, operation: str) -> Callable:
+        @functools.wraps(method)
+        def timed_method(*args, **kwargs):
+            with span(f"checkpoint.{operation}"), timed(CHECKPOINT_SECONDS, operation=operation):
+                return method(*args, **kwargs)
+
+        return timed_method
+
+    for operation in ("get_tuple", "put", "put_writes"):
+        setattr(checkpointer, operation, wrap(getattr(checkpointer, operation), operation))
+    return checkpointer
+
+
+register_execution_hook(_interpreter_metrics)
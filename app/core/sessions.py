@@ -0,0 +1,441 @@
+import sys
+import time
+import shutil
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..config.settings import (
+    SANDBOX_SESSION_MAX_BYTES,
+    SANDBOX_MAX_TOTAL_BYTES,
+    SANDBOX_MAX_SESSIONS,
+    SANDBOX_SNAPSHOTS_ENABLED,
+    SANDBOX_SNAPSHOT_DIR,
+    SANDBOX_SPILL_IDLE_SECONDS,
+    SANDBOX_SNAPSHOT_RETENTION_SECONDS,
+    CHART_LINE_PREFIX,
+)
+from .interpreter_tool import InterpreterError, LocalPythonExecutor
+from .memo import StatementMemo
+from .metrics import (
+    REGISTRY,
+    SANDBOX_EVICTIONS,
+    SANDBOX_MEMORY_BYTES,
+    SANDBOX_SESSIONS,
+    SANDBOX_SNAPSHOT_SECONDS,
+    timed,
+)
+from .snapshots import has_snapshot, purge_snapshots, restore_snapshot, save_snapshot, snapshot_path
+
+logger = logging.getLogger(__name__)
+
+# Entries of the executor state that belong to the interpreter rather than to the code
+INTERNAL_STATE_KEYS = ("_print_outputs", "_operations_count")
+# Eviction notices kept for sessions that have not come back yet
+MAX_EVICTION_NOTICES = 1000
+
+
+class SandboxMemoryError(InterpreterError):
+    """Raised when a sandbox session cannot keep its variables within its memory quota or the global budget"""
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def state_nbytes(values: Any) -> int:
+    """
+    Memory held by a sandbox value, containers included: DataFrames, Series and indexes by
+    `memory_usage(deep=True)`, arrays by the buffer they view, other objects by `sys.getsizeof`. Objects reachable
+    several times are counted once; modules, classes and functions are not counted.
+    """
+    import numpy as np
+    import pandas as pd
+
+    seen = set()
+    total = 0
+    stack = [values]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        if isinstance(value, pd.DataFrame):
+            total += int(value.memory_usage(deep=True, index=True).sum())
+        elif isinstance(value, (pd.Series, pd.Index)):
+            total += int(value.memory_usage(deep=True))
+        elif isinstance(value, np.ndarray):
+            base = value
+            while isinstance(base.base, np.ndarray):
+                base = base.base
+            if base is not value and id(base) in seen:
+                continue
+            seen.add(id(base))
+            total += int(base.nbytes)
+        elif isinstance(value, dict):
+            total += sys.getsizeof(value)
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            total += sys.getsizeof(value)
+            stack.extend(value)
+        elif isinstance(value, (ModuleType, type)) or callable(value):
+            continue
+        else:
+            total += sys.getsizeof(value)
+    return total
+
+
+class SandboxSession:
+    """The interpreter state of one conversation thread"""
+
+    def __init__(self, session_id: str, executor: LocalPythonExecutor, notice: Optional[str] = None):
+        self.session_id = session_id
+        self.executor = executor
+        self.lock = threading.Lock()
+        self.nbytes = 0
+        self.executions = 0
+        self.last_used = time.time()
+        # Why the thread's previous session was evicted, reported with errors until an execution succeeds
+        self.notice = notice
+        # Snapshot of the thread's session on disk, loaded before the next execution
+        self.snapshot: Optional[Path] = None
+        # Size of each variable, with the fingerprint of the value it was measured for
+        self._sizes: Dict[str, Tuple[Tuple, int]] = {}
+
+    def variables(self) -> Dict[str, Any]:
+        return {key: value for key, value in self.executor.state.items() if key not in INTERNAL_STATE_KEYS}
+
+    def variables_nbytes(self) -> int:
+        """
+        Memory held by the session's variables, measured with `state_nbytes`. Only variables bound to another object,
+        changed in place as far as the statement memo can tell, or of another shape or length are measured again;
+        variables bound to the same object are counted once.
+        """
+        versions = self.executor.statement_memo.versions
+        sizes: Dict[str, Tuple[Tuple, int]] = {}
+        # Size of each object, by id, measured in this pass
+        counted: Dict[int, int] = {}
+        for name, value in self.variables().items():
+            shape = getattr(value, "shape", None)
+            if not isinstance(shape, tuple):
+                shape = len(value) if isinstance(value, (dict, list, set)) else None
+            fingerprint = (id(value), versions.get(name, 0), shape)
+            cached = self._sizes.get(name)
+            if cached is not None and cached[0] == fingerprint:
+                size = cached[1]
+            else:
+                size = counted[id(value)] if id(value) in counted else state_nbytes(value)
+            sizes[name] = (fingerprint, size)
+            counted.setdefault(id(value), size)
+        self._sizes = sizes
+        return sum(counted.values())
+
+
+class SandboxSessionManager:
+    """
+    Sandbox sessions kept per conversation thread, with their memory accounted.
+
+    Variables defined by code stay available to later executions of the same thread. After every execution the
+    session's variables are measured (see `SandboxSession.variables_nbytes`). A session over `max_session_bytes`, or
+    whose code ran out of memory, has its variables cleared and the execution fails with `SandboxMemoryError`, so the
+    agent can retry with less data. When all sessions together exceed `max_total_bytes`, or there are more than
+    `max_sessions`, the least recently used idle sessions are evicted first; the executing session is evicted only if
+    it alone is too large.
+
+    With a `snapshot_dir`, evicted sessions are written to disk instead of being discarded, as are sessions idle for
+    `spill_idle_seconds` (see `spill_idle`), and the next execution of their thread loads them back before running.
+    Snapshots are moved rather than copied: restoring one deletes it, so a thread's session lives either in memory or
+    on disk. Snapshots never restored are deleted after `snapshot_retention` seconds.
+    """
+
+    def __init__(
+        self,
+        max_session_bytes: int = SANDBOX_SESSION_MAX_BYTES,
+        max_total_bytes: int = SANDBOX_MAX_TOTAL_BYTES,
+        max_sessions: int = SANDBOX_MAX_SESSIONS,
+        snapshot_dir: Optional[Path] = SANDBOX_SNAPSHOT_DIR if SANDBOX_SNAPSHOTS_ENABLED else None,
+        spill_idle_seconds: float = SANDBOX_SPILL_IDLE_SECONDS,
+        snapshot_retention: float = SANDBOX_SNAPSHOT_RETENTION_SECONDS,
+    ):
+        self.max_session_bytes = max_session_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_sessions = max(1, max_sessions)
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir is not None else None
+        self.spill_idle_seconds = spill_idle_seconds
+        self.snapshot_retention = snapshot_retention
+        self._sessions: "OrderedDict[str, SandboxSession]" = OrderedDict()
+        # Sessions taken out of memory and being written to disk
+        self._spilling: Dict[str, SandboxSession] = {}
+        self._notices: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "executions": 0, "evictions": 0, "refused": 0, "spilled": 0, "restored": 0}
+
+    def _total_bytes(self) -> int:
+        return sum(session.nbytes for session in self._sessions.values())
+
+    def _acquire(
+        self, session_id: str, authorized_imports: List[str], tools: Optional[Dict[str, Callable]]
+    ) -> SandboxSession:
+        victims: List[SandboxSession] = []
+        with self._lock:
+            # A session being written to disk is returned so that the caller waits on its lock
+            session = self._sessions.get(session_id) or self._spilling.get(session_id)
+            if session is None:
+                executor = LocalPythonExecutor(additional_authorized_imports=authorized_imports, additional_tools=tools)
+                executor.statement_memo = StatementMemo(measure=state_nbytes)
+                session = SandboxSession(session_id, executor, notice=self._notices.pop(session_id, None))
+                if self.snapshot_dir is not None and has_snapshot(snapshot_path(self.snapshot_dir, session_id)):
+                    session.snapshot = snapshot_path(self.snapshot_dir, session_id)
+                self._sessions[session_id] = session
+                self._stats["created"] += 1
+                victims = self._enforce_budget(keep=session)
+            elif session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+        self._spill(victims, "budget")
+        return session
+
+    def _evict(self, session: SandboxSession, reason: str, notice: str) -> None:
+        # Called with the manager lock held, and with the session's lock held or known to be free
+        if self._sessions.get(session.session_id) is session:
+            del self._sessions[session.session_id]
+        session.executor.state.clear()
+        session.executor.statement_memo.clear()
+        self._notices[session.session_id] = notice
+        while len(self._notices) > MAX_EVICTION_NOTICES:
+            self._notices.popitem(last=False)
+        self._stats["evictions"] += 1
+        SANDBOX_EVICTIONS.inc(reason=reason)
+        logger.info(f"Evicted sandbox session {session.session_id} ({_format_bytes(session.nbytes)}): {reason}")
+
+    def _take(self, session: SandboxSession) -> None:
+        # Called with the manager lock and the session's lock held: the session is then written to disk by `_spill`
+        del self._sessions[session.session_id]
+        self._spilling[session.session_id] = session
+
+    def _spill(self, sessions: List[SandboxSession], reason: str) -> None:
+        """Write sessions taken with `_take` to disk and free their memory, then release their locks"""
+        for session in sessions:
+            try:
+                variables = session.variables()
+                # A session whose snapshot was never loaded has nothing newer to write
+                if session.snapshot is None and (variables or session.executor.custom_tools):
+                    path = snapshot_path(self.snapshot_dir, session.session_id)
+                    with timed(SANDBOX_SNAPSHOT_SECONDS, operation="save"):
+                        size, _ = save_snapshot(path, session.session_id, session.executor, list(variables))
+                    logger.info(f"Wrote sandbox session {session.session_id} to disk ({_format_bytes(size)}): {reason}")
+                with self._lock:
+                    self._stats["spilled"] += 1
+            except Exception as e:
+                logger.warning(f"Could not write sandbox session {session.session_id} to disk: {type(e).__name__}: {e}")
+                with self._lock:
+                    self._evict(
+                        session, reason, "The variables of earlier executions were cleared to free memory."
+                    )
+            finally:
+                session.executor.state.clear()
+                session.executor.custom_tools.clear()
+                session.executor.statement_memo.clear()
+                with self._lock:
+                    self._spilling.pop(session.session_id, None)
+                session.lock.release()
+
+    def _restore(self, session: SandboxSession) -> None:
+        # Called with the session's lock held
+        path, session.snapshot = session.snapshot, None
+        try:
+            with timed(SANDBOX_SNAPSHOT_SECONDS, operation="restore"):
+                lost = restore_snapshot(path, session.executor)
+        except Exception as e:
+            logger.warning(f"Could not restore sandbox session {session.session_id}: {type(e).__name__}: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            session.notice = "The variables of earlier executions could not be restored and were cleared."
+            return
+        with self._lock:
+            self._stats["restored"] += 1
+        if lost:
+            session.notice = (
+                f"These variables of earlier executions could not be kept and must be recreated: {', '.join(lost)}."
+            )
+
+    def _enforce_budget(self, keep: SandboxSession) -> List[SandboxSession]:
+        # Called with the manager lock held; sessions running code are skipped. With snapshots, the sessions to evict
+        # are taken and returned, for the caller to pass to `_spill` once it has released the manager lock
+        victims = []
+        for session in list(self._sessions.values()):
+            if self._total_bytes() <= self.max_total_bytes and len(self._sessions) <= self.max_sessions:
+                break
+            if session is keep or not session.lock.acquire(blocking=False):
+                continue
+            if self.snapshot_dir is not None:
+                self._take(session)
+                victims.append(session)
+                continue
+            try:
+                self._evict(
+                    session,
+                    "budget",
+                    "The variables of earlier executions were cleared to free memory for other sessions.",
+                )
+            finally:
+                session.lock.release()
+        return victims
+
+    def _account(self, session: SandboxSession, out_of_memory: bool) -> None:
+        # Called with the session's lock held
+        # Values kept for reuse by the statement memo count too
+        memo = session.executor.statement_memo
+        session.nbytes = 0 if out_of_memory else session.variables_nbytes() + memo.nbytes
+        if session.nbytes > self.max_session_bytes and memo.nbytes:
+            # The memo's copies are given up before the session's own variables
+            memo.drop_values()
+            session.nbytes = session.variables_nbytes()
+        session.last_used = time.time()
+        session.executions += 1
+        victims: List[SandboxSession] = []
+        reason = None
+        with self._lock:
+            self._stats["executions"] += 1
+            if out_of_memory:
+                reason, problem = "out_of_memory", "The code ran out of memory"
+            elif session.nbytes > self.max_session_bytes:
+                reason = "session_quota"
+                problem = (
+                    f"The session's variables use {_format_bytes(session.nbytes)}, over the quota of "
+                    f"{_format_bytes(self.max_session_bytes)} per session"
+                )
+            else:
+                victims = self._enforce_budget(keep=session)
+                if self._total_bytes() > self.max_total_bytes and memo.nbytes:
+                    memo.drop_values()
+                    session.nbytes = session.variables_nbytes()
+                if self._total_bytes() > self.max_total_bytes:
+                    reason = "budget"
+                    problem = (
+                        f"The session's variables use {_format_bytes(session.nbytes)}, more than the sandbox memory "
+                        f"budget of {_format_bytes(self.max_total_bytes)} leaves available"
+                    )
+        self._spill(victims, "budget")
+        if reason is None:
+            return
+        with self._lock:
+            self._stats["refused"] += 1
+            message = (
+                f"{problem}; all its variables were cleared. Work on less data at once: load only the needed "
+                f"columns, filter rows early, use smaller dtypes and `del` intermediate results."
+            )
+            self._evict(session, reason, message)
+        raise SandboxMemoryError(message)
+
+    def execute(
+        self,
+        session_id: str,
+        code: str,
+        authorized_imports: List[str],
+        tools: Optional[Dict[str, Callable]] = None,
+    ) -> Tuple[Any, List[str], List[str]]:
+        """
+        Run code in the thread's session, creating it if needed. Returns the value of its last statement, the
+        statements skipped because they already ran with the same inputs and the charts announced in its print outputs
+        """
+        while True:
+            session = self._acquire(session_id, authorized_imports, tools)
+            session.lock.acquire()
+            # The session may have been evicted between the lookup and the lock
+            if self._sessions.get(session_id) is session:
+                break
+            session.lock.release()
+        try:
+            if session.snapshot is not None:
+                self._restore(session)
+            try:
+                output, logs, _ = session.executor(code)
+            except Exception as e:
+                out_of_memory = isinstance(e, MemoryError) or isinstance(e.__context__, MemoryError)
+                self._account(session, out_of_memory)
+                if session.notice:
+                    raise InterpreterError(f"{e}\nNote: {session.notice}") from e
+                raise
+            self._account(session, out_of_memory=False)
+            session.notice = None
+            charts = [
+                line[len(CHART_LINE_PREFIX):].strip()
+                for line in logs.splitlines()
+                if line.startswith(CHART_LINE_PREFIX)
+            ]
+            return output, list(session.executor.statement_memo.reused), charts
+        finally:
+            session.lock.release()
+
+    def spill_idle(self, max_idle: Optional[float] = None) -> int:
+        """
+        Write the sessions unused for `max_idle` seconds (by default `spill_idle_seconds`, 0 for all of them) to disk
+        and delete expired snapshots. Sessions running code are skipped. Returns the number of sessions written
+        """
+        if self.snapshot_dir is None:
+            return 0
+        cutoff = time.time() - (self.spill_idle_seconds if max_idle is None else max_idle)
+        victims = []
+        with self._lock:
+            for session in list(self._sessions.values()):
+                if session.last_used <= cutoff and session.lock.acquire(blocking=False):
+                    self._take(session)
+                    victims.append(session)
+        self._spill(victims, "idle")
+        purge_snapshots(self.snapshot_dir, self.snapshot_retention)
+        return len(victims)
+
+    def drop(self, session_id: str) -> bool:
+        """Forget a thread's session and its variables, in memory and on disk"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None) or self._spilling.get(session_id)
+        dropped = session is not None
+        if session is not None:
+            # Waits for a write to disk in progress, whose snapshot is deleted below
+            with session.lock:
+                session.executor.state.clear()
+                session.executor.statement_memo.clear()
+        if self.snapshot_dir is not None and has_snapshot(snapshot_path(self.snapshot_dir, session_id)):
+            shutil.rmtree(snapshot_path(self.snapshot_dir, session_id), ignore_errors=True)
+            dropped = True
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            sessions = sorted(self._sessions.values(), key=lambda session: session.nbytes, reverse=True)
+            return {
+                **self._stats,
+                "sessions": len(sessions),
+                "bytes": sum(session.nbytes for session in sessions),
+                "max_total_bytes": self.max_total_bytes,
+                "max_session_bytes": self.max_session_bytes,
+                "max_sessions": self.max_sessions,
+                "snapshot_dir": str(self.snapshot_dir) if self.snapshot_dir is not None else None,
+                "largest": [
+                    {
+                        "session_id": session.session_id,
+                        "bytes": session.nbytes,
+                        "executions": session.executions,
+                        "idle_seconds": now - session.last_used,
+                    }
+                    for session in sessions[:10]
+                ],
+            }
+
+
+def _collect_metrics() -> None:
+    with sandbox_sessions._lock:
+        SANDBOX_MEMORY_BYTES.set(sandbox_sessions._total_bytes())
+        SANDBOX_SESSIONS.set(len(sandbox_sessions._sessions))
+
+
+sandbox_sessions = SandboxSessionManager()
+REGISTRY.add_collector(_collect_metrics)
@@ -0,0 +1,236 @@
+import io
+import os
+import ast
+import json
+import time
+import uuid
+import pickle
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict, List, Optional, Tuple
+
+from .interpreter_tool import LocalPythonExecutor, create_function, evaluate_import
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+# The values without a file format of their own, pickled together
+PICKLED_VALUES = "values.pkl"
+# Series names kept in the manifest; other names send the Series to pickle
+SERIES_NAME_TYPES = (str, int, type(None))
+
+
+def snapshot_path(directory: Path, session_id: str) -> Path:
+    # Thread ids come from clients, so snapshot directories are named by their hash
+    return Path(directory) / hashlib.sha1(session_id.encode()).hexdigest()
+
+
+def has_snapshot(path: Path) -> bool:
+    return (path / MANIFEST).is_file()
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """Pickles references to values saved in files of their own as the index of their entry"""
+
+    def __init__(self, file, saved: Dict[int, int]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.saved = saved
+
+    def persistent_id(self, obj: Any) -> Optional[int]:
+        return self.saved.get(id(obj))
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file, loaded: Dict[int, Any]):
+        super().__init__(file)
+        self.loaded = loaded
+
+    def persistent_load(self, index: int) -> Any:
+        if index not in self.loaded:
+            raise pickle.UnpicklingError(f"Value {index} referenced by a pickled value was not restored")
+        return self.loaded[index]
+
+
+def _save_value(value: Any, directory: Path, stem: str) -> Optional[Dict[str, Any]]:
+    """Save a value that has a file format or a description of its own; None for values to pickle"""
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(value, ModuleType):
+        return {"kind": "module", "module": value.__name__}
+    if callable(value) and hasattr(value, "__source__"):
+        return {"kind": "function", "source": value.__source__}
+    try:
+        if isinstance(value, pd.DataFrame):
+            value.to_parquet(directory / f"{stem}.parquet")
+            return {"kind": "dataframe", "file": f"{stem}.parquet"}
+        if isinstance(value, pd.Series) and isinstance(value.name, SERIES_NAME_TYPES):
+            value.to_frame(name="values").to_parquet(directory / f"{stem}.parquet")
+            return {"kind": "series", "file": f"{stem}.parquet", "series_name": value.name}
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            np.save(directory / f"{stem}.npy", value, allow_pickle=False)
+            return {"kind": "array", "file": f"{stem}.npy"}
+    except Exception as e:
+        # Parquet only takes string column names and columns of one type; anything else is pickled
+        logger.debug(f"Pickling {type(value).__name__} instead of a columnar file: {type(e).__name__}: {e}")
+        for partial in directory.glob(f"{stem}.*"):
+            partial.unlink()
+    return None
+
+
+def _pickle_values(values: Dict[int, Any], path: Path, saved: Dict[int, int]) -> List[int]:
+    """
+    Pickle values together into one file, so the references they share survive, and references to values saved on
+    their own as those values. Returns the indexes of the values that cannot be pickled, which are left out
+    """
+    unpicklable: List[int] = []
+    try:
+        with open(path, "wb") as f:
+            _SnapshotPickler(f, saved).dump(values)
+        return unpicklable
+    except Exception:
+        pass
+    # Sandbox classes and their instances, generators, open files... are found one by one
+    for index, value in values.items():
+        try:
+            _SnapshotPickler(io.BytesIO(), saved).dump(value)
+        except Exception as e:
+            logger.debug(f"Cannot snapshot a {type(value).__name__}: {type(e).__name__}: {e}")
+            unpicklable.append(index)
+    with open(path, "wb") as f:
+        _SnapshotPickler(f, saved).dump({index: value for index, value in values.items() if index not in unpicklable})
+    return unpicklable
+
+
+def save_snapshot(
+    path: Path, session_id: str, executor: LocalPythonExecutor, names: List[str]
+) -> Tuple[int, List[str]]:
+    """
+    Write the variables `names` of an executor's state, and the functions defined by its code, to the directory `path`:
+    DataFrames and Series as Parquet, arrays as `.npy`, modules as the name to import again, sandbox functions as their
+    source and other values pickled together. Every object is saved once, so names bound to the same object, and
+    containers holding saved values, get back one shared object. The previous snapshot at `path` is replaced once the
+    new one is complete. Returns the bytes written and the names of values that could not be saved
+    """
+    temp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    temp_path.mkdir(parents=True)
+    entries: List[Dict[str, Any]] = []
+    skipped: List[str] = []
+    try:
+        values = [(name, executor.state[name], False) for name in names]
+        values += [(name, function, True) for name, function in executor.custom_tools.items()]
+        # Entry index of each object, of those saved on their own, and the values to pickle
+        first: Dict[int, int] = {}
+        saved: Dict[int, int] = {}
+        to_pickle: Dict[int, Any] = {}
+        for index, (name, value, tool) in enumerate(values):
+            entry: Dict[str, Any] = {"name": name, "tool": tool, "index": index}
+            entries.append(entry)
+            if id(value) in first:
+                entry.update(kind="alias", of=first[id(value)])
+                continue
+            first[id(value)] = index
+            description = _save_value(value, temp_path, str(index))
+            if description is None:
+                entry["kind"] = "pickle"
+                to_pickle[index] = value
+            else:
+                entry.update(description)
+                saved[id(value)] = index
+        if to_pickle:
+            unpicklable = set(_pickle_values(to_pickle, temp_path / PICKLED_VALUES, saved))
+            skipped = [entry["name"] for entry in entries if {entry["index"], entry.get("of")} & unpicklable]
+            entries = [entry for entry in entries if not {entry["index"], entry.get("of")} & unpicklable]
+        manifest = {"session_id": session_id, "created_at": time.time(), "variables": entries, "skipped": skipped}
+        with open(temp_path / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        size = sum(file.stat().st_size for file in temp_path.iterdir())
+        old_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.old")
+        if path.exists():
+            os.replace(path, old_path)
+        os.replace(temp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        return size, skipped
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+
+def _load_value(entry: Dict[str, Any], path: Path, executor: LocalPythonExecutor) -> Any:
+    import numpy as np
+    import pandas as pd
+
+    kind = entry["kind"]
+    if kind == "module":
+        scope: Dict[str, Any] = {}
+        evaluate_import(ast.parse(f"import {entry['module']} as module").body[0], scope, executor.authorized_imports)
+        return scope["module"]
+    if kind == "function":
+        definition = ast.parse(entry["source"]).body[0]
+        return create_function(
+            definition, executor.state, executor.static_tools, executor.custom_tools, executor.authorized_imports
+        )
+    if kind == "dataframe":
+        return pd.read_parquet(path / entry["file"])
+    if kind == "series":
+        return pd.read_parquet(path / entry["file"])["values"].rename(entry["series_name"])
+    if kind == "array":
+        return np.load(path / entry["file"], allow_pickle=False)
+    raise ValueError(f"Unknown snapshot entry kind: {kind}")
+
+
+def restore_snapshot(path: Path, executor: LocalPythonExecutor) -> List[str]:
+    """
+    Load the snapshot at `path` into an executor, functions into its custom tools and other values into its state, then
+    delete it. Returns the names of the values that were not saved or could not be loaded
+    """
+    with open(path / MANIFEST, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    lost = list(manifest["skipped"])
+    entries = [{"index": position, **entry} for position, entry in enumerate(manifest["variables"])]
+    loaded: Dict[int, Any] = {}
+    for entry in entries:
+        # Aliases are resolved, and pickled values loaded together, below
+        if entry["kind"] in ("alias", "pickle"):
+            continue
+        try:
+            loaded[entry["index"]] = _load_value(entry, path, executor)
+        except Exception as e:
+            logger.warning(f"Could not restore {entry['name']} from {path.name}: {type(e).__name__}: {e}")
+    if (path / PICKLED_VALUES).is_file():
+        try:
+            with open(path / PICKLED_VALUES, "rb") as f:
+                # Snapshots are written by this server only, so unpickling them is safe
+                loaded.update(_SnapshotUnpickler(f, loaded).load())
+        except Exception as e:
+            logger.warning(f"Could not restore the pickled values of {path.name}: {type(e).__name__}: {e}")
+    for entry in entries:
+        index = entry["of"] if entry["kind"] == "alias" else entry["index"]
+        if index not in loaded:
+            lost.append(entry["name"])
+        elif entry["tool"]:
+            executor.custom_tools[entry["name"]] = loaded[index]
+        else:
+            executor.state[entry["name"]] = loaded[index]
+    shutil.rmtree(path, ignore_errors=True)
+    return lost
+
+
+def purge_snapshots(directory: Path, max_age: float) -> int:
+    """Delete snapshots older than `max_age` seconds, with the leftovers of interrupted writes"""
+    if not Path(directory).is_dir():
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in Path(directory).iterdir():
+        try:
+            stale = path.stat().st_mtime < cutoff
+        except OSError:
+            continue
+        if stale:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
@@ -0,0 +1,148 @@
+import os
+import re
+import json
+import time
+import secrets
+import inspect
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from ..config.settings import TRACE_FILE
+
+logger = logging.getLogger(__name__)
+
+# W3C Trace Context header: version-trace_id-parent_id-flags
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_CURRENT = object()
+
+
+class Span:
+    """One timed operation of a trace; spans of a trace form a tree through `parent_id`"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Optional[Dict] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6 if self.end_ns else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class JsonLinesExporter:
+    """Append finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        try:
+            with self._lock:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+        except OSError as e:
+            logger.warning(f"Could not export span {span.name}: {e}")
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_exporter: Optional[JsonLinesExporter] = JsonLinesExporter(TRACE_FILE) if TRACE_FILE else None
+
+
+def set_exporter(exporter: Optional[JsonLinesExporter]) -> None:
+    """Replace the span exporter; None keeps propagating trace ids without exporting spans"""
+    global _exporter
+    _exporter = exporter
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Span]:
+    """The remote parent described by a `traceparent` header, or None when it is missing or malformed"""
+    match = TRACEPARENT_PATTERN.match((header or "").strip().lower())
+    if match is None or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    parent = Span("remote", match.group(1))
+    parent.span_id = match.group(2)
+    return parent
+
+
+@contextmanager
+def span(name: str, parent: Any = _CURRENT, **attributes: Any) -> Iterator[Span]:
+    """
+    Run the body in a span that is a child of `parent`, by default the current span (None starts a new trace), and
+    export it when it ends. Exceptions raised by the body mark the span as failed.
+    """
+    if parent is _CURRENT:
+        parent = _current_span.get()
+    if parent is None:
+        current = Span(name, secrets.token_hex(16), attributes=attributes)
+    else:
+        current = Span(name, parent.trace_id, parent.span_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        if _exporter is not None:
+            _exporter.export(current)
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorator running each call of a function, sync or async, in a span"""
+
+    def decorator(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
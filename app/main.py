@@ -1,11 +1,27 @@
-from fastapi import FastAPI, HTTPException
+import sys
+import time
+import asyncio
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 import os
 
 from .api.routes import analysis
-from .config.settings import API_V1_STR, PROJECT_NAME, UPLOAD_DIR
+from .services.jobs import job_manager
+from .core.sessions import sandbox_sessions
+from .services.warmup import warm_up
+from .core.metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, REGISTRY
+from .core.tracing import parse_traceparent, span
+from .config.settings import (
+    API_V1_STR,
+    PROJECT_NAME,
+    UPLOAD_DIR,
+    GZIP_MINIMUM_SIZE,
+    WARMUP_ON_STARTUP,
+    SANDBOX_SPILL_IDLE_SECONDS,
+)
 
 # Create the FastAPI app
 app = FastAPI(
@@ -25,18 +41,97 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files for uploads
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# Compress large responses such as long message histories
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
+
+def _route_template(request: Request) -> str:
+    # Path template of the matched route, so that paths with ids share a series
+    route = request.scope.get("route")
+    if route is None:
+        return "unmatched"
+    # FastAPI versions that include routers lazily match the router's own route, without the include prefix; the
+    # route as included, with its full path, is kept in the scope
+    included = request.scope.get("fastapi", {}).get("effective_route_context")
+    return getattr(included, "path", None) or route.path
+
+# Request latency by route
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, method=request.method, route=_route_template(request), status=str(status)
+        )
+
+# Every request runs in a span, continuing the caller's trace when it sends a `traceparent` header
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    parent = parse_traceparent(request.headers.get("traceparent"))
+    with span("http", parent=parent, method=request.method, path=request.url.path) as request_span:
+        response = await call_next(request)
+        request_span.name = f"{request.method} {_route_template(request)}"
+        request_span.set_attribute("status", response.status_code)
+    response.headers["traceparent"] = request_span.traceparent
+    response.headers["X-Trace-Id"] = request_span.trace_id
+    return response
+
+# Mount static files for uploads; the directory is created on startup
+app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR, check_dir=False), name="uploads")
 
 # Include API routes
 app.include_router(analysis.router, prefix=f"{API_V1_STR}/analysis", tags=["analysis"])
 
+async def spill_idle_sandbox_sessions():
+    # Checked a few times per idle period, so sessions stay in memory at most 25% longer than configured
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(max(1.0, SANDBOX_SPILL_IDLE_SECONDS / 4))
+        await loop.run_in_executor(None, sandbox_sessions.spill_idle)
+
+# Background services: reload persisted jobs on startup, optionally warm up, and stop them on shutdown, when sandbox
+# sessions are written to disk for the next process
+@app.on_event("startup")
+async def start_services():
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    job_manager.restore()
+    if sandbox_sessions.snapshot_dir is not None and SANDBOX_SPILL_IDLE_SECONDS > 0:
+        app.state.session_spiller = asyncio.create_task(spill_idle_sandbox_sessions())
+    if WARMUP_ON_STARTUP:
+        await asyncio.get_event_loop().run_in_executor(None, warm_up)
+
+@app.on_event("shutdown")
+async def stop_services():
+    await job_manager.shutdown()
+    spiller = getattr(app.state, "session_spiller", None)
+    if spiller is not None:
+        spiller.cancel()
+    await asyncio.get_event_loop().run_in_executor(None, sandbox_sessions.spill_idle, 0)
+    # The chart pool only exists once charts were rendered or the app warmed up
+    charts = sys.modules.get(f"{__package__}.services.charts")
+    if charts is not None:
+        charts.chart_pool.shutdown()
+
 # Root endpoint
 @app.get("/")
 async def root():
     return {"message": f"Welcome to {PROJECT_NAME}"}
 
+# Explicit warm-up, e.g. from a readiness probe or a deploy script before routing traffic to this worker
+@app.post("/warmup", include_in_schema=False)
+async def warmup():
+    timings = await asyncio.get_event_loop().run_in_executor(None, warm_up)
+    return {"seconds": timings}
+
+# Prometheus metrics
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
 # Error handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
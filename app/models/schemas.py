@@ -1,11 +1,42 @@
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Literal, Optional, Dict, Any, Union
 from pydantic import BaseModel, Field
 
+class ChartOptions(BaseModel):
+    format: Literal["png", "webp", "svg"] = Field("png", description="Image format of the charts")
+    dpi: Optional[int] = Field(None, ge=20, le=600, description="Resolution of raster charts")
+    compression: Optional[int] = Field(
+        None, ge=0, le=9, description="PNG zlib level, or WebP encoder effort; higher is smaller and slower"
+    )
+    quality: Optional[int] = Field(None, ge=1, le=100, description="WebP quality")
+    max_width: Optional[int] = Field(None, gt=0, le=16384, description="Maximum width of raster charts in pixels")
+    max_height: Optional[int] = Field(None, gt=0, le=16384, description="Maximum height of raster charts in pixels")
+
+
+class ChartRef(BaseModel):
+    path: Optional[str] = Field(None, description="Where the sandboxed code saved the chart")
+    chart_id: Optional[str] = Field(None, description="Content digest of the chart; null if it could not be cached")
+    url: Optional[str] = Field(None, description="Where the chart can be downloaded")
+    format: str
+    bytes: int
+
+
 class AnalysisRequest(BaseModel):
     query: str = Field(..., description="The analysis query or instruction")
     file_path: Optional[str] = Field(None, description="Path to a data file to analyze")
     code: Optional[str] = Field(None, description="Custom Python code to execute")
     thread_id: Optional[str] = Field("default", description="Thread ID for conversation continuity")
+    sampling: Literal["off", "on", "auto"] = Field(
+        "off",
+        description="Explore a deterministic sample of the data and compute final answers on the full data; "
+                    "'auto' turns it on for large datasets",
+    )
+    sample_rows: Optional[int] = Field(None, gt=0, description="Size of the exploration sample")
+    stratify_by: Optional[str] = Field(None, description="Column to stratify the exploration sample by")
+    message_mode: Literal["all", "delta", "none"] = Field(
+        "all",
+        description="Messages to return: the whole thread history, only those produced by this request, or none",
+    )
+    chart_options: Optional[ChartOptions] = Field(None, description="Output options of the charts drawn by the agent")
     
     
 class Message(BaseModel):
@@ -16,8 +47,77 @@ class AnalysisResponse(BaseModel):
     result: Any = Field(..., description="The result of the analysis")
     logs: Optional[str] = Field(None, description="Execution logs")
     messages: List[Message] = Field(default_factory=list, description="Conversation messages")
+    data_scope: Optional[str] = Field(None, description="Whether the result came from the 'sample' or the 'full' data")
+    message_offset: int = Field(0, description="Position of the first returned message in the thread history")
+    total_messages: Optional[int] = Field(None, description="Number of messages in the thread history")
+    charts: List[ChartRef] = Field(default_factory=list, description="Charts saved by the agent during this request")
+
+
+class MessagePage(BaseModel):
+    thread_id: str
+    messages: List[Message] = Field(default_factory=list, description="Messages of this page, oldest first")
+    total: int = Field(..., description="Number of messages in the thread history")
+    next_cursor: Optional[int] = Field(None, description="Cursor of the next page; null on the last page")
     
 
+class JobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description="queued, running, succeeded, failed or cancelled")
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+
+class BatchItem(AnalysisRequest):
+    thread_id: Optional[str] = Field(
+        None, description="Thread ID for conversation continuity; each item gets its own thread by default"
+    )
+
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem] = Field(..., min_length=1, description="Analyses to run, each with its query and file")
+
+
+class BatchItemResult(JobStatus):
+    index: int
+    result: Optional[AnalysisResponse] = None
+
+
+class BatchStatus(BaseModel):
+    batch_id: str
+    done: bool = Field(..., description="Whether every item has finished")
+    counts: Dict[str, int] = Field(..., description="Number of items per status")
+    timing: Dict[str, Optional[float]] = Field(..., description="Aggregate timing of the batch")
+    items: List[BatchItemResult]
+
+
+class FigureSpec(BaseModel):
+    kind: Literal["line", "bar", "scatter", "hist", "box"] = Field(..., description="Chart type")
+    data: Dict[str, List[Any]] = Field(..., description="Columns of the data to plot, by name")
+    x: Optional[str] = Field(None, description="Column on the x axis")
+    y: Optional[str] = Field(None, description="Column on the y axis")
+    hue: Optional[str] = Field(None, description="Column used to color the marks")
+    bins: Optional[int] = Field(None, gt=0, description="Number of bins of a histogram")
+    title: Optional[str] = None
+    xlabel: Optional[str] = None
+    ylabel: Optional[str] = None
+    width: float = Field(8, gt=0, le=40, description="Figure width in inches")
+    height: float = Field(5, gt=0, le=40, description="Figure height in inches")
+    dpi: int = Field(100, ge=20, le=600)
+    output: ChartOptions = Field(default_factory=ChartOptions, description="Output options; its dpi overrides `dpi`")
+
+
+class ChartResponse(BaseModel):
+    image_base64: Optional[str] = Field(None, description="The chart, only with delivery=base64")
+    format: str
+    bytes: int
+    render_ms: float
+    chart_id: str = Field(..., description="Content digest of the chart, also its ETag")
+    url: str = Field(..., description="Where the cached chart can be downloaded")
+    cached: bool = Field(False, description="Whether the chart was served from the chart cache")
+
+
 class ErrorResponse(BaseModel):
     error: str
     detail: Optional[str] = None
\ No newline at end of file
@@ -1,54 +1,166 @@
 import os
+import re
 import base64
-from typing import Dict, Any, Optional
+import asyncio
+from typing import Dict, Any, List, Optional
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from io import BytesIO
 import aiofiles
 
 from ..core.agent import DataAnalysisAgent
-from ..config.settings import UPLOAD_DIR
+from ..core.metrics import ANALYSIS_SECONDS, timed
+from ..core.tracing import current_span, traced
+from ..config.settings import UPLOAD_DIR, DEFAULT_SYSTEM_PROMPT, SAMPLE_ROWS, SAMPLING_AUTO_MIN_ROWS
+from .scheduler import RequestScheduler, request_scheduler
+from . import datasets  # noqa: F401  (installs the sandbox dataset readers)
+from .profiling import load_profile, format_profile
+from .sandbox import SANDBOX_TOOLS, describe_sandbox_tools
+# Importing the chart module also routes sandbox plt.savefig calls to the chart pool
+from .charts import chart_pool, chart_request, chart_url, savefig_options
+from . import plotting  # noqa: F401  (downsamples large line and scatter plots of sandboxed code)
+from . import figures  # noqa: F401  (saves and closes the figures sandboxed code leaves open)
+
+DATA_SCOPE_LABEL = "Data scope:"
+DATA_SCOPE_PATTERN = re.compile(r"data scope:\W*(sample|full)", re.IGNORECASE)
 
 class AnalysisService:
-    def __init__(self):
-        self.agent = DataAnalysisAgent()
+    def __init__(self, scheduler: Optional[RequestScheduler] = None):
+        self.agent = DataAnalysisAgent(
+            system_prompt=DEFAULT_SYSTEM_PROMPT + describe_sandbox_tools(),
+            sandbox_tools=SANDBOX_TOOLS,
+        )
+        self.scheduler = scheduler or request_scheduler
         
+    @traced("AnalysisService.process_analysis_request")
     async def process_analysis_request(self, 
                                      query: str, 
                                      file_path: Optional[str] = None,
                                      code: Optional[str] = None,
-                                     thread_id: str = "default") -> Dict[str, Any]:
+                                     thread_id: str = "default",
+                                     sampling: str = "off",
+                                     sample_rows: Optional[int] = None,
+                                     stratify_by: Optional[str] = None,
+                                     message_mode: str = "all",
+                                     chart_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Process an analysis request asynchronously"""
+        current_span().set_attribute("thread_id", thread_id)
         
         # Prepare the query with file path information if provided
         full_query = query
+        sampled = False
         if file_path:
             abs_file_path = os.path.join(UPLOAD_DIR, os.path.basename(file_path))
             # Use aiofiles for async file checking
             if await self._file_exists(abs_file_path):
                 full_query = f"Analyze the data from this file: {abs_file_path}\n\n{query}"
+                # Give the model the upload-time profile so it can skip the head/info/describe round trips
+                profile = await self._dataset_profile(abs_file_path)
+                if profile:
+                    full_query = (
+                        f"Analyze the data from this file: {abs_file_path}\n\n"
+                        f"Precomputed profile of this dataset (no need to inspect it with head/info/describe "
+                        f"before starting the analysis):\n{format_profile(profile)}\n\n{query}"
+                    )
+                sampled = sampling == "on" or (
+                    sampling == "auto" and profile is not None and profile["rows"] >= SAMPLING_AUTO_MIN_ROWS
+                )
+                if sampled:
+                    instructions = self._sampling_instructions(abs_file_path, sample_rows, stratify_by)
+                    full_query = f"{full_query}\n\n{instructions}"
         
         # Add custom code if provided
         if code:
             full_query = f"{full_query}\n\nUse this code as a starting point:\n```python\n{code}\n```"
+        chart_format = (chart_options or {}).get("format") or "png"
+        if chart_format != "png":
+            full_query = f"{full_query}\n\nSave charts as .{chart_format} files (public/charts/name.{chart_format})."
         
-        # Run the agent analysis
-        response = await self.agent.analyze(full_query, thread_id)
+        # Run the agent analysis once the scheduler admits it; charts saved by its code follow the output options
+        async with self.scheduler.slot(thread_id):
+            with chart_request(chart_options) as charts, timed(ANALYSIS_SECONDS, model=self.agent.model_name):
+                response = await self.agent.analyze(full_query, thread_id)
         
         # Extract the result
         messages = response.get("messages", [])
         last_message = messages[-1] if messages else None
         content = last_message.content if last_message else ""
         
+        # The checkpointed history grows with every turn; delta mode only returns this request's messages
+        if message_mode == "delta":
+            offset = self._turn_start(messages)
+        elif message_mode == "none":
+            offset = len(messages)
+        else:
+            offset = 0
+        
         return {
             "result": content,
-            "messages": [{
-                "role": msg.type,
-                "content": msg.content
-            } for msg in messages]
+            "messages": self._message_dicts(messages[offset:]),
+            "data_scope": self._data_scope(messages) if sampled else None,
+            "message_offset": offset,
+            "total_messages": len(messages),
+            "charts": charts,
+        }
+
+    async def get_thread_messages(self, thread_id: str, cursor: int = 0, limit: int = 50) -> Dict[str, Any]:
+        """One page of a thread's message history, starting at position `cursor`"""
+        messages = await self.agent.get_messages(thread_id)
+        end = cursor + limit
+        return {
+            "thread_id": thread_id,
+            "messages": self._message_dicts(messages[cursor:end]),
+            "total": len(messages),
+            "next_cursor": end if end < len(messages) else None,
         }
+
+    @staticmethod
+    def _message_dicts(messages: List[Any]) -> List[Dict[str, Any]]:
+        return [{"role": msg.type, "content": msg.content} for msg in messages]
+
+    @staticmethod
+    def _turn_start(messages: List[Any]) -> int:
+        """Position of the human message that started the latest turn"""
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index].type == "human":
+                return index
+        return 0
+
+    def _sampling_instructions(self, file_path: str, sample_rows: Optional[int], stratify_by: Optional[str]) -> str:
+        """Prompt section switching the agent to sample-based exploration"""
+        rows = sample_rows or SAMPLE_ROWS
+        arguments = f"'{file_path}', rows={rows}"
+        if stratify_by:
+            arguments += f", stratify_by={stratify_by!r}"
+        return (
+            f"Sampling mode: explore this dataset (head, describe, value counts, distribution plots) on the "
+            f"deterministic sample returned by `load_sample({arguments})` instead of loading the whole file. "
+            f"Compute the figures of your final answer on the full data (pd.read_csv or the chunked tools). "
+            f"End your answer with the line `{DATA_SCOPE_LABEL} full` if its figures come from the full data, "
+            f"or `{DATA_SCOPE_LABEL} sample` if any of them come from the sample."
+        )
+
+    def _data_scope(self, messages: List[Any]) -> Optional[str]:
+        """Whether the answer of the last turn was computed on the sample or on the full data"""
+        if not messages:
+            return None
+        labels = DATA_SCOPE_PATTERN.findall(str(messages[-1].content))
+        if labels:
+            return labels[-1].lower()
+        # Unlabelled answer: judge from the last code the agent ran in this turn
+        for msg in reversed(messages):
+            if msg.type == "human":
+                break
+            for tool_call in getattr(msg, "tool_calls", None) or []:
+                if tool_call["name"] == "python_tool":
+                    return "sample" if "load_sample(" in str(tool_call["args"].get("code", "")) else "full"
+        return None
     
+    async def _dataset_profile(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """Load the upload-time profile of a dataset"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, load_profile, file_path)
+
     async def _file_exists(self, file_path: str) -> bool:
         """Check if file exists asynchronously"""
         try:
@@ -59,11 +171,39 @@ class AnalysisService:
         except:
             return os.path.exists(file_path)  # Fallback
     
-    def generate_plot_base64(self, plt_figure):
-        """Convert a matplotlib figure to base64 encoded string"""
-        buf = BytesIO()
-        plt_figure.savefig(buf, format='png', bbox_inches='tight')
-        buf.seek(0)
-        img_str = base64.b64encode(buf.read()).decode('utf-8')
-        buf.close()
-        return img_str
\ No newline at end of file
+    async def generate_plot(self, plt_figure, chart_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Render a matplotlib figure in the chart pool and return a reference to it in the chart cache"""
+        options = {key: value for key, value in (chart_options or {}).items() if value is not None}
+        output = savefig_options(plt_figure, **options)
+        chart_id, image = await chart_pool.render_figure_cached_async(plt_figure, bbox_inches='tight', **output)
+        return {
+            "path": None,
+            "chart_id": chart_id,
+            "url": chart_url(chart_id) if chart_id is not None else None,
+            "format": output["format"],
+            "bytes": len(image),
+        }
+
+    def generate_plot_base64(self, plt_figure, chart_options: Optional[Dict[str, Any]] = None):
+        """Convert a matplotlib figure to base64 encoded string, rendering it in the chart pool (blocks until done)"""
+        options = {key: value for key, value in (chart_options or {}).items() if value is not None}
+        image = chart_pool.render_figure(plt_figure, bbox_inches='tight', **savefig_options(plt_figure, **options))
+        return base64.b64encode(image).decode('utf-8')
+
+    async def generate_plot_base64_async(self, plt_figure, chart_options: Optional[Dict[str, Any]] = None):
+        """`generate_plot_base64` for coroutines: waits for the chart pool without blocking the event loop"""
+        options = {key: value for key, value in (chart_options or {}).items() if value is not None}
+        image = await chart_pool.render_figure_async(
+            plt_figure, bbox_inches='tight', **savefig_options(plt_figure, **options)
+        )
+        return base64.b64encode(image).decode('utf-8')
+
+_shared_service: Optional[AnalysisService] = None
+
+
+def get_analysis_service() -> AnalysisService:
+    """Process-wide AnalysisService, so that its agent and checkpointer connection are only built once"""
+    global _shared_service
+    if _shared_service is None:
+        _shared_service = AnalysisService()
+    return _shared_service
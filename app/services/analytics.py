@@ -0,0 +1,179 @@
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+OUTLIER_METHODS = ("iqr", "zscore", "mad")
+# Default cutoffs: IQR multiplier, |z| and |robust z|
+DEFAULT_OUTLIER_THRESHOLDS = {"iqr": 1.5, "zscore": 3.0, "mad": 3.5}
+
+
+def _as_list(value: Union[str, Sequence[str]]) -> List[str]:
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _numeric_columns(df: pd.DataFrame, exclude: Sequence[str] = ()) -> List[str]:
+    return [column for column in df.select_dtypes(include="number").columns if column not in exclude]
+
+
+def group_summary(
+    df: pd.DataFrame,
+    by: Union[str, Sequence[str]],
+    values: Optional[Union[str, Sequence[str]]] = None,
+    aggs: Union[str, Sequence[str]] = ("count", "mean", "sum"),
+) -> pd.DataFrame:
+    """
+    Aggregate `values` (default: all numeric columns) by the `by` columns in one pass, e.g. aggs=("sum", "mean",
+    "median", "std", "min", "max", "nunique"). Returns one row per group with flat columns named like `amount_mean`.
+    Use instead of loops that accumulate per-group totals in dicts.
+    """
+    by = _as_list(by)
+    values = _numeric_columns(df, exclude=by) if values is None else _as_list(values)
+    summary = df.groupby(by, observed=True, dropna=False)[values].agg(_as_list(aggs))
+    summary.columns = [f"{value}_{agg}" for value, agg in summary.columns]
+    return summary.reset_index()
+
+
+def top_n_per_group(
+    df: pd.DataFrame, by: Union[str, Sequence[str]], column: str, n: int = 5, ascending: bool = False
+) -> pd.DataFrame:
+    """
+    The `n` rows with the largest `column` in each group of `by` (the smallest with ascending=True), sorted by group
+    and then by `column`. Use instead of looping over groups to sort and slice each one.
+    """
+    by = _as_list(by)
+    ordered = df.sort_values(column, ascending=ascending, kind="stable")
+    top = ordered.groupby(by, observed=True, dropna=False).head(n)
+    return top.sort_values(by + [column], ascending=[True] * len(by) + [ascending], kind="stable")
+
+
+def rank_within(
+    df: pd.DataFrame,
+    by: Optional[Union[str, Sequence[str]]],
+    column: str,
+    ascending: bool = False,
+    method: str = "dense",
+    pct: bool = False,
+) -> pd.Series:
+    """
+    Rank of every row's `column` within its group of `by` (over all rows when by is None), aligned with `df` so it can
+    be assigned as a column. Rank 1 is the largest value unless ascending=True; `method` ("dense", "min", "first",
+    "average") and `pct` are as in `Series.rank`.
+    """
+    if by is None:
+        return df[column].rank(method=method, ascending=ascending, pct=pct)
+    grouped = df.groupby(_as_list(by), observed=True, dropna=False)[column]
+    return grouped.rank(method=method, ascending=ascending, pct=pct)
+
+
+def pivot_summary(
+    df: pd.DataFrame,
+    index: Union[str, Sequence[str]],
+    columns: Union[str, Sequence[str]],
+    values: str,
+    agg: str = "sum",
+    fill_value: Any = 0,
+    totals: bool = False,
+) -> pd.DataFrame:
+    """
+    Cross-tabulate `values` aggregated with `agg` ("sum", "mean", "count", "median"...) with `index` groups as rows
+    and `columns` groups as columns, filling empty cells with `fill_value`. totals=True adds a "Total" row and column.
+    """
+    return pd.pivot_table(
+        df,
+        index=index,
+        columns=columns,
+        values=values,
+        aggfunc=agg,
+        fill_value=fill_value,
+        margins=totals,
+        margins_name="Total",
+        observed=True,
+    )
+
+
+def top_correlations(
+    df: pd.DataFrame,
+    columns: Optional[Sequence[str]] = None,
+    target: Optional[str] = None,
+    method: str = "pearson",
+    top: Optional[int] = 20,
+    min_abs: float = 0.0,
+) -> pd.DataFrame:
+    """
+    Pairs of numeric `columns` (default: all) ordered by absolute correlation, as a table with columns `left`,
+    `right`, `correlation` and `n` (rows where both values are present). With `target`, only the correlations of
+    that column with the others. `method` is "pearson", "spearman" or "kendall"; pairs below `min_abs` are dropped
+    and at most `top` are returned (None for all).
+    """
+    columns = _numeric_columns(df) if columns is None else list(columns)
+    if target is not None and target not in columns:
+        columns = [target] + columns
+    data = df[columns]
+    matrix = data.corr(method=method).to_numpy()
+    present = data.notna().to_numpy(dtype="float64")
+    counts = present.T @ present
+    if target is None:
+        left, right = np.triu_indices(len(columns), k=1)
+    else:
+        right = np.array([i for i, column in enumerate(columns) if column != target], dtype=np.intp)
+        left = np.full(len(right), columns.index(target), dtype=np.intp)
+    pairs = pd.DataFrame(
+        {
+            "left": np.array(columns, dtype=object)[left],
+            "right": np.array(columns, dtype=object)[right],
+            "correlation": matrix[left, right],
+            "n": counts[left, right].astype("int64"),
+        }
+    )
+    pairs = pairs[pairs["correlation"].abs() >= min_abs].dropna(subset=["correlation"])
+    order = pairs["correlation"].abs().sort_values(ascending=False, kind="stable").index
+    pairs = pairs.loc[order].reset_index(drop=True)
+    return pairs if top is None else pairs.head(top)
+
+
+def find_outliers(
+    df: pd.DataFrame,
+    columns: Optional[Union[str, Sequence[str]]] = None,
+    method: str = "iqr",
+    threshold: Optional[float] = None,
+) -> pd.DataFrame:
+    """
+    Rows with an outlier in any of `columns` (default: all numeric), with a boolean `outlier_<column>` flag per column
+    and an `outlier_count`. `method` is "iqr" (outside Q1 - k*IQR .. Q3 + k*IQR, k=1.5), "zscore" (|z| > 3) or "mad"
+    (robust z from the median absolute deviation, or the mean absolute deviation where the MAD is 0, |z| > 3.5);
+    `threshold` replaces k or the z cutoff.
+    """
+    if method not in OUTLIER_METHODS:
+        raise ValueError(f"Unknown outlier method {method!r}; use one of {OUTLIER_METHODS}")
+    columns = _numeric_columns(df) if columns is None else _as_list(columns)
+    threshold = DEFAULT_OUTLIER_THRESHOLDS[method] if threshold is None else threshold
+    data = df[columns].astype("float64")
+    if method == "iqr":
+        q1, q3 = data.quantile(0.25), data.quantile(0.75)
+        spread = q3 - q1
+        flags = data.lt(q1 - threshold * spread) | data.gt(q3 + threshold * spread)
+    elif method == "zscore":
+        flags = ((data - data.mean()) / data.std()).abs().gt(threshold)
+    else:
+        median = data.median()
+        deviation = (data - median).abs()
+        mad = deviation.median()
+        # MAD / 0.6745 and mean absolute deviation * 1.2533 both estimate the standard deviation of normal data; the
+        # latter stands in where more than half the values equal the median and the MAD is 0
+        scale = (mad / 0.6745).where(mad > 0, deviation.mean() * 1.2533)
+        flags = ((data - median) / scale).abs().gt(threshold)
+    flags.columns = [f"outlier_{column}" for column in columns]
+    count = flags.sum(axis=1)
+    result = pd.concat([df, flags], axis=1).assign(outlier_count=count)
+    return result[count > 0]
+
+
+ANALYTICS_TOOLS: Dict[str, Any] = {
+    "group_summary": group_summary,
+    "top_n_per_group": top_n_per_group,
+    "rank_within": rank_within,
+    "pivot_summary": pivot_summary,
+    "top_correlations": top_correlations,
+    "find_outliers": find_outliers,
+}
@@ -0,0 +1,128 @@
+import os
+import re
+import uuid
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from ..config.settings import CHART_CACHE_DIR, CHART_CACHE_MAX_BYTES
+
+CHART_ID_PATTERN = re.compile(r"^([0-9a-f]{64})\.([a-z0-9]+)$")
+CHART_MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "webp": "image/webp",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "pdf": "application/pdf",
+}
+
+
+class ChartCache:
+    """
+    Disk cache of rendered charts, keyed by a digest of everything that determines the image.
+
+    Entries are files named `<digest>.<format>` under `directory`, so they can be served directly with the digest as a
+    strong ETag. Their total size is kept under `max_bytes` by deleting the least recently used entries; the index is
+    rebuilt from the directory at startup, ordered by modification time.
+    """
+
+    def __init__(self, directory: Path = CHART_CACHE_DIR, max_bytes: int = CHART_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: Optional["OrderedDict[str, int]"] = None
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _index(self) -> "OrderedDict[str, int]":
+        # Called with the lock held
+        if self._entries is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            found = []
+            for path in self.directory.iterdir():
+                if CHART_ID_PATTERN.match(path.name):
+                    stat = path.stat()
+                    found.append((stat.st_mtime, path.name, stat.st_size))
+            self._entries = OrderedDict((name, size) for _, name, size in sorted(found))
+            self._bytes = sum(self._entries.values())
+        return self._entries
+
+    @staticmethod
+    def chart_id(digest: str, fmt: str) -> str:
+        return f"{digest}.{fmt.lower()}"
+
+    def path(self, chart_id: str) -> Path:
+        return self.directory / chart_id
+
+    def read(self, chart_id: str) -> Optional[bytes]:
+        """Return a cached chart and mark it recently used, or None on a miss"""
+        with self._lock:
+            entries = self._index()
+            if chart_id not in entries:
+                self._stats["misses"] += 1
+                return None
+            entries.move_to_end(chart_id)
+            self._stats["hits"] += 1
+        path = self.path(chart_id)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            # Deleted behind the index's back
+            with self._lock:
+                self._bytes -= self._entries.pop(chart_id, 0)
+            return None
+        return data
+
+    def __contains__(self, chart_id: str) -> bool:
+        with self._lock:
+            return chart_id in self._index()
+
+    def put(self, chart_id: str, data: bytes) -> Path:
+        """Store a rendered chart, evicting least recently used charts beyond the size budget"""
+        path = self.path(chart_id)
+        with self._lock:
+            self._index()
+        temp_path = self.directory / f".{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        evicted = []
+        with self._lock:
+            entries = self._index()
+            self._bytes += len(data) - entries.pop(chart_id, 0)
+            entries[chart_id] = len(data)
+            while self._bytes > self.max_bytes and len(entries) > 1:
+                name, size = entries.popitem(last=False)
+                self._bytes -= size
+                self._stats["evictions"] += 1
+                evicted.append(name)
+        for name in evicted:
+            self.path(name).unlink(missing_ok=True)
+        return path
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._index()
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def parse_chart_id(chart_id: str) -> Optional[Tuple[str, str]]:
+    """Split a chart id into its digest and format; None for anything that is not a chart id"""
+    match = CHART_ID_PATTERN.match(chart_id)
+    if match is None or match.group(2) not in CHART_MEDIA_TYPES:
+        return None
+    return match.group(1), match.group(2)
+
+
+chart_cache = ChartCache()
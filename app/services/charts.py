@@ -0,0 +1,447 @@
+import io
+import os
+import json
+import time
+import pickle
+import weakref
+import hashlib
+import asyncio
+import logging
+import threading
+import contextlib
+import contextvars
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.transforms import TransformNode
+
+from ..config.settings import (
+    API_V1_STR, CHART_RENDER_WORKERS, CHART_MAX_PENDING, CHART_RENDER_TIMEOUT, CHART_THEME, CHART_MAX_PIXELS,
+)
+from ..core.interpreter_tool import register_module_override
+from .chart_cache import ChartCache, chart_cache
+
+logger = logging.getLogger(__name__)
+
+# Seaborn plotting function behind each figure spec kind
+SPEC_PLOTTERS = {
+    "line": "lineplot",
+    "bar": "barplot",
+    "scatter": "scatterplot",
+    "hist": "histplot",
+    "box": "boxplot",
+}
+
+
+# Pillow settings of WebP charts when the request does not set them
+DEFAULT_WEBP_QUALITY = 80
+DEFAULT_WEBP_METHOD = 4
+
+# Output options and saved charts of the analysis request being served, see `chart_request`
+_chart_request: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("chart_request", default=None)
+
+
+class ChartRenderBusyError(Exception):
+    """Raised when no chart render slot frees up in time"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _init_worker(theme: str) -> None:
+    matplotlib.use("Agg")
+    import seaborn as sns
+
+    sns.set_theme(style=theme)
+
+
+def _encode(figure, options: Dict[str, Any]) -> bytes:
+    buffer = io.BytesIO()
+    figure.savefig(buffer, **options)
+    return buffer.getvalue()
+
+
+def savefig_options(
+    figure,
+    format: str = "png",
+    dpi: Any = None,
+    compression: Optional[int] = None,
+    quality: Optional[int] = None,
+    max_width: Optional[int] = None,
+    max_height: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    `savefig` arguments for chart output options (see `ChartOptions`). The DPI of raster charts is lowered so that the
+    figure fits in `max_width` x `max_height` pixels, and never exceeds `CHART_MAX_PIXELS` on either side.
+    """
+    fmt = format.lower()
+    if dpi is None:
+        dpi = plt.rcParams["savefig.dpi"]
+    # The savefig.dpi setting may itself be "figure"
+    if dpi == "figure":
+        dpi = figure.dpi
+    width, height = figure.get_size_inches()
+    limits = [CHART_MAX_PIXELS / max(width, height, 1e-9)]
+    if max_width:
+        limits.append(max_width / max(width, 1e-9))
+    if max_height:
+        limits.append(max_height / max(height, 1e-9))
+    options: Dict[str, Any] = {"format": fmt, "dpi": min(float(dpi), *limits)}
+    if fmt == "png" and compression is not None:
+        options["pil_kwargs"] = {"compress_level": compression}
+    elif fmt == "webp":
+        method = DEFAULT_WEBP_METHOD if compression is None else round(compression * 6 / 9)
+        options["pil_kwargs"] = {"quality": quality or DEFAULT_WEBP_QUALITY, "method": method}
+    return options
+
+
+def _warm_up() -> None:
+    pass
+
+
+def _render_pickled(payload: bytes) -> bytes:
+    """Worker side: render a figure pickled by the caller"""
+    figure, options = pickle.loads(payload)
+    try:
+        return _encode(figure, options)
+    finally:
+        plt.close(figure)
+
+
+def _render_spec(spec: Dict[str, Any]) -> bytes:
+    """Worker side: build a chart from a figure spec with seaborn and render it in its output format"""
+    import pandas as pd
+    import seaborn as sns
+
+    data = pd.DataFrame(spec["data"])
+    missing = [spec[key] for key in ("x", "y", "hue") if spec.get(key) and spec[key] not in data.columns]
+    if missing:
+        raise ValueError(f"Unknown columns {missing}; the data has {list(data.columns)}")
+
+    figure, axes = plt.subplots(figsize=(spec["width"], spec["height"]))
+    try:
+        arguments = {key: spec[key] for key in ("x", "y", "hue") if spec.get(key)}
+        if spec["kind"] == "hist" and spec.get("bins"):
+            arguments["bins"] = spec["bins"]
+        getattr(sns, SPEC_PLOTTERS[spec["kind"]])(data=data, ax=axes, **arguments)
+        if spec.get("title"):
+            axes.set_title(spec["title"])
+        if spec.get("xlabel"):
+            axes.set_xlabel(spec["xlabel"])
+        if spec.get("ylabel"):
+            axes.set_ylabel(spec["ylabel"])
+        output = {key: value for key, value in (spec.get("output") or {}).items() if value is not None}
+        options = savefig_options(figure, **{"dpi": spec["dpi"], **output})
+        return _encode(figure, {**options, "bbox_inches": "tight"})
+    finally:
+        plt.close(figure)
+
+
+class _FigurePickler(pickle.Pickler):
+    """
+    Pickles figures reproducibly. Transforms keep their dependents in a dict keyed by `id()`, so two identical figures
+    (or one figure pickled in two processes) otherwise pickle differently; those keys are replaced by their order of
+    appearance, which `TransformNode` never uses beyond keeping the dict's keys distinct. Pyplot bookkeeping is dropped
+    from figures for the same reason.
+    """
+
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._ids: Dict[int, int] = {}
+
+    def reducer_override(self, obj):
+        if not isinstance(obj, (TransformNode, Figure)):
+            return NotImplemented
+        reduced = obj.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+        state = reduced[2] if len(reduced) > 2 else None
+        if not isinstance(state, dict):
+            return reduced
+        if isinstance(obj, Figure):
+            # The pyplot figure number only identifies the figure in this process; the worker renders it unregistered
+            state = {key: value for key, value in state.items() if key not in ("_number", "_restore_to_pylab")}
+        elif "_parents" in state:
+            parents = {self._ids.setdefault(key, len(self._ids)): value for key, value in state["_parents"].items()}
+            state = {**state, "_parents": parents}
+        return (*reduced[:2], state, *reduced[3:])
+
+
+def _figure_pickle(figure, options: Dict[str, Any]) -> bytes:
+    buffer = io.BytesIO()
+    _FigurePickler(buffer).dump((figure, options))
+    return buffer.getvalue()
+
+
+class ChartRenderPool:
+    """
+    Renders matplotlib figures in dedicated worker processes.
+
+    Rasterizing a figure is CPU-bound and holds the GIL, so rendering it on the shared executor (or the event loop)
+    stalls every other request of the process. Figures are pickled and rendered by `workers` spawned processes running
+    the Agg backend with the seaborn `theme`. At most `max_pending` renders are submitted at once; further callers wait
+    for a slot up to `timeout` seconds and then get `ChartRenderBusyError`. Figures that cannot be pickled are rendered
+    in the calling thread.
+
+    Rendered charts are stored in `cache` under a digest of the pickled figure (its data, styling and the code's
+    effect on it), the render options, the theme and the matplotlib version, so a figure drawn again is not re-rendered.
+    """
+
+    def __init__(
+        self,
+        workers: int = CHART_RENDER_WORKERS,
+        max_pending: int = CHART_MAX_PENDING,
+        timeout: float = CHART_RENDER_TIMEOUT,
+        theme: str = CHART_THEME,
+        cache: ChartCache = chart_cache,
+    ):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+        self.theme = theme
+        self.cache = cache
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._stats = {"rendered": 0, "failed": 0, "busy": 0, "in_process": 0, "render_seconds": 0.0}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.theme,),
+                )
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        # A crashed worker breaks the whole pool; the next render starts a fresh one
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, func: Callable[..., bytes], *args: Any) -> Future:
+        """Submit a render once the caller holds a slot; the slot is released when the render ends"""
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(func, *args)
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        started = time.perf_counter()
+
+        def finished(done: Future) -> None:
+            self._slots.release()
+            with self._lock:
+                if done.cancelled() or done.exception() is not None:
+                    self._stats["failed"] += 1
+                else:
+                    self._stats["rendered"] += 1
+                    self._stats["render_seconds"] += time.perf_counter() - started
+            if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+                self._discard_executor(executor)
+
+        future.add_done_callback(finished)
+        return future
+
+    def _busy(self) -> ChartRenderBusyError:
+        with self._lock:
+            self._stats["busy"] += 1
+        return ChartRenderBusyError(f"All {self.max_pending} chart render slots are busy; retry later")
+
+    def render(self, func: Callable[..., bytes], *args: Any) -> bytes:
+        """Run `func(*args)` in a worker, blocking the calling thread"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise self._busy()
+        return self._submit(func, *args).result(timeout=self.timeout)
+
+    async def render_async(self, func: Callable[..., bytes], *args: Any) -> bytes:
+        """Run `func(*args)` in a worker without blocking the event loop"""
+        if not self._slots.acquire(blocking=False):
+            loop = asyncio.get_event_loop()
+            if not await loop.run_in_executor(None, self._slots.acquire, True, self.timeout):
+                raise self._busy()
+        future = self._submit(func, *args)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+    def _payload(self, figure, options: Dict[str, Any]) -> Optional[bytes]:
+        try:
+            return _figure_pickle(figure, options)
+        except Exception as e:
+            logger.info(f"Rendering an unpicklable figure in process: {type(e).__name__}: {e}")
+            with self._lock:
+                self._stats["in_process"] += 1
+            return None
+
+    def _chart_id(self, content: bytes, fmt: str) -> str:
+        digest = hashlib.sha256(f"{matplotlib.__version__}\0{self.theme}\0".encode("utf-8") + content).hexdigest()
+        return self.cache.chart_id(digest, fmt)
+
+    def _figure_chart_id(self, payload: bytes, options: Dict[str, Any]) -> str:
+        return self._chart_id(payload, str(options.get("format") or plt.rcParams["savefig.format"]))
+
+    def render_figure_cached(self, figure, **options: Any) -> Tuple[Optional[str], bytes]:
+        """
+        Encode a figure like `figure.savefig(buffer, **options)`, in a worker process unless it is cached. Returns the
+        chart id in the cache and the bytes; unpicklable figures are rendered in process, not cached, and get no id.
+        """
+        payload = self._payload(figure, options)
+        if payload is None:
+            return None, _encode(figure, options)
+        chart_id = self._figure_chart_id(payload, options)
+        data = self.cache.read(chart_id)
+        if data is None:
+            data = self.render(_render_pickled, payload)
+            self.cache.put(chart_id, data)
+        return chart_id, data
+
+    def render_figure(self, figure, **options: Any) -> bytes:
+        return self.render_figure_cached(figure, **options)[1]
+
+    async def render_figure_cached_async(self, figure, **options: Any) -> Tuple[Optional[str], bytes]:
+        payload = self._payload(figure, options)
+        loop = asyncio.get_event_loop()
+        if payload is None:
+            return None, await loop.run_in_executor(None, lambda: _encode(figure, options))
+        chart_id = self._figure_chart_id(payload, options)
+        data = await loop.run_in_executor(None, self.cache.read, chart_id)
+        if data is None:
+            data = await self.render_async(_render_pickled, payload)
+            await loop.run_in_executor(None, self.cache.put, chart_id, data)
+        return chart_id, data
+
+    async def render_figure_async(self, figure, **options: Any) -> bytes:
+        return (await self.render_figure_cached_async(figure, **options))[1]
+
+    async def render_spec(self, spec: Dict[str, Any]) -> Tuple[str, bytes, bool]:
+        """Render a figure spec (see `FigureSpec`); returns the chart id, the bytes and whether it was cached"""
+        fmt = (spec.get("output") or {}).get("format") or "png"
+        chart_id = self._chart_id(json.dumps(spec, sort_keys=True, default=str).encode("utf-8"), fmt)
+        loop = asyncio.get_event_loop()
+        data = await loop.run_in_executor(None, self.cache.read, chart_id)
+        if data is not None:
+            return chart_id, data, True
+        data = await self.render_async(_render_spec, spec)
+        await loop.run_in_executor(None, self.cache.put, chart_id, data)
+        return chart_id, data, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rendered = self._stats["rendered"]
+            return {
+                **self._stats,
+                "mean_render_seconds": self._stats["render_seconds"] / rendered if rendered else 0.0,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "cache": self.cache.stats(),
+            }
+
+    def start(self) -> None:
+        """Spawn the worker processes in the background, so that the first chart does not wait for them"""
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(_warm_up)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+chart_pool = ChartRenderPool()
+
+# Figures saved through the chart pool, which never draws them in this process
+saved_figures: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _write_chart(fname, data: bytes) -> None:
+    # Re-saving an unchanged chart to the same path leaves the file alone
+    try:
+        if os.path.getsize(fname) == len(data):
+            with open(fname, "rb") as f:
+                if f.read() == data:
+                    return
+    except OSError:
+        pass
+    with open(fname, "wb") as f:
+        f.write(data)
+
+
+def chart_url(chart_id: str) -> str:
+    """Path of the route serving a cached chart"""
+    return f"{API_V1_STR}/analysis/charts/{chart_id}"
+
+
+@contextlib.contextmanager
+def chart_request(options: Optional[Dict[str, Any]] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Apply chart output options (see `ChartOptions`) to the charts saved by sandboxed code within this context, and
+    collect references to them in the yielded list. The format of a chart saved to a path follows its extension.
+    """
+    state = {"options": {key: value for key, value in (options or {}).items() if value is not None}, "charts": []}
+    token = _chart_request.set(state)
+    try:
+        yield state["charts"]
+    finally:
+        _chart_request.reset(token)
+
+
+def requested_chart_format() -> str:
+    """Chart format asked for by the current request, or matplotlib's default"""
+    state = _chart_request.get()
+    return (state["options"].get("format") if state is not None else None) or plt.rcParams["savefig.format"]
+
+
+def save_figure(figure, fname, **kwargs) -> Dict[str, Any]:
+    """
+    Render a figure in the chart pool to a path or a file object, with the output options of the current request, and
+    return a reference to the chart (see `ChartRef`)
+    """
+    state = _chart_request.get()
+    requested = dict(state["options"]) if state is not None else {}
+    is_path = isinstance(fname, (str, os.PathLike))
+    suffix = os.path.splitext(os.fspath(fname))[1][1:].lower() if is_path else ""
+    requested_format = requested.pop("format", None)
+    fmt = kwargs.get("format") or suffix or requested_format or plt.rcParams["savefig.format"]
+    # Options of the request win over those of the code, which only sees a default
+    output = savefig_options(figure, fmt, **{"dpi": kwargs.get("dpi"), **requested})
+    chart_id, data = chart_pool.render_figure_cached(figure, **{**kwargs, **output})
+    if is_path:
+        _write_chart(fname, data)
+    else:
+        fname.write(data)
+    saved_figures.add(figure)
+    chart = {
+        "path": os.fspath(fname) if is_path else None,
+        "chart_id": chart_id,
+        "url": chart_url(chart_id) if chart_id is not None else None,
+        "format": output["format"],
+        "bytes": len(data),
+    }
+    if state is not None:
+        state["charts"].append(chart)
+    return chart
+
+
+def sandbox_savefig(fname, *args, **kwargs):
+    """`matplotlib.pyplot.savefig` for sandboxed code: the current figure is rendered in the chart pool"""
+    figure = plt.gcf()
+    if args:
+        return figure.savefig(fname, *args, **kwargs)
+    save_figure(figure, fname, **kwargs)
+
+
+register_module_override("matplotlib.pyplot", "savefig", sandbox_savefig)
@@ -0,0 +1,271 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from ..config.settings import UPLOAD_DIR, DATASET_CACHE_MAX_BYTES
+from ..core.interpreter_tool import register_module_override
+from .ingestion import DELIMITED_EXTENSIONS, EXCEL_EXTENSIONS, JSON_EXTENSIONS, arrow_to_pandas, columnar_path
+from .uploads import upload_store
+
+logger = logging.getLogger(__name__)
+
+# The real readers, captured before any sandbox override is installed
+_read_csv = pd.read_csv
+_read_excel = pd.read_excel
+_read_json = pd.read_json
+_read_parquet = pd.read_parquet
+
+UTF8_ENCODINGS = {"utf-8", "utf8", "utf_8"}
+
+
+def _as_path(source: Any) -> Optional[Path]:
+    if isinstance(source, (str, os.PathLike)):
+        return Path(source)
+    return None
+
+
+def _freeze(value: Any) -> Hashable:
+    """Turn read options into a hashable cache-key component; raises TypeError for values that cannot be keyed"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = tuple(_freeze(item) for item in value)
+        return tuple(sorted(items, key=repr)) if isinstance(value, (set, frozenset)) else items
+    if value is None or isinstance(value, (str, bytes, int, float, bool)):
+        return value
+    raise TypeError(f"Cannot use {type(value).__name__} in a dataset cache key")
+
+
+class DatasetCache:
+    """
+    Process-wide LRU cache of DataFrames loaded by sandboxed code from the upload directory.
+
+    Entries are keyed by reader, resolved path, file mtime and size, and the read options, so a changed file or
+    different options never hit a stale entry. Callers always receive a copy (a cheap shallow one when pandas
+    copy-on-write is enabled), so one session cannot mutate the data another session sees. The total size of cached
+    frames, measured with `memory_usage(deep=True)`, is kept under `max_bytes` by evicting least recently used entries.
+    """
+
+    def __init__(self, max_bytes: int = DATASET_CACHE_MAX_BYTES, root: Path = UPLOAD_DIR):
+        self.max_bytes = max_bytes
+        self.root = Path(root).resolve()
+        self._entries: "OrderedDict[Tuple, Tuple[pd.DataFrame, int]]" = OrderedDict()
+        self._loading: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "uncacheable": 0, "bytes_saved": 0}
+
+    def _key(self, reader: str, source: Any, args: tuple, kwargs: dict) -> Optional[Tuple]:
+        path = _as_path(source)
+        if path is None or self.max_bytes <= 0:
+            return None
+        try:
+            resolved = path.resolve()
+            if self.root not in resolved.parents:
+                return None
+            stat = resolved.stat()
+            return (reader, str(resolved), stat.st_mtime_ns, stat.st_size, _freeze(args), _freeze(kwargs))
+        except (OSError, TypeError):
+            return None
+
+    @staticmethod
+    def _copy(frame: pd.DataFrame) -> pd.DataFrame:
+        return frame.copy(deep=not pd.options.mode.copy_on_write)
+
+    def _store(self, key: Tuple, frame: pd.DataFrame) -> None:
+        size = int(frame.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (frame, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def _lookup(self, key: Tuple) -> Optional[pd.DataFrame]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            self._stats["bytes_saved"] += entry[1]
+            return entry[0]
+
+    def read(self, reader: str, source: Any, args: tuple, kwargs: dict, loader: Callable[..., Any]) -> Any:
+        """Return `loader(source, *args, **kwargs)`, served from the cache when the source is a cacheable upload"""
+        key = self._key(reader, source, args, kwargs)
+        if key is None:
+            with self._lock:
+                self._stats["uncacheable"] += 1
+            return loader(source, *args, **kwargs)
+
+        frame = self._lookup(key)
+        if frame is not None:
+            return self._copy(frame)
+
+        # Sessions asking for the same data at the same time share a single load
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        with loading:
+            frame = self._lookup(key)
+            if frame is None:
+                with self._lock:
+                    self._stats["misses"] += 1
+                try:
+                    frame = loader(source, *args, **kwargs)
+                finally:
+                    with self._lock:
+                        self._loading.pop(key, None)
+                if not isinstance(frame, pd.DataFrame):
+                    return frame
+                self._store(key, frame)
+        return self._copy(frame)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit rate, bytes saved and occupancy of the cache"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+dataset_cache = DatasetCache()
+
+
+def find_columnar_copy(source: Any) -> Optional[Path]:
+    """Return the Parquet copy of an uploaded file, if ingestion produced one"""
+    path = _as_path(source)
+    if path is None:
+        return None
+    sha256 = upload_store.content_hash(path)
+    if sha256 is None:
+        return None
+    copy = columnar_path(sha256)
+    return copy if copy.exists() else None
+
+
+def read_columnar(path: Path, columns: Optional[Sequence[str]] = None, nrows: Optional[int] = None) -> pd.DataFrame:
+    """Read a Parquet copy, optionally restricted to some columns and the first `nrows` rows"""
+    parquet_file = pq.ParquetFile(path)
+    if columns is not None:
+        # Like pandas' usecols, keep the file's column order
+        wanted = set(columns)
+        columns = [name for name in parquet_file.schema_arrow.names if name in wanted]
+    if nrows is None:
+        return arrow_to_pandas(parquet_file.read(columns=columns))
+    if nrows <= 0:
+        return arrow_to_pandas(
+            parquet_file.schema_arrow.empty_table().select(columns or parquet_file.schema_arrow.names)
+        )
+    batch = next(parquet_file.iter_batches(batch_size=nrows, columns=columns), None)
+    if batch is None:
+        return arrow_to_pandas(parquet_file.read(columns=columns))
+    return arrow_to_pandas(batch)
+
+
+def _redirectable_columns(copy: Path, usecols: Any) -> Optional[Sequence[str]]:
+    """Validate a usecols argument that the columnar copy can serve; raise LookupError otherwise"""
+    if usecols is None:
+        return None
+    if callable(usecols) or isinstance(usecols, str) or not all(isinstance(c, str) for c in usecols):
+        raise LookupError("usecols form not supported by the columnar copy")
+    names = set(pq.ParquetFile(copy).schema_arrow.names)
+    if not set(usecols) <= names:
+        raise LookupError("unknown columns")
+    return list(usecols)
+
+
+def _load_csv(filepath_or_buffer, *args, **kwargs):
+    """Read a CSV, from the columnar copy of uploads whenever the options allow"""
+    path = _as_path(filepath_or_buffer)
+    copy = find_columnar_copy(path) if not args else None
+    if copy is not None:
+        options = dict(kwargs)
+        separator = options.pop("sep", None)
+        delimiter = options.pop("delimiter", None) or separator
+        encoding = options.pop("encoding", None)
+        options.pop("low_memory", None)
+        usecols = options.pop("usecols", None)
+        nrows = options.pop("nrows", None)
+        if (
+            not options
+            and delimiter in (None, DELIMITED_EXTENSIONS.get(path.suffix.lower()))
+            and (encoding is None or encoding.lower() in UTF8_ENCODINGS)
+        ):
+            try:
+                columns = _redirectable_columns(copy, usecols)
+                return read_columnar(copy, columns=columns, nrows=nrows)
+            except LookupError:
+                pass
+    return _read_csv(filepath_or_buffer, *args, **kwargs)
+
+
+def _load_excel(io, *args, **kwargs):
+    """Read an Excel file; default first-sheet reads of uploads come from the columnar copy"""
+    path = _as_path(io)
+    if not args and not kwargs and path is not None and path.suffix.lower() in EXCEL_EXTENSIONS:
+        copy = find_columnar_copy(path)
+        if copy is not None:
+            return read_columnar(copy)
+    return _read_excel(io, *args, **kwargs)
+
+
+def _load_json(path_or_buf, *args, **kwargs):
+    """Read a JSON file; plain reads of uploads come from the columnar copy"""
+    path = _as_path(path_or_buf)
+    if not args and path is not None and path.suffix.lower() in JSON_EXTENSIONS:
+        # The copy was parsed as JSON lines for .jsonl/.ndjson and as a regular document for .json
+        converted_as_lines = path.suffix.lower() != ".json"
+        if set(kwargs) <= {"lines"} and kwargs.get("lines", False) == converted_as_lines:
+            copy = find_columnar_copy(path)
+            if copy is not None:
+                return read_columnar(copy)
+    return _read_json(path_or_buf, *args, **kwargs)
+
+
+def sandbox_read_csv(filepath_or_buffer, *args, **kwargs):
+    """`pandas.read_csv` for sandboxed code"""
+    return dataset_cache.read("read_csv", filepath_or_buffer, args, kwargs, _load_csv)
+
+
+def sandbox_read_excel(io, *args, **kwargs):
+    """`pandas.read_excel` for sandboxed code"""
+    return dataset_cache.read("read_excel", io, args, kwargs, _load_excel)
+
+
+def sandbox_read_json(path_or_buf, *args, **kwargs):
+    """`pandas.read_json` for sandboxed code"""
+    return dataset_cache.read("read_json", path_or_buf, args, kwargs, _load_json)
+
+
+def sandbox_read_parquet(path, *args, **kwargs):
+    """`pandas.read_parquet` for sandboxed code"""
+    return dataset_cache.read("read_parquet", path, args, kwargs, _read_parquet)
+
+
+register_module_override("pandas", "read_csv", sandbox_read_csv)
+register_module_override("pandas", "read_parquet", sandbox_read_parquet)
+register_module_override("pandas", "read_excel", sandbox_read_excel)
+register_module_override("pandas", "read_json", sandbox_read_json)
@@ -0,0 +1,122 @@
+import os
+import uuid
+import logging
+import threading
+import contextvars
+import weakref
+from typing import Any, Dict, List, Optional
+
+import matplotlib
+import matplotlib.pyplot as plt
+
+from ..config.settings import CHART_AUTOSAVE_ENABLED, CHART_AUTOSAVE_DIR, CHART_LINE_PREFIX
+from ..core.interpreter_tool import register_execution_hook
+from .charts import requested_chart_format, save_figure, saved_figures
+
+logger = logging.getLogger(__name__)
+
+# `figure.hooks` entry through which pyplot reports every figure it creates
+FIGURE_HOOK = f"{__name__}:_track_figure"
+
+_current_manager: contextvars.ContextVar[Optional["FigureManager"]] = contextvars.ContextVar(
+    "figure_manager", default=None
+)
+# Figures drawn in this process, which `savefig` always does
+_drawn_figures: "weakref.WeakSet" = weakref.WeakSet()
+_stats_lock = threading.Lock()
+_stats = {"executions": 0, "created": 0, "autosaved": 0, "autosave_failures": 0, "closed": 0}
+
+
+def _mark_drawn(event) -> None:
+    _drawn_figures.add(event.canvas.figure)
+
+
+def _track_figure(figure) -> None:
+    """Hand a figure created by pyplot to the figure manager of the execution running in this context"""
+    manager = _current_manager.get()
+    if manager is not None:
+        manager.figures.append(figure)
+        figure.canvas.mpl_connect("draw_event", _mark_drawn)
+
+
+def _install_hook() -> None:
+    # Sandboxed code may reset rcParams (e.g. plt.rcdefaults()), so the hook is checked before every execution
+    hooks = matplotlib.rcParams["figure.hooks"]
+    if FIGURE_HOOK not in hooks:
+        matplotlib.rcParams["figure.hooks"] = [*hooks, FIGURE_HOOK]
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class FigureManager:
+    """
+    Lifecycle of the pyplot figures created by one sandbox execution.
+
+    pyplot keeps every figure in a process-wide registry until it is closed, so figures that code forgets to close pile
+    up across executions. Figures created while the manager is active are reported by matplotlib's `figure.hooks`.
+    When the execution ends, those with content that were neither saved nor drawn are saved under `directory` and
+    announced with a `CHART:` line in the print outputs, as the chart protocol asks of the agent, which the python
+    tool returns as its `charts`; then all are closed.
+    """
+
+    def __init__(
+        self, state: Dict[str, Any], directory: str = CHART_AUTOSAVE_DIR, autosave: bool = CHART_AUTOSAVE_ENABLED
+    ):
+        self.state = state
+        self.directory = directory
+        self.autosave = autosave
+        self.figures: List[Any] = []
+        self._token: Optional[contextvars.Token] = None
+
+    def __enter__(self) -> "FigureManager":
+        _install_hook()
+        self._token = _current_manager.set(self)
+        return self
+
+    def _unsaved(self, figure) -> bool:
+        return bool(figure.axes) and figure not in saved_figures and figure not in _drawn_figures
+
+    def _save(self, figure) -> Optional[str]:
+        path = os.path.join(self.directory, f"figure-{uuid.uuid4().hex[:12]}.{requested_chart_format()}")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            save_figure(figure, path)
+            return path
+        except Exception as e:
+            logger.warning(f"Could not save an unsaved figure: {type(e).__name__}: {e}")
+            return None
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        _current_manager.reset(self._token)
+        # Figures of failed executions are closed without saving: they are likely incomplete
+        paths = []
+        if exc_type is None and self.autosave:
+            paths = [self._save(figure) for figure in self.figures if self._unsaved(figure)]
+        for path in paths:
+            if path is not None:
+                self.state["_print_outputs"] += f"{CHART_LINE_PREFIX}{path}\n"
+        for figure in self.figures:
+            plt.close(figure)
+        with _stats_lock:
+            _stats["executions"] += 1
+            _stats["created"] += len(self.figures)
+            _stats["autosaved"] += sum(path is not None for path in paths)
+            _stats["autosave_failures"] += sum(path is None for path in paths)
+            _stats["closed"] += len(self.figures)
+        return False
+
+
+def figure_stats() -> Dict[str, Any]:
+    """Figures handled by the figure managers, figures still open in pyplot, and the resident memory of the process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    return {**stats, "open_figures": len(plt.get_fignums()), "rss_bytes": _rss_bytes()}
+
+
+register_execution_hook(FigureManager)
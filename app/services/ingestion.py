@@ -0,0 +1,170 @@
+import os
+import re
+import uuid
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from pandas._libs.parsers import STR_NA_VALUES
+
+from ..config.settings import COLUMNAR_CONVERSION_ENABLED
+from .uploads import UploadStore, upload_store
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_FILENAME = "data.parquet"
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+MAX_TYPE_RETRIES = 64
+
+# Delimiters used when the columnar copy was written; reads asking for another delimiter are not redirected
+DELIMITED_EXTENSIONS = {".csv": ",", ".tsv": "\t", ".tab": "\t"}
+EXCEL_EXTENSIONS = {".xlsx", ".xls", ".xlsm"}
+JSON_EXTENSIONS = {".json", ".jsonl", ".ndjson"}
+
+_FAILED_COLUMN = re.compile(r"In CSV column #(\d+)")
+
+# pandas' default NA markers; pyarrow's own set differs and would keep blanks in string columns as ""
+NULL_VALUES = sorted(STR_NA_VALUES)
+
+
+def columnar_path(sha256: str, store: Optional[UploadStore] = None) -> Path:
+    """Location of the columnar copy of an upload object"""
+    return (store or upload_store).derived_dir(sha256) / COLUMNAR_FILENAME
+
+
+def is_convertible(filename: str) -> bool:
+    suffix = Path(filename).suffix.lower()
+    return suffix in DELIMITED_EXTENSIONS or suffix in EXCEL_EXTENSIONS or suffix in JSON_EXTENSIONS
+
+
+def arrow_to_pandas(data: Union[pa.Table, pa.RecordBatch]) -> pd.DataFrame:
+    """Convert Arrow data read from a columnar copy the way pandas' readers would type it: missing values are NaN"""
+    frame = data.to_pandas()
+    for position, field in enumerate(data.schema):
+        if pa.types.is_null(field.type):
+            frame.isetitem(position, pd.Series(np.nan, index=frame.index, dtype="float64"))
+        elif frame.dtypes.iloc[position] == object and data.column(position).null_count:
+            column = frame.iloc[:, position]
+            frame.isetitem(position, column.where(column.notna(), np.nan))
+    return frame
+
+
+def _promote(data_type: pa.DataType) -> pa.DataType:
+    """Next wider type to try for a column whose values do not fit the inferred one (mirrors pandas inference)"""
+    if pa.types.is_integer(data_type) or pa.types.is_boolean(data_type):
+        return pa.float64()
+    return pa.string()
+
+
+def _write_delimited(source: Path, destination: Path, delimiter: str) -> Dict[str, Any]:
+    """Stream a delimited text file into Parquet block by block"""
+    parse_options = pa_csv.ParseOptions(delimiter=delimiter)
+    read_options = pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE)
+    column_types: Dict[str, pa.DataType] = {}
+
+    for _ in range(MAX_TYPE_RETRIES):
+        convert_options = pa_csv.ConvertOptions(
+            column_types=column_types,
+            null_values=NULL_VALUES,
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True,
+        )
+        reader = pa_csv.open_csv(
+            source, read_options=read_options, parse_options=parse_options, convert_options=convert_options
+        )
+        schema = reader.schema
+        if len(set(schema.names)) != len(schema.names):
+            raise ValueError("Duplicate column names")
+
+        # pandas keeps dates and times as strings unless asked to parse them
+        temporal = {
+            field.name: pa.string()
+            for field in schema
+            if pa.types.is_temporal(field.type) and field.name not in column_types
+        }
+        if temporal:
+            column_types.update(temporal)
+            continue
+
+        rows = 0
+        try:
+            with pq.ParquetWriter(destination, schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+        except pa.ArrowInvalid as e:
+            match = _FAILED_COLUMN.search(str(e))
+            if not match:
+                raise
+            field = schema.field(int(match.group(1)))
+            column_types[field.name] = _promote(field.type)
+            logger.info(f"Widening column {field.name} of {source.name} to {column_types[field.name]}")
+            continue
+        return {"rows": rows, "columns": len(schema.names)}
+
+    raise ValueError("Could not settle on column types")
+
+
+def _write_frame(frame: pd.DataFrame, destination: Path) -> Dict[str, Any]:
+    frame.columns = [str(column) for column in frame.columns]
+    frame.to_parquet(destination, index=False)
+    return {"rows": len(frame), "columns": len(frame.columns)}
+
+
+def convert_to_columnar(source: Path, filename: str, destination: Path) -> Dict[str, Any]:
+    """
+    Convert a CSV/TSV/Excel/JSON file to Parquet with inferred dtypes.
+
+    Delimited files are streamed through pyarrow's CSV reader, so memory stays bounded by the block size; Excel and
+    JSON files are loaded with pandas first. The Parquet file is written next to `destination` and renamed into place.
+    """
+    suffix = Path(filename).suffix.lower()
+    temp_path = destination.parent / f".{uuid.uuid4().hex}.parquet.tmp"
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if suffix in DELIMITED_EXTENSIONS:
+            try:
+                info = _write_delimited(source, temp_path, DELIMITED_EXTENSIONS[suffix])
+            except (pa.ArrowInvalid, ValueError) as e:
+                logger.info(f"Falling back to pandas for {filename}: {e}")
+                info = _write_frame(pd.read_csv(source, sep=DELIMITED_EXTENSIONS[suffix]), temp_path)
+        elif suffix in EXCEL_EXTENSIONS:
+            info = _write_frame(pd.read_excel(source), temp_path)
+        elif suffix in JSON_EXTENSIONS:
+            info = _write_frame(pd.read_json(source, lines=suffix != ".json"), temp_path)
+        else:
+            raise ValueError(f"Unsupported file type: {suffix}")
+        os.replace(temp_path, destination)
+    finally:
+        if temp_path.exists():
+            os.remove(temp_path)
+    return info
+
+
+def ingest_upload(filename: str, sha256: str, store: Optional[UploadStore] = None) -> Dict[str, Any]:
+    """
+    Ingestion stage run after an upload is stored: build the columnar copy of tabular files.
+
+    The copy is keyed by content hash, so re-uploads of identical content reuse it. Conversion failures are logged and
+    reported but never fail the upload; reads then simply use the original file.
+    """
+    store = store or upload_store
+    if not COLUMNAR_CONVERSION_ENABLED or not is_convertible(filename):
+        return {"columnar": False}
+
+    destination = columnar_path(sha256, store)
+    if destination.exists():
+        return {"columnar": True, "format": "parquet", "cached": True}
+
+    try:
+        info = convert_to_columnar(store.object_path(sha256), filename, destination)
+    except Exception as e:
+        logger.warning(f"Columnar conversion of {filename} failed: {type(e).__name__}: {e}")
+        return {"columnar": False, "error": str(e)}
+    logger.info(f"Converted {filename} to Parquet ({info['rows']} rows, {info['columns']} columns)")
+    return {"columnar": True, "format": "parquet", "cached": False, **info}
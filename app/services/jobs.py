@@ -0,0 +1,293 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiofiles
+import aiofiles.os
+
+from ..config.settings import JOBS_DIR, MAX_CONCURRENT_JOBS, MAX_QUEUED_JOBS, JOB_RETENTION_SECONDS
+from ..core.metrics import QUEUE_DEPTH, QUEUE_REJECTIONS, QUEUE_WAIT_SECONDS, REGISTRY
+from ..core.tracing import current_span, parse_traceparent, span
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = {SUCCEEDED, FAILED, CANCELLED}
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job cannot be accepted because too many jobs are waiting"""
+
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _default_runner() -> Callable[..., Awaitable[Dict[str, Any]]]:
+    # Imported here: the analysis service pulls in the agent stack, which the job store itself does not need
+    from .analysis import get_analysis_service
+
+    return get_analysis_service().process_analysis_request
+
+
+class JobManager:
+    """
+    Runs analyses in the background on a bounded pool of workers.
+
+    Every job is persisted as a JSON file in `directory` on each state change (queued, running, then succeeded, failed
+    or cancelled), so clients can poll for a result after reconnecting. At most `max_workers` jobs run at once and at
+    most `max_queued` wait; further submissions are rejected. Jobs left queued or running by a previous process are
+    marked failed when the store is restored, and finished jobs are deleted `retention` seconds after they end.
+    """
+
+    def __init__(
+        self,
+        directory: Path = JOBS_DIR,
+        max_workers: int = MAX_CONCURRENT_JOBS,
+        max_queued: int = MAX_QUEUED_JOBS,
+        retention: float = JOB_RETENTION_SECONDS,
+        runner: Optional[Callable[..., Awaitable[Dict[str, Any]]]] = None,
+    ):
+        self.directory = Path(directory)
+        self.max_workers = max(1, max_workers)
+        self.max_queued = max(0, max_queued)
+        self.retention = retention
+        self._runner = runner
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def _path(self, job_id: str) -> Path:
+        return self.directory / f"{job_id}.json"
+
+    async def _persist(self, job: Dict[str, Any]) -> None:
+        destination = self._path(job["job_id"])
+        temp_path = destination.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        async with aiofiles.open(temp_path, "w", encoding="utf-8") as f:
+            await f.write(json.dumps(job, default=str))
+        await aiofiles.os.replace(temp_path, destination)
+
+    def restore(self) -> int:
+        """Load persisted jobs, failing the ones interrupted by a restart and deleting expired ones"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        for path in self.directory.glob("*.json"):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable job file {path.name}: {e}")
+                continue
+            if job["status"] in FINISHED_STATES and now - (job.get("finished_at") or now) > self.retention:
+                path.unlink(missing_ok=True)
+                continue
+            if job["status"] not in FINISHED_STATES:
+                job.update(status=FAILED, error="Interrupted by a server restart", finished_at=now)
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(job, f, default=str)
+            self._jobs[job["job_id"]] = job
+        return len(self._jobs)
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.max_workers:
+            self._workers.append(asyncio.create_task(self._work()))
+
+    def _pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if job["status"] == QUEUED)
+
+    def _new_job(self, request: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+        submitter = current_span()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "request": request,
+            "result": None,
+            "error": None,
+            # The job's trace continues the submitting request's
+            "traceparent": submitter.traceparent if submitter else None,
+            **extra,
+        }
+        self._jobs[job["job_id"]] = job
+        return job
+
+    async def _enqueue(self, jobs: List[Dict[str, Any]]) -> None:
+        await aiofiles.os.makedirs(self.directory, exist_ok=True)
+        for job in jobs:
+            await self._persist(job)
+        self._ensure_workers()
+        for job in jobs:
+            self._queue.put_nowait(job["job_id"])
+
+    async def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue an analysis; `request` holds the keyword arguments of `process_analysis_request`"""
+        if self._pending() >= self.max_queued:
+            QUEUE_REJECTIONS.inc(queue="job")
+            raise JobQueueFullError(f"Job queue is full ({self.max_queued} jobs waiting); retry later")
+        job = self._new_job(request)
+        await self._enqueue([job])
+        return job
+
+    async def submit_batch(self, requests: List[Dict[str, Any]]) -> str:
+        """
+        Queue several analyses as one batch and return its id. Items are ordinary jobs spread over the same workers;
+        items without a `thread_id` each get a thread of their own.
+        """
+        if self._pending() + len(requests) > self.max_queued:
+            QUEUE_REJECTIONS.inc(len(requests), queue="job")
+            raise JobQueueFullError(
+                f"Job queue cannot take {len(requests)} more jobs ({self._pending()} of {self.max_queued} waiting)"
+            )
+        batch_id = uuid.uuid4().hex
+        jobs = []
+        for index, request in enumerate(requests):
+            request = {**request, "thread_id": request.get("thread_id") or f"batch-{batch_id}-{index}"}
+            jobs.append(self._new_job(request, batch_id=batch_id, batch_index=index))
+        await self._enqueue(jobs)
+        return batch_id
+
+    async def _work(self) -> None:
+        while True:
+            job = self._jobs.get(await self._queue.get())
+            if job is None or job["status"] != QUEUED:
+                continue
+            job.update(status=RUNNING, started_at=time.time())
+            QUEUE_WAIT_SECONDS.observe(job["started_at"] - job["created_at"], queue="job", outcome="admitted")
+            await self._persist(job)
+
+            task = asyncio.create_task(self._run(job))
+            self._running[job["job_id"]] = task
+            try:
+                job.update(status=SUCCEEDED, result=await task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    # The worker itself is shutting down; the job is failed by the next restore
+                    task.cancel()
+                    raise
+                job.update(status=CANCELLED)
+            except Exception as e:
+                logger.warning(f"Job {job['job_id']} failed: {type(e).__name__}: {e}")
+                job.update(status=FAILED, error=str(e))
+            finally:
+                self._running.pop(job["job_id"], None)
+            job["finished_at"] = time.time()
+            await self._persist(job)
+            await self._prune()
+
+    async def _prune(self) -> None:
+        """Forget finished jobs older than the retention period and delete their files"""
+        cutoff = time.time() - self.retention
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["status"] in FINISHED_STATES and (job.get("finished_at") or cutoff) < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+            try:
+                await aiofiles.os.remove(self._path(job_id))
+            except FileNotFoundError:
+                pass
+
+    async def _run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        if self._runner is None:
+            self._runner = _default_runner()
+        # Workers inherit the context of the request that started them, so the job's parent span is set explicitly
+        with span("job", parent=parse_traceparent(job.get("traceparent")), job_id=job["job_id"]):
+            return await self._runner(**job["request"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._jobs.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a queued or running job; finished jobs are returned unchanged. A running analysis stops at its next agent
+        step: this returns once the LLM call or code execution in progress has completed and the job is cancelled.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] in FINISHED_STATES:
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            # Let the worker record the cancellation
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.sleep(0)
+        else:
+            job.update(status=CANCELLED, finished_at=time.time())
+            await self._persist(job)
+        return job
+
+    def batch_jobs(self, batch_id: str) -> List[Dict[str, Any]]:
+        jobs = [job for job in self._jobs.values() if job.get("batch_id") == batch_id]
+        return sorted(jobs, key=lambda job: job["batch_index"])
+
+    def batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Per-item status and results of a batch, with aggregate timing; None for unknown batches"""
+        jobs = self.batch_jobs(batch_id)
+        if not jobs:
+            return None
+        counts: Dict[str, int] = {}
+        for job in jobs:
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        done = all(job["status"] in FINISHED_STATES for job in jobs)
+        run_times = [
+            job["finished_at"] - job["started_at"] for job in jobs if job["started_at"] and job["finished_at"]
+        ]
+        queue_waits = [job["started_at"] - job["created_at"] for job in jobs if job["started_at"]]
+        end = max(job["finished_at"] for job in jobs) if done else time.time()
+        wall = end - min(job["created_at"] for job in jobs)
+        return {
+            "batch_id": batch_id,
+            "done": done,
+            "counts": counts,
+            "timing": {
+                "wall_seconds": wall,
+                "total_run_seconds": sum(run_times),
+                "mean_run_seconds": sum(run_times) / len(run_times) if run_times else None,
+                "max_run_seconds": max(run_times) if run_times else None,
+                "mean_queue_wait_seconds": sum(queue_waits) / len(queue_waits) if queue_waits else None,
+                # Concurrency actually achieved: item run time per second of batch wall time
+                "parallelism": sum(run_times) / wall if wall > 0 else None,
+            },
+            "items": [{**job, "index": job["batch_index"]} for job in jobs],
+        }
+
+    async def cancel_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        jobs = self.batch_jobs(batch_id)
+        if not jobs:
+            return None
+        # Cancel waiting items first so that workers freed by running ones do not pick them up
+        for job in sorted(jobs, key=lambda job: job["status"] == RUNNING):
+            await self.cancel(job["job_id"])
+        return self.batch(batch_id)
+
+    async def shutdown(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"workers": self.max_workers, "max_queued": self.max_queued, "jobs": counts}
+
+
+job_manager = JobManager()
+REGISTRY.add_collector(lambda: QUEUE_DEPTH.set(job_manager._pending(), queue="job"))
@@ -0,0 +1,169 @@
+import os
+import json
+import uuid
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .ingestion import columnar_path, convert_to_columnar
+from .uploads import UploadStore, upload_store
+
+logger = logging.getLogger(__name__)
+
+MAPPED_DIRNAME = "columns"
+MANIFEST_FILENAME = "manifest.json"
+BUILD_BATCH_ROWS = 1_000_000
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+_build_locks: Dict[str, threading.Lock] = {}
+_build_locks_guard = threading.Lock()
+
+
+def mapped_dir(sha256: str, store: Optional[UploadStore] = None) -> Path:
+    return (store or upload_store).derived_dir(sha256) / MAPPED_DIRNAME
+
+
+def _column_filename(index: int) -> str:
+    return f"{index:05d}.arrow"
+
+
+def build_mapped_columns(sha256: str, filename: str, store: Optional[UploadStore] = None) -> Path:
+    """
+    Write one uncompressed Arrow IPC file per column of an upload, streaming from its Parquet copy.
+
+    Uncompressed IPC files can be memory-mapped and read without deserialization, so readers only fault in the pages
+    of the columns and rows they touch. Returns the directory holding the column files and their manifest.
+    """
+    store = store or upload_store
+    destination = mapped_dir(sha256, store)
+    if destination.exists():
+        return destination
+
+    with _build_locks_guard:
+        lock = _build_locks.setdefault(sha256, threading.Lock())
+    with lock:
+        if destination.exists():
+            return destination
+        source = columnar_path(sha256, store)
+        if not source.exists():
+            convert_to_columnar(store.object_path(sha256), filename, source)
+
+        parquet_file = pq.ParquetFile(source)
+        schema = parquet_file.schema_arrow
+        staging = destination.parent / f".{MAPPED_DIRNAME}.{uuid.uuid4().hex}"
+        staging.mkdir(parents=True)
+        writers = []
+        try:
+            column_schemas = [pa.schema([field]) for field in schema]
+            for index, column_schema in enumerate(column_schemas):
+                sink = pa.OSFile(str(staging / _column_filename(index)), "wb")
+                writers.append((sink, pa.ipc.new_file(sink, column_schema)))
+            rows = 0
+            for batch in parquet_file.iter_batches(batch_size=BUILD_BATCH_ROWS):
+                for index, (_, writer) in enumerate(writers):
+                    writer.write_batch(pa.record_batch([batch.column(index)], schema=column_schemas[index]))
+                rows += batch.num_rows
+            for sink, writer in writers:
+                writer.close()
+                sink.close()
+            with open(staging / MANIFEST_FILENAME, "w", encoding="utf-8") as f:
+                json.dump({"columns": schema.names, "types": [str(t) for t in schema.types], "rows": rows}, f)
+            os.replace(staging, destination)
+        except BaseException:
+            for sink, _ in writers:
+                sink.close()
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+    logger.info(f"Built memory-mapped column files for {filename} ({rows} rows)")
+    return destination
+
+
+class MappedDataset:
+    """
+    Read-only, memory-mapped view of an uploaded table.
+
+    Columns are opened lazily from their own files and never loaded as a whole: selecting columns and row ranges only
+    faults in the pages that back them, so tables larger than memory can be explored piece by piece.
+    """
+
+    def __init__(self, directory: Path, name: str = ""):
+        self.directory = Path(directory)
+        self.name = name
+        with open(self.directory / MANIFEST_FILENAME, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.columns: List[str] = manifest["columns"]
+        self.num_rows: int = manifest["rows"]
+        self._types: List[str] = manifest["types"]
+        self._opened: Dict[int, pa.ChunkedArray] = {}
+
+    @property
+    def shape(self):
+        return (self.num_rows, len(self.columns))
+
+    @property
+    def dtypes(self) -> Dict[str, str]:
+        return dict(zip(self.columns, self._types))
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __repr__(self) -> str:
+        return f"MappedDataset({self.name!r}, rows={self.num_rows}, columns={self.columns})"
+
+    def _column(self, name: str) -> pa.ChunkedArray:
+        try:
+            index = self.columns.index(name)
+        except ValueError:
+            raise KeyError(f"Unknown column {name!r}. Available columns: {self.columns}")
+        if index not in self._opened:
+            source = pa.memory_map(str(self.directory / _column_filename(index)), "r")
+            self._opened[index] = pa.ipc.open_file(source).read_all().column(0)
+        return self._opened[index]
+
+    def _bounds(self, start: int, stop: Optional[int]):
+        start, stop, _ = slice(start, stop).indices(self.num_rows)
+        return start, max(start, stop)
+
+    def read(self, columns: Optional[Sequence[str]] = None, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        """Load the given columns (default: all) for rows `start:stop` into a DataFrame"""
+        columns = list(columns) if columns is not None else self.columns
+        start, stop = self._bounds(start, stop)
+        table = pa.table({name: self._column(name).slice(start, stop - start) for name in columns})
+        frame = table.to_pandas()
+        frame.index = pd.RangeIndex(start, stop)
+        return frame
+
+    def column(self, name: str, start: int = 0, stop: Optional[int] = None) -> pd.Series:
+        """Load rows `start:stop` of one column as a Series"""
+        return self.read([name], start, stop)[name]
+
+    def head(self, n: int = 5, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        return self.read(columns, 0, n)
+
+    def iter_chunks(
+        self, columns: Optional[Sequence[str]] = None, chunk_rows: int = DEFAULT_CHUNK_ROWS
+    ) -> Iterator[pd.DataFrame]:
+        """Yield the selected columns as consecutive DataFrames of at most `chunk_rows` rows"""
+        for start in range(0, self.num_rows, chunk_rows):
+            yield self.read(columns, start, start + chunk_rows)
+
+
+def open_dataset(path: str) -> MappedDataset:
+    """
+    Open an uploaded file as a memory-mapped table without loading it into memory.
+
+    Use `.columns`, `.shape` and `.dtypes` to inspect it, `.read(columns, start, stop)` /
+    `.column(name, start, stop)` to load only the columns and row ranges you need, and
+    `.iter_chunks(columns, chunk_rows)` to stream over it.
+    """
+    sha256 = upload_store.content_hash(path)
+    if sha256 is None:
+        raise ValueError(f"{path} is not an uploaded file; open_dataset only supports files uploaded via /upload")
+    filename = Path(path).name
+    return MappedDataset(build_mapped_columns(sha256, filename), name=filename)
@@ -0,0 +1,249 @@
+import logging
+import functools
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+from matplotlib import cbook
+
+from ..config.settings import (
+    PLOT_MAX_LINE_POINTS, PLOT_MAX_SCATTER_POINTS, PLOT_DOWNSAMPLE_METHOD, PLOT_HEXBIN_GRIDSIZE,
+)
+from ..core.interpreter_tool import register_module_override
+
+logger = logging.getLogger(__name__)
+
+# Keyword arguments of scatter plots that still apply when they are drawn as hexbin density
+DENSITY_KWARGS = ("alpha", "cmap", "label", "zorder", "norm", "vmin", "vmax")
+# Seaborn variables that split a line plot into separate lines
+SEABORN_GROUP_VARIABLES = ("hue", "size", "style", "units")
+
+
+def _as_numeric(values: np.ndarray) -> Optional[np.ndarray]:
+    """Values as float64 for geometry (dates as nanoseconds), or None for non-numeric values"""
+    if values.dtype.kind in "biuf":
+        return values.astype(np.float64, copy=False)
+    if values.dtype.kind in "mM":
+        return values.astype("int64").astype(np.float64)
+    return None
+
+
+def minmax_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Positions of the points kept by min/max decimation: the series is cut into `max_points // 2` buckets of
+    consecutive points and the lowest and highest point of each is kept, so every peak and trough survives.
+    """
+    n = len(y)
+    buckets = max(1, (max_points - 2) // 2)
+    if n <= max_points:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.pad(y, (0, buckets * size - n), mode="edge").reshape(buckets, size)
+    nans = np.isnan(padded)
+    offsets = np.arange(buckets) * size
+    low = np.where(nans, np.inf, padded).argmin(axis=1) + offsets
+    high = np.where(nans, -np.inf, padded).argmax(axis=1) + offsets
+    return np.unique(np.concatenate([[0, n - 1], np.minimum(low, n - 1), np.minimum(high, n - 1)]))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Positions of the points kept by Largest-Triangle-Three-Buckets: one point per bucket, the one forming the largest
+    triangle with the point kept before it and the mean of the next bucket, which preserves the visual shape.
+    """
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        with np.errstate(invalid="ignore"):
+            mean_x, mean_y = x[end:next_end].mean(), np.nanmean(y[end:next_end])
+            area = np.abs(
+                (x[previous] - mean_x) * (y[start:end] - y[previous])
+                - (x[previous] - x[start:end]) * (mean_y - y[previous])
+            )
+        previous = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def downsample_indices(
+    x: np.ndarray, y: np.ndarray, max_points: int, method: str = PLOT_DOWNSAMPLE_METHOD
+) -> Optional[np.ndarray]:
+    """Positions of the points of a line to draw, or None when the line cannot be downsampled"""
+    numeric_y = _as_numeric(y)
+    if numeric_y is None:
+        return None
+    if method == "lttb":
+        numeric_x = _as_numeric(x)
+        if numeric_x is None:
+            numeric_x = np.arange(len(x), dtype=np.float64)
+        return lttb_indices(numeric_x, numeric_y, max_points)
+    return minmax_indices(numeric_y, max_points)
+
+
+def subsample_indices(n: int, size: int) -> np.ndarray:
+    """Deterministic uniform sample of `size` of `n` positions, in order"""
+    return np.sort(np.random.default_rng(0).choice(n, size, replace=False))
+
+
+def _plot_groups(args: Sequence[Any]) -> List[Tuple[Any, ...]]:
+    # Same split as matplotlib: each line is [x], y, [fmt]
+    groups = []
+    while args:
+        group, args = tuple(args[:2]), args[2:]
+        if args and isinstance(args[0], str):
+            group, args = group + (args[0],), args[1:]
+        groups.append(group)
+    return groups
+
+
+def _downsample_plot_args(args: Sequence[Any], max_points: int) -> Tuple[Any, ...]:
+    downsampled: List[Any] = []
+    for group in _plot_groups(args):
+        fmt = group[-1:] if isinstance(group[-1], str) else ()
+        series = group[: len(group) - len(fmt)]
+        if len(series) not in (1, 2) or np.ndim(series[-1]) != 1 or len(series[-1]) <= max_points:
+            downsampled += group
+            continue
+        x, y = cbook.index_of(series[0]) if len(series) == 1 else series
+        x, y = np.asarray(x), np.asarray(y)
+        indices = downsample_indices(x, y, max_points) if x.shape == y.shape else None
+        if indices is None:
+            downsampled += group
+            continue
+        logger.info(f"Downsampled a {len(y)}-point line to {len(indices)} points")
+        downsampled += (x[indices], y[indices], *fmt)
+    return tuple(downsampled)
+
+
+@functools.wraps(plt.plot)
+def sandbox_plot(*args, **kwargs):
+    if PLOT_MAX_LINE_POINTS and "data" not in kwargs:
+        args = _downsample_plot_args(args, PLOT_MAX_LINE_POINTS)
+    return plt.plot(*args, **kwargs)
+
+
+def _per_point(value: Any, n: int) -> bool:
+    return value is not None and not isinstance(value, str) and np.ndim(value) >= 1 and len(value) == n
+
+
+def _binnable(x: np.ndarray, y: np.ndarray) -> bool:
+    return x.dtype.kind in "biuf" and y.dtype.kind in "biuf"
+
+
+def _hexbin(axes, x: np.ndarray, y: np.ndarray, kwargs: Dict[str, Any]):
+    logger.info(f"Drew a {len(x)}-point scatter plot as hexbin density")
+    density = {key: kwargs[key] for key in DENSITY_KWARGS if key in kwargs}
+    return axes.hexbin(x, y, gridsize=PLOT_HEXBIN_GRIDSIZE, bins="log", mincnt=1, **density)
+
+
+@functools.wraps(plt.scatter)
+def sandbox_scatter(x, y, *args, **kwargs):
+    n = np.size(x)
+    if not PLOT_MAX_SCATTER_POINTS or n <= PLOT_MAX_SCATTER_POINTS or args or "data" in kwargs or np.size(y) != n:
+        return plt.scatter(x, y, *args, **kwargs)
+    x, y = np.ravel(x), np.ravel(y)
+    if any(_per_point(kwargs.get(key), n) for key in ("s", "c")) or not _binnable(x, y):
+        # Point sizes or colors carry information a density plot would lose: draw a sample of the points instead
+        indices = subsample_indices(n, PLOT_MAX_SCATTER_POINTS)
+        logger.info(f"Sampled {len(indices)} points of a {n}-point scatter plot")
+        kwargs = {
+            key: np.asarray(value)[indices] if key in ("s", "c") and _per_point(value, n) else value
+            for key, value in kwargs.items()
+        }
+        return plt.scatter(x[indices], y[indices], **kwargs)
+    return _hexbin(plt.gca(), x, y, kwargs)
+
+
+def _seaborn_frame(data: Any, kwargs: Dict[str, Any], variables: Sequence[str]) -> Optional[pd.DataFrame]:
+    """The plotted variables of a seaborn call as one DataFrame named after them, or None if they cannot be resolved"""
+    columns: Dict[str, Any] = {}
+    for variable in variables:
+        value = kwargs.get(variable)
+        if value is None:
+            continue
+        if isinstance(value, str):
+            if not isinstance(data, pd.DataFrame) or value not in data.columns:
+                return None
+            columns[value] = data[value].to_numpy()
+        elif np.ndim(value) == 1:
+            name = getattr(value, "name", None) or variable
+            if name in columns:
+                return None
+            columns[name] = np.asarray(value)
+        else:
+            return None
+    if "x" not in kwargs or "y" not in kwargs or len({len(column) for column in columns.values()}) != 1:
+        return None
+    return pd.DataFrame(columns)
+
+
+def _seaborn_call(data: Any, kwargs: Dict[str, Any], frame: pd.DataFrame) -> Dict[str, Any]:
+    # Point the call at the reduced frame, by column name
+    names = {}
+    for variable in ("x", "y", *SEABORN_GROUP_VARIABLES):
+        value = kwargs.get(variable)
+        if value is not None:
+            names[variable] = value if isinstance(value, str) else getattr(value, "name", None) or variable
+    return {**kwargs, **names, "data": frame}
+
+
+@functools.wraps(sns.lineplot)
+def sandbox_lineplot(data=None, **kwargs):
+    frame = None
+    if PLOT_MAX_LINE_POINTS and kwargs.get("weights") is None:
+        frame = _seaborn_frame(data, kwargs, ("x", "y", *SEABORN_GROUP_VARIABLES))
+    if frame is None or len(frame) <= PLOT_MAX_LINE_POINTS:
+        return sns.lineplot(data=data, **kwargs)
+    call = _seaborn_call(data, kwargs, frame)
+    groups = [call[variable] for variable in SEABORN_GROUP_VARIABLES if kwargs.get(variable) is not None]
+    if frame.duplicated(groups + [call["x"]]).any():
+        # Repeated x values are aggregated by seaborn; thinning them out would change the estimates
+        return sns.lineplot(data=data, **kwargs)
+    if kwargs.get("sort", True):
+        frame = frame.sort_values(call["x"], kind="stable")
+    parts = frame.groupby(groups, sort=False, dropna=False) if groups else [(None, frame)]
+    lines = []
+    for _, line in parts:
+        budget = max(3, PLOT_MAX_LINE_POINTS * len(line) // len(frame))
+        indices = downsample_indices(line[call["x"]].to_numpy(), line[call["y"]].to_numpy(), budget)
+        if indices is None:
+            return sns.lineplot(data=data, **kwargs)
+        lines.append(line.iloc[indices])
+    reduced = pd.concat(lines)
+    logger.info(f"Downsampled a {len(frame)}-point line plot to {len(reduced)} points")
+    return sns.lineplot(**{**call, "data": reduced})
+
+
+@functools.wraps(sns.scatterplot)
+def sandbox_scatterplot(data=None, **kwargs):
+    frame = None
+    if PLOT_MAX_SCATTER_POINTS:
+        frame = _seaborn_frame(data, kwargs, ("x", "y", "hue", "size", "style"))
+    if frame is None or len(frame) <= PLOT_MAX_SCATTER_POINTS:
+        return sns.scatterplot(data=data, **kwargs)
+    call = _seaborn_call(data, kwargs, frame)
+    x, y = frame[call["x"]].to_numpy(), frame[call["y"]].to_numpy()
+    if any(kwargs.get(variable) is not None for variable in ("hue", "size", "style")) or not _binnable(x, y):
+        indices = subsample_indices(len(frame), PLOT_MAX_SCATTER_POINTS)
+        logger.info(f"Sampled {len(indices)} points of a {len(frame)}-point scatter plot")
+        return sns.scatterplot(**{**call, "data": frame.iloc[indices]})
+    axes = kwargs.get("ax") or plt.gca()
+    _hexbin(axes, x, y, kwargs)
+    axes.set_xlabel(call["x"])
+    axes.set_ylabel(call["y"])
+    return axes
+
+
+register_module_override("matplotlib.pyplot", "plot", sandbox_plot)
+register_module_override("matplotlib.pyplot", "scatter", sandbox_scatter)
+register_module_override("seaborn", "lineplot", sandbox_lineplot)
+register_module_override("seaborn", "scatterplot", sandbox_scatterplot)
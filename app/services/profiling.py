@@ -0,0 +1,218 @@
+import os
+import json
+import uuid
+import logging
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from .ingestion import DELIMITED_EXTENSIONS, arrow_to_pandas, columnar_path
+from .uploads import UploadStore, upload_store
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FILENAME = "profile.json"
+PROFILE_CHUNK_ROWS = 250_000
+PROFILE_SAMPLE_ROWS = 5
+PROFILE_TOP_VALUES = 5
+# Distinct values are counted exactly up to this many per column
+MAX_TRACKED_DISTINCT = 10_000
+# Values kept per column for quantile estimation
+QUANTILE_RESERVOIR = 20_000
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class _ColumnProfile:
+    """Accumulates the statistics of one column over successive chunks"""
+
+    def __init__(self, name: str, rng: np.random.Generator):
+        self.name = name
+        self.rng = rng
+        self.dtype: Optional[str] = None
+        self.count = 0
+        self.nulls = 0
+        self.distinct: Optional[Dict[Any, int]] = {}
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.reservoir = np.empty(0)
+        self.reservoir_keys = np.empty(0)
+
+    def update(self, series: pd.Series) -> None:
+        self.dtype = str(series.dtype)
+        self.count += len(series)
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if values.empty:
+            return
+
+        if self.distinct is not None:
+            counts = values.value_counts(sort=False)
+            if len(counts) > MAX_TRACKED_DISTINCT:
+                self.distinct = None
+            else:
+                for value, occurrences in counts.items():
+                    self.distinct[value] = self.distinct.get(value, 0) + int(occurrences)
+                if len(self.distinct) > MAX_TRACKED_DISTINCT:
+                    self.distinct = None
+
+        is_numeric = pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+        if is_numeric or pd.api.types.is_datetime64_any_dtype(values):
+            low, high = values.min(), values.max()
+            self.minimum = low if self.minimum is None else min(self.minimum, low)
+            self.maximum = high if self.maximum is None else max(self.maximum, high)
+        if is_numeric:
+            numbers = values.to_numpy(dtype="float64")
+            self.total += float(numbers.sum())
+            # Keep the values with the smallest random keys: a uniform sample of everything seen so far
+            keys = np.concatenate([self.reservoir_keys, self.rng.random(len(numbers))])
+            pool = np.concatenate([self.reservoir, numbers])
+            if len(pool) > QUANTILE_RESERVOIR:
+                keep = np.argpartition(keys, QUANTILE_RESERVOIR)[:QUANTILE_RESERVOIR]
+                keys, pool = keys[keep], pool[keep]
+            self.reservoir_keys, self.reservoir = keys, pool
+
+    def summary(self) -> Dict[str, Any]:
+        non_null = self.count - self.nulls
+        result: Dict[str, Any] = {
+            "name": self.name,
+            "dtype": self.dtype,
+            "nulls": self.nulls,
+            "distinct": len(self.distinct) if self.distinct is not None else None,
+            "distinct_at_least": MAX_TRACKED_DISTINCT if self.distinct is None else None,
+        }
+        if self.minimum is not None:
+            result["min"] = _to_json(self.minimum)
+            result["max"] = _to_json(self.maximum)
+        if len(self.reservoir):
+            result["mean"] = self.total / non_null
+            result["quantiles"] = {
+                str(q): float(v) for q, v in zip(QUANTILES, np.quantile(self.reservoir, QUANTILES))
+            }
+            result["quantiles_exact"] = non_null <= QUANTILE_RESERVOIR
+        elif self.distinct:
+            top = sorted(self.distinct.items(), key=lambda item: item[1], reverse=True)[:PROFILE_TOP_VALUES]
+            result["top_values"] = [[_to_json(value), count] for value, count in top]
+        return result
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return str(value)
+    return value
+
+
+def _iter_chunks(sha256: str, filename: str, store: UploadStore) -> Iterator[pd.DataFrame]:
+    copy = columnar_path(sha256, store)
+    if copy.exists():
+        # Typed like pd.read_csv, so missing strings count as nulls
+        for batch in pq.ParquetFile(copy).iter_batches(batch_size=PROFILE_CHUNK_ROWS):
+            yield arrow_to_pandas(batch)
+        return
+    delimiter = DELIMITED_EXTENSIONS.get(Path(filename).suffix.lower())
+    if delimiter is None:
+        raise ValueError(f"No chunked reader for {filename}")
+    yield from pd.read_csv(store.object_path(sha256), sep=delimiter, chunksize=PROFILE_CHUNK_ROWS)
+
+
+def compute_profile(sha256: str, filename: str, store: Optional[UploadStore] = None) -> Dict[str, Any]:
+    """
+    Profile a dataset in a single streaming pass over fixed-size chunks.
+
+    Collects the schema, dtypes, null counts, distinct counts (exact up to `MAX_TRACKED_DISTINCT`), min/max, mean,
+    quantiles (from a uniform sample of `QUANTILE_RESERVOIR` values), the most frequent values of non-numeric columns
+    and the first rows.
+    """
+    store = store or upload_store
+    rng = np.random.default_rng(0)
+    columns: Dict[str, _ColumnProfile] = {}
+    sample: List[Dict[str, Any]] = []
+    rows = 0
+    for chunk in _iter_chunks(sha256, filename, store):
+        if not columns:
+            columns = {str(name): _ColumnProfile(str(name), rng) for name in chunk.columns}
+        if len(sample) < PROFILE_SAMPLE_ROWS:
+            head = chunk.head(PROFILE_SAMPLE_ROWS - len(sample))
+            sample.extend(json.loads(head.to_json(orient="records", date_format="iso")))
+        for name, column in zip(columns, chunk.columns):
+            columns[name].update(chunk[column])
+        rows += len(chunk)
+    return {
+        "filename": filename,
+        "sha256": sha256,
+        "rows": rows,
+        "columns": [column.summary() for column in columns.values()],
+        "sample_rows": sample,
+    }
+
+
+def profile_path(sha256: str, store: Optional[UploadStore] = None) -> Path:
+    return (store or upload_store).derived_dir(sha256) / PROFILE_FILENAME
+
+
+def profile_upload(filename: str, sha256: str, store: Optional[UploadStore] = None) -> bool:
+    """Compute and store the profile of an upload unless one exists for its content; returns True when available"""
+    store = store or upload_store
+    destination = profile_path(sha256, store)
+    if destination.exists():
+        return True
+    try:
+        profile = compute_profile(sha256, filename, store)
+    except Exception as e:
+        logger.warning(f"Profiling of {filename} failed: {type(e).__name__}: {e}")
+        return False
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = destination.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, default=str)
+    os.replace(temp_path, destination)
+    return True
+
+
+def load_profile(path, store: Optional[UploadStore] = None) -> Optional[Dict[str, Any]]:
+    """Return the stored profile of an uploaded file, or None if it has none"""
+    store = store or upload_store
+    sha256 = store.content_hash(path)
+    if sha256 is None:
+        return None
+    try:
+        with open(profile_path(sha256, store), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _format_number(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
+
+def format_profile(profile: Dict[str, Any], max_columns: int = 50, max_value_length: int = 40) -> str:
+    """Render a profile as compact text for the agent prompt"""
+    columns = profile["columns"]
+    lines = [f"{profile['rows']} rows x {len(columns)} columns"]
+    for column in columns[:max_columns]:
+        distinct = f"={column['distinct']}" if column["distinct"] is not None else f">{column['distinct_at_least']}"
+        parts = [f"- {column['name']} ({column['dtype']}): nulls={column['nulls']}, distinct{distinct}"]
+        if "min" in column:
+            parts.append(f"min={_format_number(column['min'])}, max={_format_number(column['max'])}")
+        if "quantiles" in column:
+            quantiles = "/".join(_format_number(v) for v in column["quantiles"].values())
+            parts.append(f"mean={_format_number(column['mean'])}, p5/p25/p50/p75/p95={quantiles}")
+        if "top_values" in column:
+            top = ", ".join(f"{str(v)[:max_value_length]} ({n})" for v, n in column["top_values"])
+            parts.append(f"top: {top}")
+        lines.append("; ".join(parts))
+    if len(columns) > max_columns:
+        lines.append(f"- ... {len(columns) - max_columns} more columns")
+    if profile.get("sample_rows"):
+        sample = pd.DataFrame(profile["sample_rows"]).iloc[:, :max_columns]
+        lines.append("First rows:")
+        lines.append(sample.to_string(index=False, max_colwidth=max_value_length))
+    return "\n".join(lines)
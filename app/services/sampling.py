@@ -0,0 +1,101 @@
+import os
+import uuid
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from ..config.settings import SAMPLE_ROWS
+from .aggregation import chunked_value_counts, iter_chunks
+from .datasets import read_columnar
+from .uploads import UploadStore, upload_store
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_DIRNAME = "samples"
+SAMPLE_SEED = 0
+_KEY = "__sample_key"
+_ROW = "__sample_row"
+
+
+def _quotas(path: str, stratify_by: str, rows: int) -> pd.Series:
+    """
+    Rows to draw from each stratum, summing to `rows`: one each, and the rest shared in proportion to the strata's sizes
+    by the largest remainder method
+    """
+    counts = chunked_value_counts(path, stratify_by, dropna=False)
+    if len(counts) > rows:
+        raise ValueError(
+            f"Cannot stratify {rows} rows by {stratify_by!r}: it has {len(counts)} distinct values"
+        )
+    shares = counts * (rows - len(counts)) / counts.sum()
+    quotas = 1 + np.floor(shares).astype("int64")
+    # The rows left by rounding down go to the strata with the largest remainders
+    leftover = rows - int(quotas.sum())
+    remainders = (shares - np.floor(shares)).to_numpy()
+    quotas.iloc[np.argsort(-remainders, kind="stable")[:leftover]] += 1
+    return quotas
+
+
+def draw_sample(path: str, rows: int = SAMPLE_ROWS, stratify_by: Optional[str] = None) -> pd.DataFrame:
+    """
+    Draw a deterministic uniform sample of `rows` rows from a file in one streaming pass.
+
+    Every row gets a pseudo-random key from a fixed seed and the rows with the smallest keys are kept, so the same file
+    always yields the same sample. With `stratify_by`, each value of that column keeps a share of the sample
+    proportional to its frequency (at least one row), the shares adding up to `rows`. Rows keep their original order
+    and positions as index.
+    """
+    rng = np.random.default_rng(SAMPLE_SEED)
+    quotas = _quotas(path, stratify_by, rows) if stratify_by is not None else None
+    sample: Optional[pd.DataFrame] = None
+    offset = 0
+    for chunk in iter_chunks(path):
+        chunk = chunk.assign(**{_KEY: rng.random(len(chunk)), _ROW: np.arange(offset, offset + len(chunk))})
+        offset += len(chunk)
+        pool = chunk if sample is None else pd.concat([sample, chunk], ignore_index=True)
+        if quotas is None:
+            if len(pool) > rows:
+                pool = pool.iloc[np.argpartition(pool[_KEY].to_numpy(), rows)[:rows]]
+        else:
+            rank = pool.groupby(stratify_by, dropna=False, sort=False)[_KEY].rank(method="first")
+            pool = pool[rank.to_numpy() <= pool[stratify_by].map(quotas).to_numpy()]
+        sample = pool
+    if sample is None:
+        raise ValueError(f"{path} has no rows")
+    sample = sample.sort_values(_ROW)
+    sample.index = pd.Index(sample[_ROW].to_numpy(), name=None)
+    return sample.drop(columns=[_KEY, _ROW])
+
+
+def sample_path(sha256: str, rows: int, stratify_by: Optional[str], store: Optional[UploadStore] = None) -> Path:
+    strata = hashlib.sha256(stratify_by.encode("utf-8")).hexdigest()[:16] if stratify_by is not None else "uniform"
+    return (store or upload_store).derived_dir(sha256) / SAMPLES_DIRNAME / f"{rows}-{strata}.parquet"
+
+
+def load_sample(path: str, rows: int = SAMPLE_ROWS, stratify_by: Optional[str] = None) -> pd.DataFrame:
+    """
+    Deterministic random sample of a data file, for exploration only: use it for head/describe/value counts and
+    distribution plots, then compute final figures on the full data. Optionally stratified by a column, so every
+    value of that column keeps its share of the rows. The index holds the original row positions.
+    """
+    sha256 = upload_store.content_hash(path)
+    if sha256 is None:
+        sample = draw_sample(path, rows, stratify_by)
+    else:
+        destination = sample_path(sha256, rows, stratify_by)
+        if destination.exists():
+            sample = read_columnar(destination)
+        else:
+            sample = draw_sample(path, rows, stratify_by)
+            # Samples of uploads are stored next to their other derived files and reused by later sessions
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = destination.with_suffix(f".{uuid.uuid4().hex}.tmp")
+            sample.to_parquet(temp_path)
+            os.replace(temp_path, destination)
+            logger.info(f"Stored a {len(sample)}-row sample of {Path(path).name}")
+    sample.attrs["data_scope"] = "sample"
+    return sample
@@ -0,0 +1,36 @@
+import inspect
+from typing import Callable, Dict, Optional
+
+from .aggregation import AGGREGATION_TOOLS
+from .analytics import ANALYTICS_TOOLS
+from .mmap_store import open_dataset
+from .sampling import load_sample
+
+# Host functions exposed to sandboxed code as static tools, next to BASE_PYTHON_TOOLS
+SANDBOX_TOOLS: Dict[str, Callable] = {
+    "open_dataset": open_dataset,
+    **AGGREGATION_TOOLS,
+    **ANALYTICS_TOOLS,
+    "load_sample": load_sample,
+}
+
+
+def describe_sandbox_tools(tools: Optional[Dict[str, Callable]] = None) -> str:
+    """Render the sandbox tools as a system prompt section, one entry per tool from its signature and docstring"""
+    tools = SANDBOX_TOOLS if tools is None else tools
+    lines = [
+        "",
+        "## 🧰 Built-in Data Tools",
+        "",
+        "These functions are available inside `python_tool` without any import:",
+        "",
+    ]
+    for name, func in tools.items():
+        signature = inspect.signature(func)
+        parameters = [
+            parameter.replace(annotation=inspect.Parameter.empty) for parameter in signature.parameters.values()
+        ]
+        signature = signature.replace(parameters=parameters, return_annotation=inspect.Signature.empty)
+        description = " ".join((inspect.getdoc(func) or "").split())
+        lines.append(f"- `{name}{signature}`: {description}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,175 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+from ..config.settings import (
+    MAX_CONCURRENT_ANALYSES,
+    MAX_QUEUED_ANALYSES,
+    ANALYSIS_QUEUE_TIMEOUT,
+)
+from ..core.metrics import QUEUE_DEPTH, QUEUE_REJECTIONS, QUEUE_WAIT_SECONDS, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerOverloadedError(Exception):
+    """Raised when an analysis request cannot be admitted by the scheduler"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RequestScheduler:
+    """
+    Admission control for analysis requests.
+
+    Requests sharing a `thread_id` run one at a time in arrival order (they would otherwise race on the same
+    checkpoint), and at most `max_concurrent` requests run at once across all threads. Requests that would have to
+    wait are queued up to `max_queued`; beyond that they are rejected immediately instead of timing out later.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_ANALYSES,
+        max_queued: int = MAX_QUEUED_ANALYSES,
+        queue_timeout: Optional[float] = ANALYSIS_QUEUE_TIMEOUT,
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max(0, max_queued)
+        self.queue_timeout = queue_timeout if queue_timeout and queue_timeout > 0 else None
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._thread_locks: Dict[str, asyncio.Lock] = {}
+        self._thread_refs: Dict[str, int] = {}
+        self._queued = 0
+        self._active = 0
+        self._recent_waits = deque(maxlen=1000)
+        self._counters = {
+            "admitted": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "completed": 0,
+            "failed": 0,
+        }
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _retain_thread_lock(self, thread_id: str) -> asyncio.Lock:
+        lock = self._thread_locks.get(thread_id)
+        if lock is None:
+            lock = self._thread_locks[thread_id] = asyncio.Lock()
+        self._thread_refs[thread_id] = self._thread_refs.get(thread_id, 0) + 1
+        return lock
+
+    def _release_thread_lock(self, thread_id: str) -> None:
+        self._thread_refs[thread_id] -= 1
+        if self._thread_refs[thread_id] == 0:
+            del self._thread_refs[thread_id]
+            del self._thread_locks[thread_id]
+
+    def _record_wait(self, wait: float) -> None:
+        self._recent_waits.append(wait)
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+
+    def _remaining(self, started: float) -> Optional[float]:
+        if self.queue_timeout is None:
+            return None
+        return max(0.0, self.queue_timeout - (time.perf_counter() - started))
+
+    async def _acquire(self, primitive, started: float) -> None:
+        if not primitive.locked():
+            # Uncontended acquisition completes without suspending
+            await primitive.acquire()
+            return
+        await asyncio.wait_for(primitive.acquire(), timeout=self._remaining(started))
+
+    @asynccontextmanager
+    async def slot(self, thread_id: str = "default"):
+        """Wait for the thread's turn and a free global slot, then run the body while holding both"""
+        lock = self._thread_locks.get(thread_id)
+        must_wait = self._semaphore.locked() or (lock is not None and lock.locked())
+        if must_wait and self._queued >= self.max_queued:
+            self._counters["rejected"] += 1
+            QUEUE_REJECTIONS.inc(queue="analysis")
+            raise SchedulerOverloadedError(
+                f"Analysis queue is full ({self._queued} waiting, {self._active} running). Retry later."
+            )
+
+        lock = self._retain_thread_lock(thread_id)
+        started = time.perf_counter()
+        self._queued += 1
+        holds_lock = holds_slot = False
+        try:
+            try:
+                # Per-thread FIFO first, so waiting requests of a busy thread don't hold global slots
+                await self._acquire(lock, started)
+                holds_lock = True
+                await self._acquire(self._semaphore, started)
+                holds_slot = True
+            except asyncio.TimeoutError:
+                self._counters["timed_out"] += 1
+                QUEUE_WAIT_SECONDS.observe(time.perf_counter() - started, queue="analysis", outcome="timed_out")
+                raise SchedulerOverloadedError(
+                    f"Analysis request waited more than {self.queue_timeout:g}s in the queue. Retry later.",
+                    retry_after=max(1, int(self.queue_timeout or 1)),
+                )
+            finally:
+                self._queued -= 1
+
+            wait = time.perf_counter() - started
+            self._record_wait(wait)
+            QUEUE_WAIT_SECONDS.observe(wait, queue="analysis", outcome="admitted")
+            self._counters["admitted"] += 1
+            self._active += 1
+            if wait > 1.0:
+                logger.info(f"Analysis request for thread {thread_id} waited {wait:.2f}s in the queue")
+            try:
+                yield wait
+            except BaseException:
+                self._counters["failed"] += 1
+                raise
+            else:
+                self._counters["completed"] += 1
+            finally:
+                self._active -= 1
+        finally:
+            if holds_slot:
+                self._semaphore.release()
+            if holds_lock:
+                lock.release()
+            self._release_thread_lock(thread_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, concurrency and queue-wait statistics"""
+        waits = sorted(self._recent_waits)
+
+        def percentile(q: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(q * len(waits)))]
+
+        admitted = self._counters["admitted"]
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "active": self._active,
+            "queued": self._queued,
+            "busy_threads": len(self._thread_locks),
+            **self._counters,
+            "queue_wait_seconds": {
+                "mean": self._wait_total / admitted if admitted else 0.0,
+                "max": self._wait_max,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+            },
+        }
+
+
+# Shared by every AnalysisService instance of the process
+request_scheduler = RequestScheduler()
+REGISTRY.add_collector(lambda: QUEUE_DEPTH.set(request_scheduler._queued, queue="analysis"))
@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+
+from ..config.settings import UPLOAD_DIR, UPLOAD_STORE_DIR, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE
+from ..core.metrics import UPLOAD_BYTES, UPLOAD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured maximum size"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds the maximum upload size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+def sanitize_filename(filename: Optional[str]) -> str:
+    """Strip directory components from a client-supplied filename"""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if not name or name in (".", ".."):
+        raise ValueError("Uploaded file must have a filename")
+    return name
+
+
+async def stream_upload_to_file(
+    file: UploadFile,
+    destination: Path,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """
+    Stream an upload to `destination` in fixed-size chunks, hashing it on the way.
+
+    The data is written to a temporary file next to the destination and atomically renamed into place once complete,
+    so readers never observe a partially written file. Uploads larger than `max_bytes` are aborted and removed.
+
+    Returns:
+        Dict with the final `path`, the `size` in bytes and the hex `sha256` of the content.
+    """
+    if file.size is not None and file.size > max_bytes:
+        UPLOAD_SECONDS.observe(0.0, outcome="too_large")
+        raise UploadTooLargeError(max_bytes)
+
+    started = time.perf_counter()
+    outcome = "success"
+    destination = Path(destination)
+    temp_path = destination.parent / f".{destination.name}.{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                await out.write(chunk)
+        await aiofiles.os.replace(temp_path, destination)
+    except BaseException as e:
+        outcome = "too_large" if isinstance(e, UploadTooLargeError) else "error"
+        try:
+            await aiofiles.os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    finally:
+        UPLOAD_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+        UPLOAD_BYTES.inc(size, outcome=outcome)
+
+    logger.info(f"Stored upload {destination.name} ({size} bytes)")
+    return {"path": destination, "size": size, "sha256": digest.hexdigest()}
+
+
+class UploadStore:
+    """
+    Content-addressed, deduplicated storage for uploaded files.
+
+    Every distinct content is stored once as an object named by its SHA-256. A catalog maps upload filenames to
+    content hashes and keeps a reference count per object; the file visible under the upload directory is a hard link
+    to the object (or a copy where links are unsupported), so existing paths keep working. Objects whose reference
+    count drops to zero are garbage collected. The content hash is a stable cache key for derived artifacts.
+    """
+
+    def __init__(self, upload_dir: Path = UPLOAD_DIR, store_dir: Path = UPLOAD_STORE_DIR):
+        self.upload_dir = Path(upload_dir)
+        self.store_dir = Path(store_dir)
+        self.objects_dir = self.store_dir / "objects"
+        self.incoming_dir = self.store_dir / "incoming"
+        self.catalog_path = self.store_dir / "catalog.json"
+        self._lock = threading.RLock()
+        self._catalog: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def object_path(self, sha256: str) -> Path:
+        return self.objects_dir / sha256[:2] / sha256
+
+    def derived_dir(self, sha256: str) -> Path:
+        """Directory for artifacts computed from an object; removed together with the object"""
+        return self.store_dir / "derived" / sha256
+
+    def _load_catalog(self) -> Dict[str, Dict[str, Any]]:
+        if self._catalog is None:
+            self.objects_dir.mkdir(parents=True, exist_ok=True)
+            self.incoming_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                with open(self.catalog_path, "r", encoding="utf-8") as f:
+                    self._catalog = json.load(f)
+            except FileNotFoundError:
+                self._catalog = {"files": {}, "objects": {}}
+        return self._catalog
+
+    def _save_catalog(self) -> None:
+        temp_path = self.catalog_path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._catalog, f, indent=1)
+        os.replace(temp_path, self.catalog_path)
+
+    def _materialize(self, sha256: str, filename: str) -> bool:
+        """Expose an object under its upload filename, returning True when a hard link was used"""
+        target = self.upload_dir / filename
+        temp_path = self.upload_dir / f".{filename}.{uuid.uuid4().hex}.link"
+        try:
+            os.link(self.object_path(sha256), temp_path)
+            linked = True
+        except OSError:
+            shutil.copyfile(self.object_path(sha256), temp_path)
+            linked = False
+        os.replace(temp_path, target)
+        return linked
+
+    def _release(self, sha256: str) -> None:
+        objects = self._catalog["objects"]
+        entry = objects.get(sha256)
+        if entry is None:
+            return
+        entry["refcount"] -= 1
+        if entry["refcount"] <= 0:
+            del objects[sha256]
+            try:
+                os.remove(self.object_path(sha256))
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(self.derived_dir(sha256), ignore_errors=True)
+            logger.info(f"Garbage collected upload object {sha256}")
+
+    def add(self, staged_path: Path, filename: str, sha256: str, size: int) -> Dict[str, Any]:
+        """Move a fully written staged file into the store and point `filename` at it"""
+        with self._lock:
+            catalog = self._load_catalog()
+            object_path = self.object_path(sha256)
+            deduplicated = sha256 in catalog["objects"] and object_path.exists()
+            if deduplicated:
+                os.remove(staged_path)
+            else:
+                object_path.parent.mkdir(parents=True, exist_ok=True)
+                os.chmod(staged_path, 0o444)
+                os.replace(staged_path, object_path)
+                # An entry whose object file went missing keeps the references of the filenames still pointing at it
+                catalog["objects"].setdefault(sha256, {"size": size, "refcount": 0})["size"] = size
+
+            previous = catalog["files"].get(filename)
+            catalog["objects"][sha256]["refcount"] += 1
+            linked = self._materialize(sha256, filename)
+            catalog["files"][filename] = {
+                "sha256": sha256,
+                "size": size,
+                "linked": linked,
+                "uploaded_at": time.time(),
+            }
+            if previous is not None:
+                self._release(previous["sha256"])
+            self._save_catalog()
+        return {"sha256": sha256, "size": size, "deduplicated": deduplicated}
+
+    def remove(self, filename: str) -> bool:
+        """Drop a filename from the catalog, garbage collecting its object if nothing else references it"""
+        with self._lock:
+            catalog = self._load_catalog()
+            entry = catalog["files"].pop(filename, None)
+            if entry is None:
+                return False
+            try:
+                os.remove(self.upload_dir / filename)
+            except FileNotFoundError:
+                pass
+            self._release(entry["sha256"])
+            self._save_catalog()
+        return True
+
+    def lookup(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Return the catalog entry of an upload filename, if any"""
+        with self._lock:
+            entry = self._load_catalog()["files"].get(filename)
+            return dict(entry) if entry else None
+
+    def content_hash(self, path) -> Optional[str]:
+        """
+        Return the content hash of a file in the upload directory, or None if it is not managed by the store.
+
+        The hash is only returned while the file still holds the catalogued content, which makes it safe to use as a
+        cache key for data derived from the file.
+        """
+        path = Path(path)
+        if path.parent.resolve() != self.upload_dir.resolve():
+            return None
+        entry = self.lookup(path.name)
+        if entry is None:
+            return None
+        try:
+            if entry.get("linked"):
+                if not os.path.samefile(path, self.object_path(entry["sha256"])):
+                    return None
+            elif os.path.getsize(path) != entry["size"]:
+                return None
+        except OSError:
+            return None
+        return entry["sha256"]
+
+    def collect_garbage(self, staged_max_age: float = 24 * 3600) -> int:
+        """Remove unreferenced objects and abandoned staging files, returning the number of files removed"""
+        removed = 0
+        with self._lock:
+            catalog = self._load_catalog()
+            referenced = set(catalog["objects"])
+            for object_path in self.objects_dir.glob("*/*"):
+                if object_path.name not in referenced:
+                    os.remove(object_path)
+                    removed += 1
+            for derived_path in (self.store_dir / "derived").glob("*"):
+                if derived_path.name not in referenced:
+                    shutil.rmtree(derived_path, ignore_errors=True)
+                    removed += 1
+            cutoff = time.time() - staged_max_age
+            for staged_path in self.incoming_dir.iterdir():
+                if staged_path.stat().st_mtime < cutoff:
+                    os.remove(staged_path)
+                    removed += 1
+        return removed
+
+
+upload_store = UploadStore()
+
+
+async def save_upload(file: UploadFile, store: Optional[UploadStore] = None) -> Dict[str, Any]:
+    """Save an uploaded data file into the content-addressed store, keeping its original filename"""
+    store = store or upload_store
+    filename = sanitize_filename(file.filename)
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, store._load_catalog)
+    staged = await stream_upload_to_file(file, store.incoming_dir / uuid.uuid4().hex)
+    stored = await loop.run_in_executor(
+        None, store.add, staged["path"], filename, staged["sha256"], staged["size"]
+    )
+    return {
+        "filename": filename,
+        "path": str(store.upload_dir / filename),
+        "size": stored["size"],
+        "sha256": stored["sha256"],
+        "deduplicated": stored["deduplicated"],
+    }
+
+
+async def delete_upload(filename: str, store: Optional[UploadStore] = None) -> bool:
+    """Delete an uploaded file by name"""
+    store = store or upload_store
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, store.remove, sanitize_filename(filename))
@@ -0,0 +1,55 @@
+import sys
+import time
+import asyncio
+import logging
+import importlib
+from types import ModuleType
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Service modules whose imports dominate cold start: the agent stack, pandas, matplotlib and seaborn
+HEAVY_SERVICES = ("analysis", "charts", "figures", "ingestion", "profiling", "datasets")
+
+
+async def import_service(name: str) -> ModuleType:
+    """Import a service module on first use in the thread pool, so the event loop never blocks on a heavy import"""
+    module = sys.modules.get(f"{__package__}.{name}")
+    if module is None:
+        loop = asyncio.get_event_loop()
+        module = await loop.run_in_executor(None, importlib.import_module, f".{name}", __package__)
+    return module
+
+
+def _warm_sandbox() -> None:
+    # Imports in the sandbox build read-only copies of the modules once per process
+    from ..config.settings import DEFAULT_AUTHORIZED_IMPORTS
+    from ..core.interpreter_tool import LocalPythonExecutor
+
+    executor = LocalPythonExecutor(DEFAULT_AUTHORIZED_IMPORTS)
+    executor("\n".join(f"import {name}" for name in DEFAULT_AUTHORIZED_IMPORTS))
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Load everything the first analysis would otherwise load: the heavy service modules, the sandbox module copies, the
+    chart worker processes and the shared analysis service. Returns the seconds spent per step; failed steps are
+    logged and skipped, since the request that needs them will retry them.
+    """
+    timings: Dict[str, float] = {}
+
+    def step(name: str, action) -> None:
+        started = time.perf_counter()
+        try:
+            action()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {type(e).__name__}: {e}")
+        timings[name] = time.perf_counter() - started
+
+    for service in HEAVY_SERVICES:
+        step(f"import:{service}", lambda: importlib.import_module(f".{service}", __package__))
+    step("sandbox", _warm_sandbox)
+    step("chart_pool", lambda: importlib.import_module(".charts", __package__).chart_pool.start())
+    step("analysis_service", lambda: importlib.import_module(".analysis", __package__).get_analysis_service())
+    logger.info(f"Warm-up took {sum(timings.values()):.2f}s")
+    return timings
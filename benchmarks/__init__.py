@@ -0,0 +1 @@
+# Init file
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+Sandbox benchmark: vectorized analytics tools vs. the interpreted loops agents write for the same computation.
+
+Runs each computation in the sandbox interpreter (LocalPythonExecutor) on a synthetic sales DataFrame, once as a
+plain-Python loop over column lists and once as a single call of the corresponding tool, and checks that both give the
+same answer.
+
+    python -m benchmarks.bench_analytics_tools --rows 20000
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.config.settings import DEFAULT_AUTHORIZED_IMPORTS
+from app.core.interpreter_tool import LocalPythonExecutor
+from app.services.analytics import ANALYTICS_TOOLS
+
+GROUP_LOOP = """
+totals, counts = {}, {}
+for region, amount in zip(df["region"].tolist(), df["amount"].tolist()):
+    totals[region] = totals.get(region, 0.0) + amount
+    counts[region] = counts.get(region, 0) + 1
+result = {region: (counts[region], totals[region] / counts[region], totals[region]) for region in totals}
+"""
+GROUP_TOOL = """
+summary = group_summary(df, "region", "amount")
+result = {row[0]: (row[1], row[2], row[3]) for row in summary.itertuples(index=False)}
+"""
+
+TOP_LOOP = """
+groups = {}
+for region, amount in zip(df["region"].tolist(), df["amount"].tolist()):
+    groups.setdefault(region, []).append(amount)
+result = {region: sorted(amounts, reverse=True)[:3] for region, amounts in groups.items()}
+"""
+TOP_TOOL = """
+top = top_n_per_group(df, "region", "amount", n=3)
+result = top.groupby("region")["amount"].apply(lambda amounts: sorted(amounts, reverse=True)).to_dict()
+"""
+
+RANK_LOOP = """
+groups = {}
+for i, (region, amount) in enumerate(zip(df["region"].tolist(), df["amount"].tolist())):
+    groups.setdefault(region, []).append((amount, i))
+result = [0] * len(df)
+for rows in groups.values():
+    rows.sort(reverse=True)
+    for position, (amount, i) in enumerate(rows):
+        result[i] = position + 1
+"""
+RANK_TOOL = """
+result = rank_within(df, "region", "amount", method="first").astype(int).tolist()
+"""
+
+PIVOT_LOOP = """
+result = {}
+for region, product, amount in zip(df["region"].tolist(), df["product"].tolist(), df["amount"].tolist()):
+    result[(region, product)] = result.get((region, product), 0.0) + amount
+"""
+PIVOT_TOOL = """
+table = pivot_summary(df, "region", "product", "amount")
+result = {(region, product): value for (region, product), value in table.stack().items() if value != 0}
+"""
+
+CORRELATION_LOOP = """
+columns = ["amount", "quantity", "price", "discount"]
+values = {column: df[column].tolist() for column in columns}
+n = len(df)
+result = {}
+for a in range(len(columns)):
+    for b in range(a + 1, len(columns)):
+        x, y = values[columns[a]], values[columns[b]]
+        mean_x, mean_y = sum(x) / n, sum(y) / n
+        sxy = sxx = syy = 0.0
+        for xi, yi in zip(x, y):
+            dx, dy = xi - mean_x, yi - mean_y
+            sxy += dx * dy
+            sxx += dx * dx
+            syy += dy * dy
+        result[(columns[a], columns[b])] = sxy / (sxx * syy) ** 0.5
+"""
+CORRELATION_TOOL = """
+pairs = top_correlations(df, ["amount", "quantity", "price", "discount"], top=None)
+result = {(row.left, row.right): row.correlation for row in pairs.itertuples()}
+"""
+
+OUTLIER_LOOP = """
+x = df["amount"].tolist()
+n = len(x)
+mean = sum(x) / n
+std = (sum((v - mean) ** 2 for v in x) / (n - 1)) ** 0.5
+result = [i for i, v in enumerate(x) if abs(v - mean) / std > 3]
+"""
+OUTLIER_TOOL = """
+result = find_outliers(df, "amount", method="zscore").index.tolist()
+"""
+
+CASES = [
+    ("group_summary", GROUP_LOOP, GROUP_TOOL),
+    ("top_n_per_group", TOP_LOOP, TOP_TOOL),
+    ("rank_within", RANK_LOOP, RANK_TOOL),
+    ("pivot_summary", PIVOT_LOOP, PIVOT_TOOL),
+    ("top_correlations", CORRELATION_LOOP, CORRELATION_TOOL),
+    ("find_outliers", OUTLIER_LOOP, OUTLIER_TOOL),
+]
+
+
+def make_sales(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    price = rng.uniform(5, 500, rows)
+    quantity = rng.integers(1, 20, rows)
+    discount = np.clip(0.3 - price / 2000 + rng.normal(0, 0.05, rows), 0, None)
+    return pd.DataFrame(
+        {
+            "region": rng.choice([f"region_{i}" for i in range(8)], rows),
+            "product": rng.choice([f"product_{i}" for i in range(20)], rows),
+            "price": price,
+            "quantity": quantity,
+            "discount": discount,
+            "amount": price * quantity * (1 - discount) * rng.lognormal(0, 0.3, rows),
+        }
+    )
+
+
+def same(left, right) -> bool:
+    if isinstance(left, dict):
+        return left.keys() == right.keys() and all(same(left[key], right[key]) for key in left)
+    if isinstance(left, (list, tuple)):
+        return len(left) == len(right) and all(same(a, b) for a, b in zip(left, right))
+    if isinstance(left, (float, np.floating)):
+        return math.isclose(left, right, rel_tol=1e-9, abs_tol=1e-9)
+    return left == right
+
+
+def run(code: str, df: pd.DataFrame):
+    executor = LocalPythonExecutor(DEFAULT_AUTHORIZED_IMPORTS, additional_tools=ANALYTICS_TOOLS)
+    executor.send_variables({"df": df})
+    started = time.perf_counter()
+    executor(code)
+    return time.perf_counter() - started, executor.state["result"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    df = make_sales(args.rows)
+    print(f"{args.rows:,} rows")
+    print(f"{'tool':<18} {'loop s':>9} {'tool s':>9} {'speedup':>9} {'same result':>12}")
+    for name, loop, tool in CASES:
+        loop_seconds, expected = run(loop, df)
+        tool_seconds, result = run(tool, df)
+        print(
+            f"{name:<18} {loop_seconds:>9.3f} {tool_seconds:>9.4f} {loop_seconds / tool_seconds:>8.0f}x "
+            f"{str(same(expected, result)):>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Peak-memory benchmark: chunked aggregation sandbox tools vs. loading the whole file with pandas.
+
+Generates a synthetic CSV, then runs each computation in a fresh process and reports its wall time, its peak resident
+memory above its starting point (sampled from /proc, so Linux only) and how far its result is from the exact pandas
+answer.
+
+    python -m benchmarks.bench_chunked_aggregation --size-mb 500
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.services import aggregation
+from benchmarks.bench_columnar_load import write_csv
+
+
+def _full_groupby(path):
+    return pd.read_csv(path).groupby("region")[["amount"]].agg(["sum", "mean", "count"])
+
+
+def _chunked_groupby(path):
+    return aggregation.chunked_groupby(path, "region", "amount")
+
+
+def _full_distinct(path):
+    return pd.read_csv(path, usecols=["id"])["id"].nunique()
+
+
+def _approx_distinct(path):
+    return aggregation.approx_distinct(path, "id")
+
+
+def _full_quantiles(path):
+    return pd.read_csv(path, usecols=["amount"])["amount"].quantile([0.25, 0.5, 0.75])
+
+
+def _approx_quantiles(path):
+    return aggregation.approx_quantiles(path, "amount")
+
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+SAMPLE_INTERVAL = 0.005
+
+CASES = [
+    ("groupby sum/mean/count", _full_groupby, _chunked_groupby),
+    ("distinct count", _full_distinct, _approx_distinct),
+    ("quartiles", _full_quantiles, _approx_quantiles),
+]
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE / 1024 ** 2
+
+
+def _measure(func, path, queue):
+    # Sample the resident size while the computation runs: ru_maxrss would also count peaks reached during imports
+    baseline = peak = _rss_mb()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(SAMPLE_INTERVAL):
+            peak = max(peak, _rss_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    result = func(path)
+    seconds = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    queue.put((seconds, max(peak, _rss_mb()) - baseline, result))
+
+
+def run_isolated(func, path):
+    """Run `func(path)` in a fresh process; returns (seconds, peak MB above baseline, result)"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(func, path, queue))
+    process.start()
+    measurement = queue.get()
+    process.join()
+    return measurement
+
+
+def relative_error(result, exact) -> float:
+    result, exact = np.asarray(result, dtype="float64"), np.asarray(exact, dtype="float64")
+    return float(np.max(np.abs(result - exact) / np.maximum(np.abs(exact), 1e-12)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = Path(workdir) / f"bench_{args.size_mb}.csv"
+        rows = write_csv(csv_path, args.size_mb)
+        print(f"{args.size_mb}MB CSV, {rows:,} rows")
+        print(f"{'computation':<24} {'pandas s':>9} {'pandas MB':>10} {'chunked s':>10} {'chunked MB':>11} {'rel. error':>11}")
+        for name, full, chunked in CASES:
+            full_seconds, full_mb, exact = run_isolated(full, str(csv_path))
+            chunked_seconds, chunked_mb, result = run_isolated(chunked, str(csv_path))
+            print(
+                f"{name:<24} {full_seconds:>9.2f} {full_mb:>10.0f} {chunked_seconds:>10.2f} {chunked_mb:>11.0f} "
+                f"{relative_error(result, exact):>11.2e}"
+            )
+
+
+if __name__ == "__main__":
+    main()
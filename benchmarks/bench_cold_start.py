@@ -0,0 +1,81 @@
+"""
+Cold-start benchmark: import time of the app and time from process start to the first served requests.
+
+For each run, a fresh interpreter imports `app.main`, then a uvicorn server is started and polled until it answers
+`GET /` (first served request) and a route that needs the data stack (`GET /api/v1/analysis/datasets/cache`, which
+loads pandas on first use). Servers are started with and without WARMUP_ON_STARTUP.
+
+    python -m benchmarks.bench_cold_start --runs 3
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+HEAVY_ROUTE = "/api/v1/analysis/datasets/cache"
+
+
+def import_seconds(module: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return time.perf_counter() - started
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, started: float, timeout: float = 120.0) -> float:
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except OSError:
+            time.sleep(0.02)
+    raise TimeoutError(f"{url} did not answer within {timeout}s")
+
+
+def serve_seconds(warmup: bool):
+    port = free_port()
+    env = {**os.environ, "WARMUP_ON_STARTUP": "true" if warmup else "false"}
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        first = wait_for(f"http://127.0.0.1:{port}/", started)
+        heavy = wait_for(f"http://127.0.0.1:{port}{HEAVY_ROUTE}", started)
+        return first, heavy
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = statistics.median(import_seconds("sys") for _ in range(args.runs))
+    imports = statistics.median(import_seconds("app.main") for _ in range(args.runs))
+    print(f"{'interpreter start':<34} {baseline:>8.2f} s")
+    print(f"{'import app.main':<34} {imports:>8.2f} s")
+    for warmup in (False, True):
+        runs = [serve_seconds(warmup) for _ in range(args.runs)]
+        label = "with warm-up" if warmup else "lazy"
+        print(f"{f'first request ({label})':<34} {statistics.median(run[0] for run in runs):>8.2f} s")
+        print(f"{f'first data request ({label})':<34} {statistics.median(run[1] for run in runs):>8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
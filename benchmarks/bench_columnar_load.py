@@ -0,0 +1,96 @@
+"""
+Load-time benchmark: raw CSV parsing vs. the Parquet copy built at upload time.
+
+Generates a synthetic CSV of each requested size, converts it with the upload ingestion stage, checks that the
+columnar read returns the same frame as `pd.read_csv` and that the upload profile counts the same nulls (missing
+values included), and times the two reads.
+
+    python -m benchmarks.bench_columnar_load --sizes-mb 100 1000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.services.datasets import read_columnar
+from app.services.ingestion import columnar_path, convert_to_columnar
+from app.services.profiling import compute_profile
+from app.services.uploads import UploadStore
+
+ROWS_PER_CHUNK = 200_000
+
+
+def write_csv(path: Path, size_mb: int, seed: int = 0) -> int:
+    """Append synthetic rows to `path` until it reaches `size_mb`; returns the row count"""
+    rng = np.random.default_rng(seed)
+    rows = 0
+    target = size_mb * 1024 * 1024
+    header = True
+    while not path.exists() or path.stat().st_size < target:
+        chunk = pd.DataFrame({
+            "id": np.arange(rows, rows + ROWS_PER_CHUNK),
+            "amount": rng.normal(100, 25, ROWS_PER_CHUNK).round(2),
+            "quantity": rng.integers(1, 50, ROWS_PER_CHUNK),
+            "region": rng.choice(["north", "south", "east", "west"], ROWS_PER_CHUNK),
+            "product": rng.choice([f"sku-{i}" for i in range(500)], ROWS_PER_CHUNK),
+            # Blank cells and NA literals, which pandas reads as missing
+            "channel": rng.choice(["web", "store", "", "NA"], ROWS_PER_CHUNK),
+            "date": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1500, ROWS_PER_CHUNK), unit="D"),
+        })
+        chunk.to_csv(path, mode="a", header=header, index=False)
+        header = False
+        rows += ROWS_PER_CHUNK
+    return rows
+
+
+def best_of(repeats: int, func) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'rows':>11} {'convert s':>10} {'read_csv s':>11} {'parquet s':>10} {'speedup':>8} {'parquet MB':>11}")
+    with tempfile.TemporaryDirectory() as workdir:
+        store = UploadStore(upload_dir=Path(workdir), store_dir=Path(workdir) / "store")
+        for size_mb in args.sizes_mb:
+            csv_path = Path(workdir) / f"bench_{size_mb}.csv"
+            # Stored where the profile of an upload keyed `bench_<size>` reads its copy from
+            parquet_path = columnar_path(f"bench_{size_mb}", store)
+            rows = write_csv(csv_path, size_mb)
+
+            started = time.perf_counter()
+            convert_to_columnar(csv_path, csv_path.name, parquet_path)
+            convert_seconds = time.perf_counter() - started
+
+            expected, actual = pd.read_csv(csv_path), read_columnar(parquet_path)
+            if not actual.equals(expected) or not actual.dtypes.equals(expected.dtypes):
+                raise SystemExit(f"The Parquet copy of {csv_path.name} does not read back like pd.read_csv")
+            profile = compute_profile(f"bench_{size_mb}", csv_path.name, store)
+            if {column["name"]: column["nulls"] for column in profile["columns"]} != expected.isna().sum().to_dict():
+                raise SystemExit(f"The profile of {csv_path.name} does not count the nulls pd.read_csv finds")
+            del expected, actual
+
+            csv_seconds = best_of(args.repeats, lambda: pd.read_csv(csv_path))
+            parquet_seconds = best_of(args.repeats, lambda: read_columnar(parquet_path))
+            print(
+                f"{size_mb:>6}MB {rows:>11,} {convert_seconds:>10.2f} {csv_seconds:>11.2f} {parquet_seconds:>10.2f} "
+                f"{csv_seconds / parquet_seconds:>7.1f}x {parquet_path.stat().st_size / 1024 ** 2:>11.1f}"
+            )
+            csv_path.unlink()
+            parquet_path.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Payload benchmark: full-history vs. delta analysis responses, and how they are encoded.
+
+Builds a synthetic thread of `--turns` ReAct turns and measures, for the full history and for the delta of the last
+turn, the time to serialize an `AnalysisResponse` the classic way (validate, `jsonable_encoder`, `json.dumps`) and
+straight to JSON bytes with pydantic, plus the body size before and after gzip.
+
+    python -m benchmarks.bench_message_payload --turns 10 100 500
+"""
+import argparse
+import gzip
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.models.schemas import AnalysisResponse
+
+TOOL_OUTPUT = "   region  product   amount  quantity\n" + "   north   sku-17   104.25        12\n" * 40
+
+
+def build_thread(turns: int):
+    messages = []
+    for turn in range(turns):
+        messages += [
+            {"role": "human", "content": f"Question {turn}: how did sales evolve per region last quarter?" * 3},
+            {"role": "ai", "content": "Thought: I will load the data and aggregate it by region. " * 10},
+            {"role": "tool", "content": str({"status": "success", "result": TOOL_OUTPUT})},
+            {"role": "ai", "content": f"Answer {turn}: sales grew in every region, led by the north. " * 20},
+        ]
+    return messages
+
+
+def response_payload(messages, offset):
+    return {
+        "result": messages[-1]["content"],
+        "messages": messages[offset:],
+        "message_offset": offset,
+        "total_messages": len(messages),
+    }
+
+
+def best_of(repeats, func):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        body = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    adapter = TypeAdapter(AnalysisResponse)
+    print(f"{'turns':>6} {'mode':>6} {'json.dumps ms':>14} {'pydantic ms':>12} {'bytes':>11} {'gzip bytes':>11}")
+    for turns in args.turns:
+        messages = build_thread(turns)
+        for mode, offset in (("full", 0), ("delta", len(messages) - 4)):
+            payload = response_payload(messages, offset)
+            classic, body = best_of(
+                args.repeats,
+                lambda: json.dumps(jsonable_encoder(AnalysisResponse(**payload))).encode("utf-8"),
+            )
+            direct, _ = best_of(args.repeats, lambda: adapter.dump_json(adapter.validate_python(payload)))
+            print(
+                f"{turns:>6} {mode:>6} {classic * 1000:>14.2f} {direct * 1000:>12.2f} {len(body):>11,} "
+                f"{len(gzip.compress(body, compresslevel=9)):>11,}"
+            )
+
+
+if __name__ == "__main__":
+    main()
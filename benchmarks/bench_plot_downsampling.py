@@ -0,0 +1,65 @@
+"""
+Plot benchmark: drawing large series as-is vs. through the sandbox plotting layer.
+
+For each size, draws a random-walk line with `plt.plot` and a correlated point cloud with `plt.scatter`, both with the
+plain matplotlib functions and with the sandbox ones (min/max and LTTB downsampling for lines, hexbin density for
+scatter plots), and reports the time to plot and encode the figure and the size of the file.
+
+    python -m benchmarks.bench_plot_downsampling --sizes 100000 1000000 10000000 --format png
+"""
+import argparse
+import io
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from app.services import plotting
+
+
+def render(draw, fmt):
+    figure = plt.figure(figsize=(10, 5))
+    started = time.perf_counter()
+    draw()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=fmt, dpi=100)
+    elapsed = time.perf_counter() - started
+    plt.close(figure)
+    return elapsed, len(buffer.getvalue())
+
+
+def lttb_plot(x, y):
+    indices = plotting.lttb_indices(x.astype(np.float64), y, plotting.PLOT_MAX_LINE_POINTS)
+    return plt.plot(x[indices], y[indices])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--format", default="png", choices=["png", "svg", "pdf"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'points':>11} {'chart':>8} {'mode':>8} {'seconds':>9} {'bytes':>12}")
+    for size in args.sizes:
+        x = np.arange(size)
+        y = np.cumsum(rng.standard_normal(size))
+        other = y + rng.standard_normal(size) * size ** 0.5
+        cases = [
+            ("line", "full", lambda: plt.plot(x, y)),
+            ("line", "minmax", lambda: plotting.sandbox_plot(x, y)),
+            ("line", "lttb", lambda: lttb_plot(x, y)),
+            ("scatter", "full", lambda: plt.scatter(y, other, s=1)),
+            ("scatter", "hexbin", lambda: plotting.sandbox_scatter(y, other, s=1)),
+        ]
+        for chart, mode, draw in cases:
+            seconds, size_bytes = render(draw, args.format)
+            print(f"{size:>11,} {chart:>8} {mode:>8} {seconds:>9.2f} {size_bytes:>12,}")
+
+
+if __name__ == "__main__":
+    main()